@@ -1 +1,31 @@
-from .base import KiwiCache
+import sys
+
+if sys.version_info >= (3, 7):
+    import importlib
+
+    # caches are imported on first use, so importing a part of the library does not load the rest
+    _LAZY_ATTRIBUTES = {
+        "AioKeyedKiwiCache": ".aio",
+        "AioKiwiCache": ".aio",
+        "KeyedKiwiCache": ".keyed",
+        "KiwiCache": ".base",
+        "SQLAlchemyResource": ".dbcache",
+    }
+
+    def __getattr__(name):
+        if name not in _LAZY_ATTRIBUTES:
+            raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+        value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+        globals()[name] = value
+        return value
+
+    def __dir__():
+        return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
+
+else:  # Python < 3.7 has no module __getattr__
+    from .base import KiwiCache
+    from .dbcache import SQLAlchemyResource
+    from .keyed import KeyedKiwiCache
+
+    if sys.version_info >= (3, 5):
+        from .aio import AioKeyedKiwiCache, AioKiwiCache
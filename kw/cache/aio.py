@@ -1,92 +1,336 @@
 import asyncio
-from datetime import datetime
-from typing import Any, Dict, ItemsView, KeysView, Optional, ValuesView
+from concurrent.futures import Executor
+from contextlib import contextmanager
+from datetime import timedelta
+import hashlib
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    ItemsView,
+    Iterable,
+    Iterator,
+    KeysView,
+    List,
+    Optional,
+    Tuple,
+    Union,
+    ValuesView,
+)
 
 import aioredis
 import attr
 
-from . import utils
-from .base import BaseKiwiCache, CACHE_RECORD_ATTRIBUTES, CacheRecord, KiwiCache
-from .helpers import CallAttempt, CallAttemptException
+from . import scripts, utils
+from .base import _decode_hash, BaseKiwiCache, CACHE_RECORD_ATTRIBUTES, CacheRecord, encode_cache_record, KiwiCache
+from .helpers import BloomFilter, CallAttempt, CallAttemptException, ReadTimeoutError
+from .keyed import ABSENT, ABSENT_MARKER, KeyedKiwiCache, MISSING
+from .refill import STREAM_PREFIX
+
+
+class AioCircuitOpenError(aioredis.RedisError):
+    """Redis is not called because its circuit breaker is open."""
 
 
 @attr.s
 class AioBaseKiwiCache(BaseKiwiCache):
-    """Helper class for load data from cache using asyncio and aioredis."""
+    """Helper class for load data from cache using asyncio and aioredis.
+
+    Payloads of at least `serialization_threshold` bytes (None by default disables it) are encoded and decoded
+    in `serialization_executor` instead of blocking the event loop, the default executor of the loop by default.
+    The size of a decoded payload is known, the size of an encoded one is estimated by the previous payload
+    or by the size of the data.
+    """
 
     resources_redis = attr.ib(None, type=aioredis.Redis, validator=attr.validators.instance_of(aioredis.Redis))
+    read_redis = attr.ib(
+        factory=list,
+        type=List[aioredis.Redis],
+        validator=attr.validators.deep_iterable(
+            attr.validators.instance_of(aioredis.Redis), attr.validators.instance_of(list)
+        ),
+    )
+    serialization_threshold = attr.ib(
+        None, type=Optional[int], validator=attr.validators.optional(attr.validators.instance_of(int))
+    )
+    _payload_size = attr.ib(0, init=False, type=int, repr=False)
+
+    # class attributes
+    serialization_executor: Optional[Executor] = None
+    _connection_errors = (aioredis.ConnectionClosedError, aioredis.PoolClosedError, asyncio.TimeoutError, OSError)
+    _circuit_open_error = AioCircuitOpenError
 
     async def load_from_cache(self) -> Optional[CacheRecord]:
+        value = await self._load_from_replicas()
+        if value is None:
+            value = await self._load_from_primary()
+        if value is None:
+            return None
+
+        self._payload_size = len(value)
+        return await self._decode_payload(value)
+
+    async def _load_from_primary(self) -> Optional[bytes]:
         try:
-            value = await self.resources_redis.get(self._cache_key)
+            with self._redis_call():
+                return await self.resources_redis.get(self._cache_key)
         except aioredis.RedisError:
             self._process_cache_error("kiwicache.load_failed")
             return None
 
-        if value is None:
-            return None
+    async def _load_payload_if_changed(
+        self, data_hash: Optional[str]
+    ) -> Tuple[Optional[str], Optional[float], Optional[bytes]]:
+        cached_hash, timestamp, value = await self._run_script(
+            scripts.LOAD_IF_CHANGED, [self._cache_key, self._meta_key], [data_hash or "", int(not self.read_redis)]
+        )
+        return _decode_hash(cached_hash), float(timestamp) if timestamp else None, value
 
-        cache_data = self.json.loads(value)
+    async def _decode_payload(self, value: Union[str, bytes]) -> Optional[CacheRecord]:
+        cache_data = await self._run_serialization(len(value), self.json.loads, value)
         if set(cache_data.keys()) != CACHE_RECORD_ATTRIBUTES:
             self._log_warning("kiwicache.malformed_cache_data")
             return None
         return CacheRecord(**cache_data)
 
+    async def _load_from_replicas(self) -> Optional[bytes]:
+        data_hash = self._expected_data_hash
+        for replica in self.read_redis:
+            transaction = replica.multi_exec()
+            transaction.get(self._cache_key)
+            transaction.hget(self._meta_key, "hash", encoding="utf-8")
+            try:
+                with self._redis_call(replica):
+                    value, replica_hash = await transaction.execute()
+            except aioredis.RedisError:
+                self._log_warning("kiwicache.replica_load_failed")
+                continue
+
+            if value is not None and (data_hash is None or replica_hash == data_hash):
+                return value
+            self._log_warning("kiwicache.replica_lagging")
+        return None
+
     async def save_to_cache(self, data: dict) -> None:
         cache_record = CacheRecord(data=data)
+        if self.stream_chunk_size and hasattr(self.json, "iterencode_data"):
+            await self._stream_to_cache(cache_record)
+            return
+
+        cache_ttl = self._get_cache_expiration()
+        expiration = int(cache_ttl.total_seconds())
+        payload, data_hash = await self._encode_payload(cache_record)
         try:
-            await self.resources_redis.set(
-                self._cache_key, self.json.dumps(attr.asdict(cache_record)), expire=int(self._cache_ttl.total_seconds())
-            )
+            if await self._touch_if_unchanged(data_hash, cache_record.timestamp, cache_ttl):
+                self._increment_metric("unchanged")
+                return
+
+            transaction = self.resources_redis.multi_exec()
+            transaction.set(self._cache_key, payload, expire=expiration)
+            transaction.hmset_dict(self._meta_key, timestamp=cache_record.timestamp, hash=data_hash)
+            transaction.expire(self._meta_key, expiration)
+            with self._redis_call():
+                await transaction.execute()
         except aioredis.RedisError:
             self._process_cache_error("kiwicache.save_failed")
         else:
             self._increment_metric("success")
 
-    async def _get_refill_lock(self) -> Optional[bool]:
+    async def _stream_to_cache(self, cache_record: CacheRecord) -> None:
+        """Encode the cache record and send it to redis in chunks, the event loop runs between the chunks."""
+        cache_ttl = self._get_cache_expiration()
+        expiration = int(cache_ttl.total_seconds())
+        data_hash = hashlib.sha1()
+        stream_key = self._stream_key
         try:
-            return bool(
-                await self.resources_redis.set(
-                    self._refill_lock_key,
-                    "locked",
-                    expire=int(self.refill_ttl.total_seconds()),
-                    exist=self.resources_redis.SET_IF_NOT_EXIST,
-                )
+            with self._redis_call():
+                await self.resources_redis.set(stream_key, STREAM_PREFIX, expire=int(self.refill_ttl.total_seconds()))
+            sent_length: Optional[int] = len(STREAM_PREFIX)
+            for chunk in utils.joined_chunks(self.json.iterencode_data(cache_record.data), self.stream_chunk_size):
+                encoded_chunk = chunk.encode("utf-8")
+                data_hash.update(encoded_chunk)
+                sent_length = await self._append_chunk(stream_key, encoded_chunk, sent_length)
+                if sent_length is None:
+                    self._log_warning("kiwicache.stream_interrupted")
+                    return
+
+            if await self._touch_if_unchanged(data_hash.hexdigest(), cache_record.timestamp, cache_ttl):
+                with self._redis_call():
+                    await self.resources_redis.delete(stream_key)
+                self._increment_metric("unchanged")
+                return
+
+            transaction = self.resources_redis.multi_exec()
+            transaction.append(stream_key, ', "timestamp": {}}}'.format(self._dumps_data(cache_record.timestamp)))
+            transaction.rename(stream_key, self._cache_key)
+            transaction.expire(self._cache_key, expiration)
+            transaction.hmset_dict(self._meta_key, timestamp=cache_record.timestamp, hash=data_hash.hexdigest())
+            transaction.expire(self._meta_key, expiration)
+            with self._redis_call():
+                await transaction.execute()
+        except aioredis.RedisError:
+            self._process_cache_error("kiwicache.save_failed")
+        else:
+            self._increment_metric("success")
+
+    async def _append_chunk(self, stream_key: str, chunk: bytes, sent_length: int) -> Optional[int]:
+        pipeline = self.resources_redis.pipeline()
+        pipeline.append(stream_key, chunk)
+        pipeline.expire(stream_key, int(self.refill_ttl.total_seconds()))
+        with self._redis_call():
+            length, _ = await pipeline.execute()
+        return length if length == sent_length + len(chunk) else None
+
+    async def _touch_if_unchanged(self, data_hash: str, timestamp: float, expiration: timedelta) -> bool:
+        return bool(
+            await self._run_script(
+                scripts.TOUCH_IF_UNCHANGED,
+                [self._cache_key, self._meta_key],
+                [data_hash, repr(timestamp), int(expiration.total_seconds() * 1000)],
             )
+        )
+
+    async def _save_and_release_lock(
+        self, payload: Any, data_hash: str, timestamp: float, expiration: timedelta
+    ) -> bool:
+        keys = [self._cache_key, self._meta_key, self._refill_lock_key, self._refill_backoff_key]
+        expiration_ms = int(expiration.total_seconds() * 1000)
+        if await self._run_script(
+            scripts.TOUCH_IF_UNCHANGED, keys, [data_hash, repr(timestamp), expiration_ms, self._lock_token]
+        ):
+            return False
+        await self._run_script(
+            scripts.SAVE_AND_RELEASE_LOCK, keys, [payload, expiration_ms, repr(timestamp), data_hash, self._lock_token]
+        )
+        return True
+
+    async def load_hash_from_cache(self) -> Optional[str]:
+        try:
+            with self._redis_call():
+                data_hash = await self.resources_redis.hget(self._meta_key, "hash", encoding="utf-8")
+        except aioredis.RedisError:
+            self._process_cache_error("kiwicache.load_failed")
+            return None
+        return data_hash
+
+    async def _encode_payload(self, cache_record: CacheRecord) -> Tuple[str, str]:
+        size = self._payload_size
+        if not size and self.serialization_threshold is not None:
+            size = utils.estimate_size(cache_record.data)
+        payload, data_hash = await self._run_serialization(size, encode_cache_record, self._dumps_data, cache_record)
+        self._payload_size = len(payload)
+        return payload, data_hash
+
+    async def _run_serialization(self, size: int, func: Callable[..., Any], *args: Any) -> Any:
+        if self.serialization_threshold is None or size < self.serialization_threshold:
+            return func(*args)
+        return await asyncio.get_event_loop().run_in_executor(self.serialization_executor, func, *args)
+
+    async def _get_refill_lock(self, lock_key: Optional[str] = None) -> Optional[bool]:
+        try:
+            with self._redis_call():
+                return bool(
+                    await self.resources_redis.set(
+                        lock_key or self._refill_lock_key,
+                        self._lock_token,
+                        expire=int(self.refill_ttl.total_seconds()),
+                        exist=self.resources_redis.SET_IF_NOT_EXIST,
+                    )
+                )
         except aioredis.RedisError:
             self._process_cache_error("kiwicache.refill_lock_failed")
             return None
 
+    async def _get_refill_lock_or_timestamp(self, timestamp: float) -> Tuple[Optional[bool], Optional[float]]:
+        try:
+            result = await self._run_script(
+                scripts.ACQUIRE_LOCK_OR_GET_TIMESTAMP,
+                [self._refill_lock_key, self._meta_key, self._refill_backoff_key],
+                [
+                    self._lock_token,
+                    int(self.refill_ttl.total_seconds() * 1000),
+                    repr(timestamp),
+                    repr(utils.get_current_timestamp()),
+                ],
+            )
+        except aioredis.RedisError:
+            self._process_cache_error("kiwicache.refill_lock_failed")
+            return None, None
+        return self._parse_lock_result(result)
+
     async def _wait_for_refill_lock(self) -> Optional[bool]:
         start_timestamp = utils.get_current_timestamp()
-        lock_check_period = 0.5
+        lock_check_period = self.lock_check_period
         while True:
-            has_lock = await self._get_refill_lock()
+            has_lock, timestamp = await self._get_refill_lock_or_timestamp(start_timestamp)
             if has_lock is None or has_lock is True:
                 return has_lock
+            if timestamp is not None and timestamp > start_timestamp:
+                return False
 
             self._log_warning("kiwicache.refill_locked")
             # let the lock owner finish
             lock_check_period = min(lock_check_period * 2, self.refill_ttl.total_seconds())
             await asyncio.sleep(lock_check_period)
 
-            if await self._is_refilled(start_timestamp):
-                return False
-
-    async def _is_refilled(self, timestamp: float) -> bool:
-        cache_record = await self.load_from_cache()
-        return cache_record and cache_record.timestamp > timestamp
-
-    async def _release_refill_lock(self) -> Optional[bool]:
+    async def _release_refill_lock(self, lock_key: Optional[str] = None, reset_backoff: bool = False) -> Optional[bool]:
+        keys = [lock_key or self._refill_lock_key] + ([self._refill_backoff_key] if reset_backoff else [])
         try:
-            return bool(await self.resources_redis.delete(self._refill_lock_key))
+            return bool(await self._run_script(scripts.RELEASE_LOCK, keys, [self._lock_token]))
         except aioredis.RedisError:
             self._process_cache_error("kiwicache.release_lock_failed")
             return None
 
+    async def _renew_refill_lock(self, lock_key: Optional[str] = None) -> Optional[bool]:
+        try:
+            renewed = bool(
+                await self._run_script(
+                    scripts.RENEW_LOCK,
+                    [lock_key or self._refill_lock_key],
+                    [self._lock_token, int(self.refill_ttl.total_seconds() * 1000)],
+                )
+            )
+        except aioredis.RedisError:
+            self._process_cache_error("kiwicache.renew_lock_failed")
+            return None
+
+        if not renewed:
+            self._log_warning("kiwicache.refill_lock_lost")
+        return renewed
+
+    @contextmanager
+    def _refill_lock_heartbeat(self, lock_key: Optional[str] = None) -> Iterator[asyncio.Task]:
+        heartbeat = asyncio.ensure_future(self._renew_refill_lock_periodically(lock_key))
+        try:
+            yield heartbeat
+        finally:
+            heartbeat.cancel()
+
+    async def _renew_refill_lock_periodically(self, lock_key: Optional[str] = None) -> None:
+        while True:
+            await asyncio.sleep(self.refill_ttl.total_seconds() / 3)
+            if await self._renew_refill_lock(lock_key) is False:
+                return
+
+    async def _run_script(self, script: str, keys: List[str], args: List[Any]) -> Any:
+        digest = hashlib.sha1(script.encode("utf-8")).hexdigest()
+        with self._redis_call():
+            try:
+                return await self.resources_redis.evalsha(digest, keys=keys, args=args)
+            except aioredis.ReplyError as e:
+                if not str(e).startswith("NOSCRIPT"):
+                    raise
+                return await self.resources_redis.eval(script, keys=keys, args=args)
+
     async def _prolong_cache_expiration(self) -> None:
+        expiration = int(self._get_cache_expiration().total_seconds())
+        transaction = self.resources_redis.multi_exec()
+        transaction.expire(self._cache_key, expiration)
+        transaction.expire(self._meta_key, expiration)
         try:
-            await self.resources_redis.expire(self._cache_key, timeout=int(self._cache_ttl.total_seconds()))
+            with self._redis_call():
+                await transaction.execute()
         except aioredis.RedisError:
             self._process_cache_error("kiwicache.prolong_expiration_failed")
 
@@ -126,42 +370,122 @@ class AioKiwiCache(AioBaseKiwiCache, KiwiCache):
     async def items(self) -> ItemsView:
         return (await self.get_data()).items()
 
+    async def get_many(self, keys: Iterable[Any], default: Any = None) -> List[Any]:
+        get = (await self.get_data()).get
+        return [get(key, default) for key in keys]
+
     async def get_data(self) -> dict:
         await self.maybe_reload()
-        return self._data
+        return self._get_data()
 
     async def reload(self) -> None:
+        if self._data and self._is_circuit_open():
+            self._prolong_data_expiration()
+            return
+
         successful_reload = await self.reload_from_cache()
         while not successful_reload:
             try:
-                await self.refill_cache()
+                # refilled data are used without loading them back from redis
+                successful_reload = await self.refill_cache() or await self.reload_from_cache()
             except CallAttemptException:
                 self._prolong_data_expiration()
                 raise
 
-            successful_reload = await self.reload_from_cache()
             if self.max_attempts < 0 and not successful_reload:
                 self._prolong_data_expiration()
                 self._log_error("kiwicache.reload_failed")
                 break
 
     async def reload_from_cache(self) -> bool:
+        self._loaded_data_hash = None
         cache_data = await self.load_from_cache()
 
         if not cache_data:
             return False
+        if cache_data.data is self._data:  # the cached data are the local ones
+            self._prolong_data_expiration()
+            return True
 
-        self._data = cache_data.data
-        self._prolong_data_expiration()
+        self._set_data(cache_data.data)
+        self._data_hash = self._loaded_data_hash
         return True
 
+    async def _reload_from_cache(self, data_hash: Optional[str]) -> bool:
+        if self._data and data_hash is not None and data_hash == self._data_hash:
+            self._prolong_data_expiration()
+            return True
+        return await self.reload_from_cache()
+
+    async def load_from_cache(self) -> Optional[CacheRecord]:
+        local_hash = self._data_hash if self._data else None
+        try:
+            data_hash, timestamp, value = await self._load_payload_if_changed(local_hash)
+        except aioredis.RedisError:
+            self._process_cache_error("kiwicache.load_failed")
+            # read replicas can still serve the data while the primary fails
+            self._expected_data_hash = None
+            value = await self._load_from_replicas()
+        else:
+            if local_hash is not None and data_hash == local_hash:
+                self._loaded_data_hash = data_hash
+                return CacheRecord(data=self._data, timestamp=timestamp)
+            if self.read_redis:
+                self._expected_data_hash = data_hash
+                value = await self._load_from_replicas() or await self._load_from_primary()
+            self._loaded_data_hash = data_hash
+
+        if value is None:
+            return None
+        self._payload_size = len(value)
+        return await self._decode_payload(value)
+
     async def maybe_reload(self) -> None:
-        if self.expires_at <= datetime.utcnow() or (not self._data and not self.allow_empty_data):
-            await self.reload()
+        if not self._is_stale():
+            return
+        if self.read_timeout is None:
+            await self._timed_reload()
+        else:
+            await self._wait_for_background_reload()
+
+    async def _timed_reload(self) -> None:
+        start_timestamp = utils.get_current_timestamp()
+        await self.reload()
+        self._reload_cost = utils.get_current_timestamp() - start_timestamp
+
+    async def _wait_for_background_reload(self) -> None:
+        """Wait at most `read_timeout` for the reload task, which is not cancelled by the timeout."""
+        if self._background_reload is None:
+            self._background_reload = asyncio.ensure_future(self._run_background_reload())
+            # errors are processed by the reload, the task is not awaited by anyone after timeouts
+            self._background_reload.add_done_callback(lambda task: task.cancelled() or task.exception())
+        try:
+            await asyncio.wait_for(asyncio.shield(self._background_reload), self.read_timeout.total_seconds())
+        except asyncio.TimeoutError:
+            self._increment_metric("read_timeout")
+            if not self._data:
+                raise ReadTimeoutError("{} data are not loaded within {}".format(self.name, self.read_timeout))
+
+    async def _run_background_reload(self) -> None:
+        try:
+            await self._timed_reload()
+        finally:
+            self._background_reload = None
 
     async def _prolong_cache_expiration(self) -> None:
-        await super()._prolong_cache_expiration()
-        successful_reload = await self.reload_from_cache()
+        expiration = int(self._get_cache_expiration().total_seconds())
+        transaction = self.resources_redis.multi_exec()
+        transaction.expire(self._cache_key, expiration)
+        transaction.expire(self._meta_key, expiration)
+        transaction.hget(self._meta_key, "hash", encoding="utf-8")
+        try:
+            with self._redis_call():
+                cached, _, data_hash = await transaction.execute()
+        except aioredis.RedisError:
+            self._process_cache_error("kiwicache.prolong_expiration_failed")
+            return
+
+        successful_reload = cached and await self._reload_from_cache(data_hash)
         if not successful_reload and self._data:
             await self.save_to_cache(self._data)
 
@@ -171,27 +495,271 @@ class AioKiwiCache(AioBaseKiwiCache, KiwiCache):
         self._log_exception(msg)
         self._call_attempt.countdown()
 
-    async def refill_cache(self) -> None:
+    async def _record_refill_failure(self) -> None:
+        if self.refill_backoff is None:
+            return
+        try:
+            await self._run_script(
+                scripts.RECORD_REFILL_FAILURE, [self._refill_backoff_key], self._backoff_script_args()
+            )
+        except aioredis.RedisError:
+            self._process_cache_error("kiwicache.refill_backoff_failed")
+
+    async def refill_cache(self) -> bool:
         has_lock = await self._wait_for_refill_lock()
         if not has_lock:
             if has_lock is None:
-                # redis error
+                # redis error or backoff
                 self._call_attempt.countdown()
-            return
+            return False
 
+        released = False
         try:
             try:
-                source_data = await self.load_from_source()
+                with self._refill_lock_heartbeat():
+                    source_data = await self.load_from_source()
             except Exception as e:
+                await self._record_refill_failure()
                 await self._process_refill_error("kiwicache.source_exception", e)
-                return
+                return False
 
             if source_data or self.allow_empty_data:
-                await self.save_to_cache(source_data)
-            else:
-                await self._process_refill_error("load_from_source returned empty response!")
+                refilled = await self._save_refilled_data(source_data)
+                # the lock is released by the save
+                released = True
+                return refilled
+            await self._record_refill_failure()
+            await self._process_refill_error("load_from_source returned empty response!")
+            return False
         finally:
-            await self._release_refill_lock()
+            if not released:
+                await self._release_refill_lock()
+
+    async def _save_refilled_data(self, data: dict) -> bool:
+        cache_record = CacheRecord(data=data)
+        if self.stream_chunk_size and hasattr(self.json, "iterencode_data"):
+            await self._stream_to_cache(cache_record)
+            await self._release_refill_lock(reset_backoff=True)
+            return False
+
+        cache_ttl = self._get_cache_expiration()
+        payload, data_hash = await self._encode_payload(cache_record)
+        try:
+            changed = await self._save_and_release_lock(payload, data_hash, cache_record.timestamp, cache_ttl)
+            self._increment_metric("success" if changed else "unchanged")
+        except aioredis.RedisError:
+            self._process_cache_error("kiwicache.save_failed")
+            await self._release_refill_lock(reset_backoff=True)
+            return False
+
+        if self._data and data_hash == self._data_hash:
+            self._prolong_data_expiration()
+            return True
+        refilled_record = await self._decode_payload(payload)
+        if refilled_record is None:
+            return False
+        self._set_data(refilled_record.data)
+        self._data_hash = data_hash
+        return True
 
     async def load_from_source(self) -> dict:
         raise NotImplementedError()
+
+
+@attr.s
+class AioKeyedKiwiCache(AioBaseKiwiCache, KeyedKiwiCache):
+    """Caches items of large resources per key to Redis and to memory using asyncio."""
+
+    async def getitem(self, key: Any) -> Any:
+        items = await self._get_items([key])
+        if key not in items:
+            return self.__missing__(key)
+        return items[key]
+
+    async def get(self, key: Any, default: Any = None) -> Any:
+        return (await self._get_items([key])).get(key, default)
+
+    async def contains(self, key: Any) -> bool:
+        return key in await self._get_items([key])
+
+    async def get_many(self, keys: Iterable[Any], default: Any = None) -> List[Any]:
+        keys = list(keys)
+        items = await self._get_items(keys)
+        return [items.get(key, default) for key in keys]
+
+    async def iter_items(self, count: Optional[int] = None) -> AsyncIterator[Tuple[str, Any]]:
+        cursor = None
+        while cursor != 0:
+            with self._redis_call():
+                cursor, item_keys = await self.resources_redis.scan(
+                    cursor or 0, match=self._item_key_pattern, count=count or self.batch_size
+                )
+                values = await self.resources_redis.mget(*item_keys) if item_keys else []
+            for item_key, value in zip(item_keys, values):
+                if value:
+                    yield self._parse_item_key(item_key), self.json.loads(value)
+
+    async def _get_items(self, keys: Iterable[Any]) -> Dict[Any, Any]:
+        items = {}
+        missing_keys = []
+        for key in keys:
+            value = self._items.get(key, MISSING)
+            if value is MISSING:
+                missing_keys.append(key)
+            elif value is not ABSENT:
+                items[key] = value
+
+        if missing_keys:
+            missing_keys = await self._filter_keys(missing_keys)
+        if missing_keys:
+            items.update(await self.reload_items(missing_keys))
+        return items
+
+    async def _filter_keys(self, keys: List[Any]) -> List[Any]:
+        if self.key_filter_error_rate is None:
+            return keys
+        if self._key_filter_expires_at <= utils.get_current_timestamp():
+            self._key_filter = await self.load_key_filter_from_cache() or await self.refill_key_filter()
+            self._key_filter_expires_at = utils.get_current_timestamp() + self.reload_ttl.total_seconds()
+        if self._key_filter is None:
+            return keys
+        return [key for key in keys if key in self._key_filter]
+
+    async def load_from_source_many(self, keys: List[Any]) -> Dict[Any, Any]:
+        raise NotImplementedError()
+
+    async def load_source_keys(self) -> Iterable[Any]:
+        raise NotImplementedError()
+
+    async def load_key_filter_from_cache(self) -> Optional[BloomFilter]:
+        try:
+            with self._redis_call():
+                value = await self.resources_redis.get(self._key_filter_key)
+        except aioredis.RedisError:
+            self._process_cache_error("kiwicache.load_failed")
+            return None
+
+        if value is None:
+            return None
+        try:
+            return BloomFilter.loads(value)
+        except ValueError:
+            self._log_warning("kiwicache.malformed_cache_data")
+            return None
+
+    async def refill_key_filter(self) -> Optional[BloomFilter]:
+        lock_key = "{}:filter".format(self._refill_lock_key)
+        if not await self._get_refill_lock(lock_key):
+            return None
+
+        try:
+            try:
+                with self._refill_lock_heartbeat(lock_key):
+                    key_filter = BloomFilter.from_keys(await self.load_source_keys(), self.key_filter_error_rate)
+            except Exception as e:
+                self._process_refill_error("kiwicache.source_exception", e)
+                return None
+
+            try:
+                with self._redis_call():
+                    await self.resources_redis.set(
+                        self._key_filter_key,
+                        key_filter.dumps(),
+                        expire=int(self._get_cache_expiration().total_seconds()),
+                    )
+            except aioredis.RedisError:
+                self._process_cache_error("kiwicache.save_failed")
+        finally:
+            await self._release_refill_lock(lock_key)
+        return key_filter
+
+    async def reload_items(self, keys: List[Any]) -> Dict[Any, Any]:
+        items = await self.load_items_from_cache(keys)
+        missing_keys = [key for key in keys if key not in items]
+        if missing_keys:
+            items.update(await self.refill_items(missing_keys))
+
+        for key, value in items.items():
+            self._items.set(key, value, self.reload_ttl)
+        return {key: value for key, value in items.items() if value is not ABSENT}
+
+    async def load_items_from_cache(self, keys: List[Any]) -> Dict[Any, Any]:
+        try:
+            with self._redis_call():
+                values = await self.resources_redis.mget(*[self._item_key(key) for key in keys])
+        except aioredis.RedisError:
+            self._process_cache_error("kiwicache.load_failed")
+            return {}
+
+        return {key: self._decode_item(value) for key, value in zip(keys, values) if value is not None}
+
+    async def save_items_to_cache(self, items: Dict[Any, Any]) -> None:
+        if not items:
+            return
+
+        pipeline = self.resources_redis.pipeline()
+        expire = int(self._get_cache_expiration().total_seconds())
+        for key, value in items.items():
+            if value is ABSENT:
+                pipeline.set(self._item_key(key), ABSENT_MARKER, expire=int(self.reload_ttl.total_seconds()))
+            else:
+                pipeline.set(self._item_key(key), self.json.dumps(value), expire=expire)
+        try:
+            with self._redis_call():
+                await pipeline.execute()
+        except aioredis.RedisError:
+            self._process_cache_error("kiwicache.save_failed")
+        else:
+            self._increment_metric("success")
+
+    async def refill_items(self, keys: List[Any]) -> Dict[Any, Any]:
+        items = {}
+        for batch in utils.chunked(keys, self.batch_size):
+            items.update(await self._refill_batch(batch))
+        return items
+
+    async def _refill_batch(self, keys: List[Any]) -> Dict[Any, Any]:
+        lock_key = self._get_batch_lock_key(keys)
+        has_lock, items = await self._wait_for_batch_lock(keys, lock_key)
+        # the lock owner could not load all of them (it failed or redis is unavailable), so we load the rest
+        keys = [key for key in keys if key not in items]
+        if not keys:
+            return items
+
+        try:
+            try:
+                if has_lock:
+                    with self._refill_lock_heartbeat(lock_key):
+                        source_items = await self.load_from_source_many(keys)
+                else:
+                    source_items = await self.load_from_source_many(keys)
+            except Exception as e:
+                self._process_refill_error("kiwicache.source_exception", e)
+                return items
+
+            source_items = dict(source_items)
+            source_items.update((key, ABSENT) for key in keys if key not in source_items)
+            await self.save_items_to_cache(source_items)
+        finally:
+            if has_lock:
+                await self._release_refill_lock(lock_key)
+
+        items.update(source_items)
+        return items
+
+    async def _wait_for_batch_lock(self, keys: List[Any], lock_key: str) -> Tuple[Optional[bool], Dict[Any, Any]]:
+        items: Dict[Any, Any] = {}
+        lock_check_period = self.lock_check_period
+        while True:
+            has_lock = await self._get_refill_lock(lock_key)
+            if has_lock is None or has_lock is True:
+                return has_lock, items
+
+            self._log_warning("kiwicache.refill_locked")
+            # let the lock owner finish
+            lock_check_period = min(lock_check_period * 2, self.refill_ttl.total_seconds())
+            await asyncio.sleep(lock_check_period)
+
+            items = await self.load_items_from_cache(keys)
+            if len(items) == len(keys):
+                return False, items
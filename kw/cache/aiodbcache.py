@@ -0,0 +1,116 @@
+import asyncio
+from concurrent.futures import Executor
+import threading
+from typing import Any, Dict, List, Optional, Union
+
+import attr
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy.sql.selectable import Select
+
+from .aio import AioKiwiCache
+from .dbcache import select_query
+
+try:
+    from sqlalchemy.ext.asyncio import AsyncEngine
+except ImportError:  # SQLAlchemy < 1.4
+    AsyncEngine = None
+
+ENGINE_TYPES = (Engine,) if AsyncEngine is None else (Engine, AsyncEngine)
+QUEUED_BATCHES = 2
+
+
+@attr.s
+class AioSQLAlchemyResource(AioKiwiCache):
+    """Caches selected columns or an entire table using asyncio.
+
+    Rows are fetched in batches of `batch_size` and the event loop is not blocked by the query.
+    `AsyncEngine` of SQLAlchemy 1.4+ streams the rows, queries of sync engines run in one job of `executor`,
+    the default executor of the loop by default.
+    """
+
+    engine = attr.ib(None, type=Union[Engine, AsyncEngine], validator=attr.validators.instance_of(ENGINE_TYPES))
+    table_name = attr.ib(None, type=str, validator=attr.validators.instance_of(str))
+    key = attr.ib(None, type=str, validator=attr.validators.optional(attr.validators.instance_of(str)))
+    columns = attr.ib(None, type=List[str], validator=attr.validators.optional(attr.validators.instance_of(list)))
+    where = attr.ib(
+        None, type=ColumnElement, validator=attr.validators.optional(attr.validators.instance_of(ColumnElement))
+    )
+    batch_size = attr.ib(1000, type=int, validator=attr.validators.instance_of(int))
+
+    # class attributes
+    executor: Optional[Executor] = None
+
+    @key.validator
+    def mandatory_key_or_columns(self, attribute: attr.Attribute, value: Optional[str]) -> None:
+        """Validator that key or columns is mandatory."""
+        if not value and not self.columns:
+            raise ValueError("One of parameters ('columns' or 'key') must be set.")
+
+    async def load_from_source(self) -> dict:
+        """Load data from database tables.
+
+        ``self.key`` is required parameter.
+        If you do not need key for response, override this method.
+
+        :return: Resource data.
+        """
+        if not self.key:
+            raise ValueError('Parameter "key" is required.')
+
+        query = select_query(self.table_name, self.key, self.columns, self.where)
+        data: Dict[Any, Dict[str, Any]] = {}
+        if AsyncEngine is not None and isinstance(self.engine, AsyncEngine):
+            await self._stream_rows(query, data)
+        else:
+            await self._fetch_rows(query, data)
+        return data
+
+    async def _add_rows(self, rows: List[Dict[str, Any]], data: Dict[Any, Dict[str, Any]]) -> None:
+        for row in rows:
+            data[row[self.key]] = row
+        # let other tasks run between the batches
+        await asyncio.sleep(0)
+
+    async def _stream_rows(self, query: Select, data: Dict[Any, Dict[str, Any]]) -> None:
+        """Stream rows of the query by the async engine in batches."""
+        async with self.engine.connect() as connection:
+            result = await connection.stream(query)
+            async for rows in result.partitions(self.batch_size):
+                await self._add_rows([dict(row._mapping) for row in rows], data)
+
+    async def _fetch_rows(self, query: Select, data: Dict[Any, Dict[str, Any]]) -> None:
+        """Fetch rows of the query by the sync engine in batches in one job of `executor`.
+
+        The cursor is used by one thread only, the batches are passed to the loop through a bounded queue,
+        so the fetching does not run ahead of the loop by more than `QUEUED_BATCHES` batches.
+        """
+        loop = asyncio.get_event_loop()
+        batches: asyncio.Queue = asyncio.Queue(maxsize=QUEUED_BATCHES)
+        stopped = threading.Event()
+        fetching = loop.run_in_executor(self.executor, self._fetch_batches, query, loop, batches, stopped)
+        rows: Optional[List[Dict[str, Any]]] = []
+        try:
+            rows = await batches.get()
+            while rows is not None:
+                await self._add_rows(rows, data)
+                rows = await batches.get()
+        finally:
+            stopped.set()
+            while rows is not None:  # drop the queued batches, so the fetching is not blocked by the full queue
+                rows = await batches.get()
+            await fetching
+
+    def _fetch_batches(
+        self, query: Select, loop: asyncio.AbstractEventLoop, batches: asyncio.Queue, stopped: threading.Event
+    ) -> None:
+        """Execute the query by the sync engine and put batches of its rows to the queue, None after the last one."""
+        try:
+            with self.engine.connect() as connection:
+                result = connection.execution_options(stream_results=True).execute(query)
+                rows = result.fetchmany(self.batch_size)
+                while rows and not stopped.is_set():
+                    asyncio.run_coroutine_threadsafe(batches.put([dict(row) for row in rows]), loop).result()
+                    rows = result.fetchmany(self.batch_size)
+        finally:
+            asyncio.run_coroutine_threadsafe(batches.put(None), loop).result()
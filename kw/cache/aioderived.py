@@ -0,0 +1,34 @@
+from typing import Any, Callable
+
+import attr
+
+from .aio import AioKiwiCache
+from .derived import DerivedCache
+
+
+@attr.s
+class AioDerivedCache(DerivedCache):
+    """Structure derived from data of base `AioKiwiCache` caches, recomputed only when their data change.
+
+    For attributes see `DerivedCache` docs.
+    """
+
+    async def __call__(self) -> Any:
+        """Get the derived structure, it is recomputed once when any of the base caches has new data."""
+        for cache in self.caches:
+            await cache.maybe_reload()
+        # no other task runs between reading of the generations and the data
+        generations = tuple(cache.generation for cache in self.caches)
+        if generations != self._generations:
+            self._value = self.transform(*[cache._get_data() for cache in self.caches])
+            self._generations = generations
+        return self._value
+
+
+def aio_derived(*caches: AioKiwiCache) -> Callable[[Callable[..., Any]], AioDerivedCache]:
+    """Decorate a transform of data of the aio caches to get its `AioDerivedCache`."""
+
+    def decorator(transform: Callable[..., Any]) -> AioDerivedCache:
+        return AioDerivedCache(caches, transform)
+
+    return decorator
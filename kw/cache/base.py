@@ -1,14 +1,30 @@
 from datetime import datetime, timedelta
+from functools import partial
+import hashlib
+import importlib
+import math
+import random
 import sys
-import time
-from typing import Dict, Optional  # pylint: disable=unused-import
+import threading
+from typing import Any, Callable, ContextManager, Dict, Iterable, List, Optional, Tuple  # pylint: disable=unused-import
+import uuid
 
 import attr
 import redis
-import structlog
 
-from . import json, utils  # pylint: disable=unused-import
-from .helpers import CallAttempt, CallAttemptException, ReadOnlyDictMixin
+from . import scripts, utils
+from .helpers import (
+    BackgroundCall,
+    CallAttempt,
+    CallAttemptException,
+    CircuitOpenError,
+    CONNECTION_ERRORS,
+    get_circuit_breaker,
+    ReadOnlyDictMixin,
+    ReadTimeoutError,
+)
+from .memory import MemoryBudget  # pylint: disable=unused-import
+from .refill import RefillMixin
 
 if sys.version_info >= (3, 0):
     from collections import UserDict
@@ -16,6 +32,7 @@ else:  # for Python 2
     from UserDict import IterableUserDict as UserDict  # pylint: disable=import-error
 
 CACHE_RECORD_ATTRIBUTES = {"data", "timestamp"}
+_monotonic = utils.monotonic  # module global for the read fast path
 
 
 @attr.s
@@ -29,8 +46,31 @@ class CacheRecord(object):
         self.timestamp = self.timestamp if self.timestamp else utils.get_current_timestamp()
 
 
+def encode_cache_record(dumps_data, cache_record):
+    # type: (Callable[[Any], str], CacheRecord) -> Tuple[str, str]
+    """Encode the cache record and return it with the hash of its encoded data.
+
+    The data are encoded only once, so the envelope of the record is composed manually.
+    Defined on module level so it can be sent to other processes.
+    """
+    data = dumps_data(cache_record.data)
+    payload = '{{"data": {}, "timestamp": {}}}'.format(data, dumps_data(cache_record.timestamp))
+    return payload, hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+def dumps_asdict(dumps, data):
+    # type: (Callable[[Any], str], Any) -> str
+    """Encode data converted by `attr.asdict` first, for json modules without `dumps_data`."""
+    return dumps(attr.asdict(CacheRecord(data=data))["data"])
+
+
+def _decode_hash(data_hash):
+    # type: (Optional[bytes]) -> Optional[str]
+    return data_hash.decode("utf-8") if isinstance(data_hash, bytes) else data_hash
+
+
 @attr.s
-class BaseKiwiCache(object):
+class BaseKiwiCache(RefillMixin):
     """Helper class for load data from cache.
 
     Base instance attributes:
@@ -38,11 +78,18 @@ class BaseKiwiCache(object):
     - `cache_ttl` - timedelta for redis (cache) key expiration time
     - `refill_ttl` - timedelta for lock key expiration time
     - `metric` - str value of datadog metric
+    - `cache_ttl_jitter` - fraction of `cache_ttl` by which the redis key expiration is randomly shortened
+    - `read_redis` - clients of read replicas tried in order for loading of data, e.g. the local one first
+    - `stream_chunk_size` - the data bundle is encoded and sent to redis in chunks of this size (None sends it at once)
+    - `_lock_token` - token identifying refill locks owned by this instance
 
     Base class attributes:
     - `logger` - logger instance
     - `statsd` - datadog client instance
     - `json` - module for json related processing
+    - `lock_check_period` - initial period of checking the refill lock in seconds, doubled with each check
+    - `_connection_errors` and `_circuit_open_error` - connection errors of the redis client and the error
+      of its open circuit breaker
 
     Method which can be typically overridden by subclasses:
     - `_key_suffix`
@@ -54,11 +101,29 @@ class BaseKiwiCache(object):
     )
     refill_ttl = attr.ib(timedelta(seconds=5), type=timedelta, validator=attr.validators.instance_of(timedelta))
     metric = attr.ib("kiwicache", type=str, validator=attr.validators.instance_of(str))
+    cache_ttl_jitter = attr.ib(
+        0.0, type=float, validator=[attr.validators.instance_of((int, float)), utils.fraction_validator]
+    )
+    read_redis = attr.ib(
+        factory=list,
+        type=List[redis.StrictRedis],
+        validator=attr.validators.deep_iterable(
+            attr.validators.instance_of(redis.StrictRedis), attr.validators.instance_of(list)
+        ),
+    )
+    stream_chunk_size = attr.ib(
+        None, type=Optional[int], validator=attr.validators.optional(attr.validators.instance_of(int))
+    )
+    _expected_data_hash = attr.ib(None, init=False, type=str, repr=False)
+    _lock_token = attr.ib(init=False, factory=lambda: uuid.uuid4().hex, type=str, repr=False)
 
     # class attributes
-    logger = structlog.get_logger()
+    logger = utils.LazyObject(lambda: importlib.import_module("structlog").get_logger())
     statsd = None
-    json = json
+    json = utils.import_lazily("kw.cache.json")
+    lock_check_period = 0.5
+    _connection_errors = CONNECTION_ERRORS
+    _circuit_open_error = CircuitOpenError
 
     def __attrs_post_init__(self):
         if self._cache_ttl is None:
@@ -75,6 +140,11 @@ class BaseKiwiCache(object):
         """Cache ttl."""
         return self.cache_ttl
 
+    def _get_cache_expiration(self):
+        # type: () -> timedelta
+        """Cache ttl shortened by random jitter, so keys saved at the same time do not expire at the same time."""
+        return utils.jitter_timedelta(self._cache_ttl, self.cache_ttl_jitter)
+
     @property
     def _cache_key(self):
         # type: () -> str
@@ -93,6 +163,47 @@ class BaseKiwiCache(object):
         """
         return "lock:{}".format(self.__key)
 
+    @property
+    def _refill_backoff_key(self):
+        # type: () -> str
+        """Key of the hash with the count of failed refills and the time until which refills back off.
+
+        Inherited classes should not override this property, instead of that override _key_suffix property.
+        """
+        return "backoff:{}".format(self.__key)
+
+    @property
+    def _key_filter_key(self):
+        # type: () -> str
+        """Key of the filter of keys existing in the source of a resource stored per key.
+
+        Inherited classes should not override this property, instead of that override _key_suffix property.
+        """
+        return "filter:{}".format(self.__key)
+
+    @property
+    def _stream_key(self):
+        # type: () -> str
+        """Key of the data bundle being streamed to redis by this instance."""
+        return "stream:{}:{}".format(self.__key, self._lock_token)
+
+    @property
+    def _meta_key(self):
+        # type: () -> str
+        """Key of the hash with metadata of the cached data bundle, e.g. the timestamp of its refill.
+
+        Inherited classes should not override this property, instead of that override _key_suffix property.
+        """
+        return "meta:{}".format(self.__key)
+
+    def _item_key(self, key):
+        # type: (Any) -> str
+        """Cache key string value of one item of a resource stored per key.
+
+        Inherited classes should not override this method, instead of that override _key_suffix property.
+        """
+        return "item:{{{}}}:{}".format(self.__key, key)
+
     @property
     def __key(self):
         # type: () -> str
@@ -113,95 +224,140 @@ class BaseKiwiCache(object):
 
     def load_from_cache(self):
         # type: () -> Optional[CacheRecord]
-        """Load the full data bundle from cache."""
+        """Load the full data bundle from cache, from a read replica if it has the expected data."""
+        value = self._load_from_replicas()
+        if value is None:
+            value = self._load_from_primary()
+        if value is None:
+            return None
+        return self._decode_cache_record(value)
+
+    def _load_from_primary(self):
+        # type: () -> Optional[bytes]
+        """Load the encoded data bundle from `resources_redis`."""
         try:
-            value = self.resources_redis.get(self._cache_key)
+            with self._redis_call():
+                return self.resources_redis.get(self._cache_key)
         except redis.exceptions.RedisError:
             self._process_cache_error("kiwicache.load_failed")
             return None
 
-        if value is None:
-            return None
+    def _load_payload_if_changed(self, data_hash):
+        # type: (Optional[str]) -> Tuple[Optional[str], Optional[float], Optional[bytes]]
+        """Load the hash and timestamp of the cached data and the encoded data bundle unless it has the given hash.
 
+        With `read_redis` the data bundle is not loaded, it's loaded from the replicas.
+        :raises redis.exceptions.RedisError: if loading from redis fails
+        """
+        cached_hash, timestamp, value = self._run_script(
+            scripts.LOAD_IF_CHANGED, [self._cache_key, self._meta_key], [data_hash or "", int(not self.read_redis)]
+        )
+        return _decode_hash(cached_hash), float(timestamp) if timestamp else None, value
+
+    def _load_from_replicas(self):
+        # type: () -> Optional[bytes]
+        """Load the encoded data bundle from the first read replica which has the expected data.
+
+        Data are expected to have `_expected_data_hash`, if it is known.
+        """
+        data_hash = self._expected_data_hash
+        for replica in self.read_redis:
+            pipeline = replica.pipeline()
+            pipeline.get(self._cache_key)
+            pipeline.hget(self._meta_key, "hash")
+            try:
+                with self._redis_call(replica):
+                    value, replica_hash = pipeline.execute()
+            except redis.exceptions.RedisError:
+                self._log_warning("kiwicache.replica_load_failed")
+                continue
+
+            if value is not None and (data_hash is None or _decode_hash(replica_hash) == data_hash):
+                return value
+            self._log_warning("kiwicache.replica_lagging")
+        return None
+
+    def _decode_cache_record(self, value):
+        # type: (bytes) -> Optional[CacheRecord]
+        """Decode the full data bundle loaded from cache."""
         cache_data = self.json.loads(value)
         if set(cache_data.keys()) != CACHE_RECORD_ATTRIBUTES:
             self._log_warning("kiwicache.malformed_cache_data")
             return None
         return CacheRecord(**cache_data)
 
+    @property
+    def _dumps_data(self):
+        # type: () -> Callable[[Any], str]
+        """Function encoding the data bundle, `json.dumps_data` does not copy the data by `attr.asdict`."""
+        return getattr(self.json, "dumps_data", None) or partial(dumps_asdict, self.json.dumps)
+
+    def _encode_cache_record(self, cache_record):
+        # type: (CacheRecord) -> Tuple[str, str]
+        """Encode the full data bundle and return it with the hash of its encoded data."""
+        return encode_cache_record(self._dumps_data, cache_record)
+
     def save_to_cache(self, data):
         # type: (dict) -> None
-        """Save the provided data bundle to cache."""
+        """Save the provided data bundle to cache.
+
+        If the same data are already cached, only their timestamp and expiration are updated.
+        """
         cache_record = CacheRecord(data=data)
+        if self.stream_chunk_size and hasattr(self.json, "iterencode_data"):
+            self._stream_to_cache(cache_record)
+            return
+
+        payload, data_hash = self._encode_cache_record(cache_record)
+        expiration = self._get_cache_expiration()
         try:
-            self.resources_redis.set(self._cache_key, self.json.dumps(attr.asdict(cache_record)), ex=self._cache_ttl)
+            if self._touch_if_unchanged(data_hash, cache_record.timestamp, expiration):
+                self._increment_metric("unchanged")
+                return
+
+            pipeline = self.resources_redis.pipeline()
+            pipeline.set(self._cache_key, payload, ex=expiration)
+            pipeline.hmset(self._meta_key, {"timestamp": cache_record.timestamp, "hash": data_hash})
+            pipeline.expire(self._meta_key, expiration)
+            with self._redis_call():
+                pipeline.execute()
         except redis.exceptions.RedisError:
             self._process_cache_error("kiwicache.save_failed")
         else:
             self._increment_metric("success")
 
-    def _get_refill_lock(self):
-        # type: () -> Optional[bool]
-        """Lock loading from the expensive source.
-
-        This lets us avoid all workers hitting at the same time.
-        :return: Whether we got the lock or not, None if connection to redis failed.
-        """
+    def load_hash_from_cache(self):
+        # type: () -> Optional[str]
+        """Load hash of the cached data bundle, None if it is unknown."""
         try:
-            return bool(self.resources_redis.set(self._refill_lock_key, "locked", ex=self.refill_ttl, nx=True))
+            with self._redis_call():
+                data_hash = self.resources_redis.hget(self._meta_key, "hash")
         except redis.exceptions.RedisError:
-            self._process_cache_error("kiwicache.refill_lock_failed")
+            self._process_cache_error("kiwicache.load_failed")
             return None
+        return _decode_hash(data_hash)
 
-    def _wait_for_refill_lock(self):
-        # type: () -> Optional[bool]
-        """Wait for lock or reloaded data in cache (handles multiple workers).
+    def _redis_call(self, client=None):
+        # type: (Any) -> ContextManager[None]
+        """Guard a call of the redis client by its circuit breaker, the client is `resources_redis` by default."""
+        circuit_breaker = get_circuit_breaker(self.resources_redis if client is None else client)
+        return circuit_breaker.guard(self._connection_errors, self._circuit_open_error)
 
-        :return: Whether we got the lock or not, None if connection to redis failed.
-        """
-        start_timestamp = utils.get_current_timestamp()
-        lock_check_period = 0.5
-        while True:
-            has_lock = self._get_refill_lock()
-            if has_lock is None or has_lock is True:
-                return has_lock
-
-            self._log_warning("kiwicache.refill_locked")
-            # let the lock owner finish
-            lock_check_period = min(lock_check_period * 2, self.refill_ttl.total_seconds())
-            time.sleep(lock_check_period)
-
-            if self._is_refilled(start_timestamp):
-                return False
-
-    def _is_refilled(self, timestamp):
-        # type: (float) -> bool
-        """Return whether cache data was refilled from timestamp time.
-
-        :param timestamp: timestamp of refill start
-        :return: Whether cache data was refilled
-        """
-        cache_record = self.load_from_cache()
-        return cache_record and cache_record.timestamp > timestamp
-
-    def _release_refill_lock(self):
-        # type: () -> Optional[bool]
-        """Release loading lock from the source.
-
-        This lets us avoid all workers hitting at the same time.
-        :return: Whether we released the lock or not
-        """
-        try:
-            return bool(self.resources_redis.delete(self._refill_lock_key))
-        except redis.exceptions.RedisError:
-            self._process_cache_error("kiwicache.release_lock_failed")
-            return None
+    def _is_circuit_open(self):
+        # type: () -> bool
+        """Return whether redis is not called because of its failures."""
+        return get_circuit_breaker(self.resources_redis).is_open
 
     def _prolong_cache_expiration(self):
         # type: () -> None
         """Prolong cache expiration."""
+        expiration = self._get_cache_expiration()
+        pipeline = self.resources_redis.pipeline()
+        pipeline.expire(self._cache_key, time=expiration)
+        pipeline.expire(self._meta_key, time=expiration)
         try:
-            self.resources_redis.expire(self._cache_key, time=self._cache_ttl)
+            with self._redis_call():
+                pipeline.execute()
         except redis.exceptions.RedisError:
             self._process_cache_error("kiwicache.prolong_expiration_failed")
 
@@ -209,9 +365,13 @@ class BaseKiwiCache(object):
         # type: (str) -> None
         """Process cache error.
 
+        Errors of open circuit breaker are only counted, so a redis outage does not flood logs.
         Inherited classes can override this method.
         :param msg: message
         """
+        if isinstance(sys.exc_info()[1], self._circuit_open_error):
+            self._increment_metric("circuit_open")
+            return
         self._log_exception(msg)
         self._increment_metric("redis_error")
 
@@ -271,9 +431,19 @@ class KiwiCache(BaseKiwiCache, UserDict, ReadOnlyDictMixin):
     - `max_attempts` - maximum attempts for refill cache (if negative - one attempt is used and no Exception is raised)
     - `_call_attempt` - local refill attempts countdown entity
     - `allow_empty_data` - allow empty data in the resource
+    - `reload_jitter` - fraction of `reload_ttl` by which the local data expiration is randomly shortened
+    - `early_reload_beta` - weight of the last reload duration in the probabilistic early reload (0 by default disables it)
+    - `memory_usage` - estimated size of local data in bytes
+    - `generation` - counter of local data changes, derived caches are recomputed when it changes
+    - `read_timeout` - maximum time a read waits for the reload of expired data, stale local data are served
+      after it while the reload continues in background (None waits for the reload)
+    - `refill_backoff` - time for which all workers skip refills after a failure of `load_from_source`,
+      doubled with each consecutive failure up to `max_refill_backoff` and reset by a success (None disables it)
 
     Base class attributes:
     - `instances` - dict of instances with one instance per each _cache_key
+    - `memory_budget` - `MemoryBudget` shared by caches, which limits memory used by their local data
+    - `refill_backoff_jitter` - maximal fraction by which the refill backoff is randomly shortened
 
     Each subclass must implement `load_from_source` method.
     Method which can be typically overridden by subclasses:
@@ -283,19 +453,43 @@ class KiwiCache(BaseKiwiCache, UserDict, ReadOnlyDictMixin):
     """
 
     reload_ttl = attr.ib(timedelta(minutes=1), type=timedelta, validator=attr.validators.instance_of(timedelta))
-    expires_at = attr.ib(factory=datetime.utcnow, type=datetime, validator=attr.validators.instance_of(datetime))
+    _expires_at = attr.ib(factory=datetime.utcnow, type=datetime, validator=attr.validators.instance_of(datetime))
     _data = attr.ib(attr.Factory(dict), type=dict, validator=attr.validators.instance_of(dict))
     max_attempts = attr.ib(-1, type=int, validator=attr.validators.instance_of(int))
     _call_attempt = attr.ib(init=False, type=CallAttempt)
     allow_empty_data = attr.ib(False, type=bool, validator=attr.validators.instance_of(bool))
+    reload_jitter = attr.ib(
+        0.0, type=float, validator=[attr.validators.instance_of((int, float)), utils.fraction_validator]
+    )
+    early_reload_beta = attr.ib(0.0, type=float, validator=attr.validators.instance_of((int, float)))
+    _reload_cost = attr.ib(0.0, init=False, type=float)
+    _memory_usage = attr.ib(0, init=False, type=int)
+    _transient = attr.ib(False, init=False, type=bool)
+    _data_hash = attr.ib(None, init=False, type=str)
+    _loaded_data_hash = attr.ib(None, init=False, type=str, repr=False)
+    read_timeout = attr.ib(
+        None, type=Optional[timedelta], validator=attr.validators.optional(attr.validators.instance_of(timedelta))
+    )
+    _background_reload = attr.ib(None, init=False, type=BackgroundCall, repr=False)
+    _background_reload_lock = attr.ib(init=False, factory=threading.Lock, repr=False)
+    _deadline = attr.ib(0.0, init=False, type=float, repr=False)
+    _fresh_until = attr.ib(0.0, init=False, type=float, repr=False)
+    _generation = attr.ib(0, init=False, type=int)
+    refill_backoff = attr.ib(
+        None, type=Optional[timedelta], validator=attr.validators.optional(attr.validators.instance_of(timedelta))
+    )
+    max_refill_backoff = attr.ib(timedelta(minutes=5), type=timedelta, validator=attr.validators.instance_of(timedelta))
 
     # class attributes
     instances = {}  # type: Dict[str, KiwiCache]
+    memory_budget = None  # type: Optional[MemoryBudget]
+    refill_backoff_jitter = 0.5
 
     def __attrs_post_init__(self):
         super(KiwiCache, self).__attrs_post_init__()
         self._add_instance()
         self._call_attempt = CallAttempt("{}.load_from_source".format(self.name.lower()), self.max_attempts)
+        self.expires_at = self._expires_at
 
     def _add_instance(self):
         """Add current instance to instances dict with _cache_key as dict key.
@@ -315,10 +509,78 @@ class KiwiCache(BaseKiwiCache, UserDict, ReadOnlyDictMixin):
         # type: () -> timedelta
         return self.cache_ttl if self.cache_ttl else self.reload_ttl * 10
 
+    @property
+    def expires_at(self):
+        # type: () -> datetime
+        return self._expires_at
+
+    @expires_at.setter
+    def expires_at(self, value):
+        # type: (datetime) -> None
+        """Set expiration of local data, the freshness of reads is checked against a monotonic deadline.
+
+        The deadline is shortened for the probabilistic early reload (XFetch) weighted by duration
+        of the last reload, so workers do not reload all at the same moment.
+        """
+        self._expires_at = value
+        early_reload = 0.0
+        if self._reload_cost and self.early_reload_beta > 0:
+            early_reload = -self._reload_cost * self.early_reload_beta * math.log(1 - random.random())
+        self._deadline = _monotonic() + (value - datetime.utcnow()).total_seconds() - early_reload
+        self._update_fresh_until()
+
+    def _update_fresh_until(self):
+        # type: () -> None
+        """Precompute the deadline of the read fast path, reads needing more than the freshness check disable it."""
+        if self._data and not self._transient and self.memory_budget is None:
+            self._fresh_until = self._deadline
+        else:
+            self._fresh_until = float("-inf")
+
     @property
     def data(self):
+        if self._fresh_until > _monotonic():
+            return self._data
         self.maybe_reload()
-        return self._data
+        return self._get_data()
+
+    def __getitem__(self, key):
+        if self._fresh_until > _monotonic():
+            data = self._data
+        else:
+            data = self.data
+        try:
+            return data[key]
+        except KeyError:
+            if hasattr(self.__class__, "__missing__"):
+                return self.__class__.__missing__(self, key)
+            raise
+
+    def get(self, key, default=None):
+        if self._fresh_until > _monotonic():
+            return self._data.get(key, default)
+        return self.data.get(key, default)
+
+    @property
+    def memory_usage(self):
+        # type: () -> int
+        return self._memory_usage
+
+    @property
+    def generation(self):
+        # type: () -> int
+        return self._generation
+
+    def get_many(self, keys, default=None):
+        # type: (Iterable[Any], Any) -> List[Any]
+        """Get values of the given keys with a single freshness check.
+
+        :param keys: keys to look up
+        :param default: value returned for missing keys
+        :return: values in the order of the given keys
+        """
+        get = self.data.get
+        return [get(key, default) for key in keys]
 
     def load_from_source(self):
         # type: () -> dict
@@ -327,16 +589,23 @@ class KiwiCache(BaseKiwiCache, UserDict, ReadOnlyDictMixin):
 
     def reload(self):
         # type: () -> None
-        """Load the full data bundle, from cache, or if unavailable, from source."""
+        """Load the full data bundle, from cache, or if unavailable, from source.
+
+        Local data are kept without calling redis while its circuit breaker is open.
+        """
+        if self._data and self._is_circuit_open():
+            self._prolong_data_expiration()
+            return
+
         successful_reload = self.reload_from_cache()
         while not successful_reload:
             try:
-                self.refill_cache()
+                # refilled data are used without loading them back from redis
+                successful_reload = self.refill_cache() or self.reload_from_cache()
             except CallAttemptException:
                 self._prolong_data_expiration()
                 raise
 
-            successful_reload = self.reload_from_cache()
             if self.max_attempts < 0 and not successful_reload:
                 self._prolong_data_expiration()
                 self._log_error("kiwicache.reload_failed")
@@ -346,32 +615,183 @@ class KiwiCache(BaseKiwiCache, UserDict, ReadOnlyDictMixin):
         # type: () -> bool
         """Reload data from redis cache.
 
+        The data bundle is not downloaded again if the hash of the cached data equals to the local one.
         :return: Whether the reload from cache succeeded or not.
         """
+        self._loaded_data_hash = None
         cache_data = self.load_from_cache()
 
         if not cache_data:
             return False
+        if cache_data.data is self._data:  # the cached data are the local ones
+            self._prolong_data_expiration()
+            return True
 
-        self._data = cache_data.data
-        self._prolong_data_expiration()
+        self._set_data(cache_data.data)
+        self._data_hash = self._loaded_data_hash
         return True
 
+    def _reload_from_cache(self, data_hash):
+        # type: (Optional[str]) -> bool
+        """Reload data from redis cache unless the local data have the given hash of the cached data."""
+        if self._data and data_hash is not None and data_hash == self._data_hash:
+            self._prolong_data_expiration()
+            return True
+        return self.reload_from_cache()
+
+    def load_from_cache(self):
+        # type: () -> Optional[CacheRecord]
+        """Load the full data bundle from cache, from a read replica if it has the expected data.
+
+        The hash and timestamp of the cached data are loaded in the same round trip. If the hash equals
+        to the one of the local data, the bundle is not downloaded and the local data are returned.
+        """
+        local_hash = self._data_hash if self._data else None
+        try:
+            data_hash, timestamp, value = self._load_payload_if_changed(local_hash)
+        except redis.exceptions.RedisError:
+            self._process_cache_error("kiwicache.load_failed")
+            # read replicas can still serve the data while the primary fails
+            self._expected_data_hash = None
+            value = self._load_from_replicas()
+        else:
+            if local_hash is not None and data_hash == local_hash:
+                self._loaded_data_hash = data_hash
+                return CacheRecord(data=self._data, timestamp=timestamp)
+            if self.read_redis:
+                self._expected_data_hash = data_hash
+                value = self._load_from_replicas() or self._load_from_primary()
+            self._loaded_data_hash = data_hash
+
+        if value is None:
+            return None
+        return self._decode_cache_record(value)
+
+    def _set_data(self, data):
+        # type: (dict) -> None
+        """Set local data reserving memory for them in `memory_budget`.
+
+        Data which do not fit into the budget are used only once and reloaded from redis on each access.
+        """
+        self._data = data
+        self._data_hash = None
+        self._generation += 1
+        self._memory_usage = utils.estimate_size(data)
+        was_transient = self._transient
+        self._transient = self.memory_budget is not None and not self.memory_budget.reserve(self, self._memory_usage)
+        if self._transient:
+            if not was_transient:
+                self._log_warning("kiwicache.over_memory_budget")
+            self.expires_at = datetime.utcnow()
+        else:
+            self._prolong_data_expiration()
+
+    def _get_data(self):
+        # type: () -> dict
+        """Get local data marking the cache as recently used in `memory_budget`."""
+        data = self._data
+        if self._transient:
+            self._data = {}
+            self._memory_usage = 0
+            self._update_fresh_until()
+        elif self.memory_budget is not None:
+            self.memory_budget.touch(self)
+        return data
+
+    def dispose(self):
+        # type: () -> None
+        """Drop local data and release memory reserved for them in `memory_budget`, e.g. for a cache no longer used."""
+        if self.memory_budget is not None:
+            self.memory_budget.release(self)
+        self._data = {}
+        self._memory_usage = 0
+        self.expires_at = datetime.utcnow()
+
+    def _evict(self):
+        # type: () -> None
+        """Drop local data to free memory for other caches, they are reloaded on the next access."""
+        self._data = {}
+        self._memory_usage = 0
+        self.expires_at = datetime.utcnow()
+        self._increment_metric("evicted")
+
     def maybe_reload(self):
         # type: () -> None
-        """Load the full data bundle if it's too old."""
-        if self.expires_at <= datetime.utcnow() or (not self._data and not self.allow_empty_data):
-            self.reload()
+        """Load the full data bundle if it's too old.
+
+        :raises ReadTimeoutError: if `read_timeout` runs out and there are no local data to serve
+        """
+        if not self._is_stale():
+            return
+        if self.read_timeout is None:
+            self._timed_reload()
+        else:
+            self._wait_for_background_reload()
+
+    def _timed_reload(self):
+        # type: () -> None
+        """Reload data measuring the duration of the reload."""
+        start_timestamp = utils.get_current_timestamp()
+        self.reload()
+        self._reload_cost = utils.get_current_timestamp() - start_timestamp
+
+    def _wait_for_background_reload(self):
+        # type: () -> None
+        """Wait at most `read_timeout` for the reload running in background, one reload is shared by all readers."""
+        with self._background_reload_lock:
+            if self._background_reload is None:
+                self._background_reload = BackgroundCall(self._run_background_reload)
+            background_reload = self._background_reload
+
+        if background_reload.wait(self.read_timeout.total_seconds()):
+            return
+        self._increment_metric("read_timeout")
+        if not self._data:
+            raise ReadTimeoutError("{} data are not loaded within {}".format(self.name, self.read_timeout))
+
+    def _run_background_reload(self):
+        # type: () -> None
+        try:
+            self._timed_reload()
+        finally:
+            with self._background_reload_lock:
+                self._background_reload = None
+
+    def _is_stale(self):
+        # type: () -> bool
+        """Return whether the local data are expired or missing."""
+        return self._is_expired() or (not self._data and not self.allow_empty_data)
+
+    def _is_expired(self):
+        # type: () -> bool
+        """Return whether the local data should be reloaded, see `expires_at` for the early reload."""
+        return self._deadline <= _monotonic()
 
     def _prolong_data_expiration(self):
         # type: () -> None
         """Prolong expiration of the current local data."""
-        self.expires_at = datetime.utcnow() + self.reload_ttl
+        self.expires_at = datetime.utcnow() + utils.jitter_timedelta(self.reload_ttl, self.reload_jitter)
 
     def _prolong_cache_expiration(self):
-        """Prolong cache expiration or refill if it expires and we have data locally."""
-        super(KiwiCache, self)._prolong_cache_expiration()
-        successful_reload = self.reload_from_cache()
+        # type: () -> None
+        """Prolong cache expiration or refill if it expires and we have data locally.
+
+        The expiration and the hash of the cached data are handled in one round trip, so the cached data are
+        reloaded only if they exist and differ from the local ones.
+        """
+        expiration = self._get_cache_expiration()
+        pipeline = self.resources_redis.pipeline()
+        pipeline.expire(self._cache_key, time=expiration)
+        pipeline.expire(self._meta_key, time=expiration)
+        pipeline.hget(self._meta_key, "hash")
+        try:
+            with self._redis_call():
+                cached, _, data_hash = pipeline.execute()
+        except redis.exceptions.RedisError:
+            self._process_cache_error("kiwicache.prolong_expiration_failed")
+            return
+
+        successful_reload = cached and self._reload_from_cache(_decode_hash(data_hash))
         if not successful_reload and self._data:
             self.save_to_cache(self._data)
 
@@ -387,25 +807,70 @@ class KiwiCache(BaseKiwiCache, UserDict, ReadOnlyDictMixin):
         self._call_attempt.countdown()
 
     def refill_cache(self):
-        # type: () -> None
-        """Refill cache with the full data bundle from source in Redis."""
+        # type: () -> bool
+        """Refill cache with the full data bundle from source in Redis.
+
+        Refills of all workers back off after failures, see `refill_backoff`.
+        :return: Whether the refilled data were set as local data
+        """
         has_lock = self._wait_for_refill_lock()
         if not has_lock:
             if has_lock is None:
-                # redis error
+                # redis error or backoff
                 self._call_attempt.countdown()
-            return
+            return False
 
+        released = False
         try:
             try:
-                source_data = self.load_from_source()
+                with self._refill_lock_heartbeat():
+                    source_data = self.load_from_source()
             except Exception as e:
+                self._record_refill_failure()
                 self._process_refill_error("kiwicache.source_exception", e)
-                return
+                return False
 
             if source_data or self.allow_empty_data:
-                self.save_to_cache(source_data)
-            else:
-                self._process_refill_error("load_from_source returned empty response!")
+                refilled = self._save_refilled_data(source_data)
+                # the lock is released by the save
+                released = True
+                return refilled
+            self._record_refill_failure()
+            self._process_refill_error("load_from_source returned empty response!")
+            return False
         finally:
-            self._release_refill_lock()
+            if not released:
+                self._release_refill_lock()
+
+    def _save_refilled_data(self, data):
+        # type: (dict) -> bool
+        """Save data loaded from source to cache, releasing the refill lock in the same round trip.
+
+        The encoded data are decoded to local data, so they are not downloaded back from redis.
+        :return: Whether the local data were set
+        """
+        cache_record = CacheRecord(data=data)
+        if self.stream_chunk_size and hasattr(self.json, "iterencode_data"):
+            self._stream_to_cache(cache_record)
+            self._release_refill_lock(reset_backoff=True)
+            return False
+
+        payload, data_hash = self._encode_cache_record(cache_record)
+        expiration = self._get_cache_expiration()
+        try:
+            changed = self._save_and_release_lock(payload, data_hash, cache_record.timestamp, expiration)
+            self._increment_metric("success" if changed else "unchanged")
+        except redis.exceptions.RedisError:
+            self._process_cache_error("kiwicache.save_failed")
+            self._release_refill_lock(reset_backoff=True)
+            return False
+
+        if self._data and data_hash == self._data_hash:
+            self._prolong_data_expiration()
+            return True
+        refilled_record = self._decode_cache_record(payload)
+        if refilled_record is None:
+            return False
+        self._set_data(refilled_record.data)
+        self._data_hash = data_hash
+        return True
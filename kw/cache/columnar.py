@@ -0,0 +1,149 @@
+import hashlib
+import io
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple  # pylint: disable=unused-import
+
+import attr
+import numpy as np
+
+from .base import CacheRecord, KiwiCache
+
+KEYS_ARRAY = "keys"
+TIMESTAMP_ARRAY = "timestamp"
+COLUMN_ARRAY_PREFIX = "column:"
+
+
+@attr.s(eq=False)
+class ColumnarTable(object):
+    """Numeric table with columns stored in NumPy arrays and rows sorted by their unique keys.
+
+    Base instance attributes:
+    - `keys` - sorted array of row keys
+    - `columns` - arrays of column values by column name, in the order of `keys`
+    """
+
+    keys = attr.ib(type=np.ndarray, converter=np.asarray)
+    columns = attr.ib(factory=dict, type=Dict[str, np.ndarray])
+
+    def __attrs_post_init__(self):
+        order = np.argsort(self.keys, kind="stable")
+        self.keys = self.keys[order]
+        self.columns = {name: np.asarray(values)[order] for name, values in self.columns.items()}
+        if len(self.keys) > 1 and (self.keys[1:] == self.keys[:-1]).any():
+            raise ValueError("Keys of the table are not unique.")
+
+    @classmethod
+    def from_rows(cls, rows, key, columns):
+        # type: (Iterable[Dict[str, Any]], str, List[str]) -> ColumnarTable
+        """Create the table from rows like the ones of `SQLAlchemyResource`.
+
+        :param rows: mappings of column names to values
+        :param key: name of the key column
+        :param columns: names of the stored columns
+        """
+        rows = list(rows)
+        return cls(
+            keys=[row[key] for row in rows], columns={name: np.array([row[name] for row in rows]) for name in columns}
+        )
+
+    def find(self, keys):
+        # type: (Iterable[Any]) -> Tuple[np.ndarray, np.ndarray]
+        """Find rows of the keys by a binary search.
+
+        :return: row positions and mask of the found keys, positions of the missing keys are not valid
+        """
+        keys = np.asarray(keys)
+        if not len(self.keys):
+            return np.zeros(keys.shape, dtype=np.intp), np.zeros(keys.shape, dtype=bool)
+        positions = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return positions, self.keys[positions] == keys
+
+    def lookup(self, keys, column, default=np.nan):
+        # type: (Iterable[Any], str, Any) -> np.ndarray
+        """Look up values of the column for an array of keys, `default` is used for missing keys."""
+        positions, found = self.find(keys)
+        values = self.columns[column]
+        if not len(values):
+            return np.full(found.shape, default)
+        return np.where(found, values[positions], default)
+
+    def digest(self):
+        # type: () -> str
+        """Hash of the table content."""
+        content_hash = hashlib.sha1()
+        for name, values in [(KEYS_ARRAY, self.keys)] + sorted(self.columns.items()):
+            content_hash.update("{}:{}:{}\n".format(name, values.dtype.str, values.shape).encode("utf-8"))
+            content_hash.update(np.ascontiguousarray(values).tobytes())
+        return content_hash.hexdigest()
+
+    def __getitem__(self, key):
+        # type: (Any) -> Dict[str, Any]
+        positions, found = self.find([key])
+        if not found[0]:
+            raise KeyError(key)
+        return {name: values[positions[0]].item() for name, values in self.columns.items()}
+
+    def get(self, key, default=None):
+        # type: (Any, Any) -> Any
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return bool(self.find([key])[1][0])
+
+    def __iter__(self):
+        # type: () -> Iterator[Any]
+        return iter(self.keys.tolist())
+
+    def __len__(self):
+        return len(self.keys)
+
+
+def encode_table_record(cache_record):
+    # type: (CacheRecord) -> Tuple[bytes, str]
+    """Encode the cache record with a table to a NumPy `.npz` archive and return it with the hash of the table."""
+    table = cache_record.data
+    arrays = {COLUMN_ARRAY_PREFIX + name: values for name, values in table.columns.items()}
+    payload = io.BytesIO()
+    np.savez_compressed(payload, keys=table.keys, timestamp=np.float64(cache_record.timestamp), **arrays)
+    return payload.getvalue(), table.digest()
+
+
+def decode_table_record(value):
+    # type: (bytes) -> CacheRecord
+    """Decode the cache record encoded by `encode_table_record`."""
+    with np.load(io.BytesIO(value), allow_pickle=False) as arrays:
+        columns = {
+            name[len(COLUMN_ARRAY_PREFIX) :]: arrays[name]
+            for name in arrays.files
+            if name.startswith(COLUMN_ARRAY_PREFIX)
+        }
+        table = ColumnarTable(keys=arrays[KEYS_ARRAY], columns=columns)
+        return CacheRecord(data=table, timestamp=arrays[TIMESTAMP_ARRAY].item())
+
+
+@attr.s
+class ColumnarKiwiCache(KiwiCache):
+    """Caches a numeric table as `ColumnarTable`, which is stored in Redis as a compressed NumPy archive.
+
+    Each subclass must implement `load_from_source` method returning `ColumnarTable`.
+    For another attributes and methods see parent classes docs.
+    """
+
+    def lookup(self, keys, column, default=np.nan):
+        # type: (Iterable[Any], str, Any) -> np.ndarray
+        """Look up values of the column for an array of keys with a single freshness check."""
+        return self.data.lookup(keys, column, default)
+
+    def _encode_cache_record(self, cache_record):
+        # type: (CacheRecord) -> Tuple[bytes, str]
+        return encode_table_record(cache_record)
+
+    def _decode_cache_record(self, value):
+        # type: (bytes) -> Optional[CacheRecord]
+        try:
+            return decode_table_record(value)
+        except (ValueError, KeyError, OSError):
+            self._log_warning("kiwicache.malformed_cache_data")
+            return None
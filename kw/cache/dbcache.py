@@ -1,13 +1,32 @@
-from typing import List  # pylint: disable=unused-import
+from typing import List, Optional  # pylint: disable=unused-import
 
 import attr
 from sqlalchemy import column, select, table
 from sqlalchemy.orm.scoping import scoped_session
 from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy.sql.selectable import Select
 
 from . import KiwiCache
 
 
+def select_query(table_name, key=None, columns=None, where=None):
+    # type: (str, Optional[str], Optional[List[str]], Optional[ColumnElement]) -> Select
+    """Build query selecting the columns (and the key column) of the table rows matching `where`."""
+    if columns == ["*"]:
+        selected = ["*"]
+    elif columns and key:
+        selected = [column(name) for name in set(columns + [key])]
+    elif columns:
+        selected = [column(name) for name in columns]
+    else:
+        selected = [column(key)]
+    query = select(selected)
+
+    if where is not None:
+        query = query.where(where)
+    return query.select_from(table(table_name))
+
+
 @attr.s
 class SQLAlchemyResource(KiwiCache):
     """Caches selected columns or an entire table."""
@@ -31,19 +50,8 @@ class SQLAlchemyResource(KiwiCache):
 
         :return: rows with data
         """
-        if self.columns == ["*"]:
-            columns = ["*"]
-        elif self.columns and self.key:
-            columns = [column(name) for name in set(self.columns + [self.key])]
-        elif self.columns:
-            columns = [column(name) for name in self.columns]  # pylint: disable=not-an-iterable
-        else:
-            columns = [column(self.key)]
-        query = select(columns)
-
-        if self.where is not None:
-            query = query.where(self.where)
-        fetchall = self.session.execute(query.select_from(table(self.table_name))).fetchall()
+        query = select_query(self.table_name, self.key, self.columns, self.where)
+        fetchall = self.session.execute(query).fetchall()
         return [dict(key) for key in fetchall]
 
     def load_from_source(self):
@@ -0,0 +1,54 @@
+import threading
+from typing import Any, Callable, List, Optional, Tuple  # pylint: disable=unused-import
+
+import attr
+
+from .base import KiwiCache
+
+
+@attr.s
+class DerivedCache(object):
+    """Structure derived from data of base caches, e.g. a reverse map, recomputed only when their data change.
+
+    The `transform` gets the data of the base caches as positional arguments and its result is kept in memory
+    until a base cache loads new data, which is recognized by its `generation`. Reads of the base caches
+    reload their expired data as usual, so the derived structure is computed at most once per reload.
+
+    Base instance attributes:
+    - `caches` - base caches, their data are passed to `transform` in this order
+    - `transform` - function computing the derived structure
+    - `_generations` - generations of the base caches the current value is computed from
+    """
+
+    caches = attr.ib(type=List[KiwiCache], converter=list)
+    transform = attr.ib(type=Callable[..., Any])
+    _value = attr.ib(None, init=False, repr=False)
+    _generations = attr.ib(None, init=False, type=Optional[Tuple[int, ...]])
+    _lock = attr.ib(init=False, factory=threading.Lock, repr=False)
+
+    def __call__(self):
+        # type: () -> Any
+        """Get the derived structure, it is recomputed once when any of the base caches has new data."""
+        for cache in self.caches:
+            cache.maybe_reload()
+        # the generations are read first, data loaded meanwhile lead only to another recomputation
+        generations = tuple(cache.generation for cache in self.caches)
+        if generations == self._generations:
+            return self._value
+
+        with self._lock:
+            if generations != self._generations:
+                self._value = self.transform(*[cache.data for cache in self.caches])
+                self._generations = generations
+            return self._value
+
+
+def derived(*caches):
+    # type: (*KiwiCache) -> Callable[[Callable[..., Any]], DerivedCache]
+    """Decorate a transform of data of the caches to get its `DerivedCache`."""
+
+    def decorator(transform):
+        # type: (Callable[..., Any]) -> DerivedCache
+        return DerivedCache(caches, transform)
+
+    return decorator
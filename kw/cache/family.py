@@ -0,0 +1,168 @@
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional  # pylint: disable=unused-import
+
+import attr
+import redis
+
+from . import utils
+from .base import _decode_hash, KiwiCache
+from .helpers import get_circuit_breaker
+
+
+@attr.s
+class KiwiCacheFamilyMember(KiwiCache):
+    """Cache of one member of a `KiwiCacheFamily`, keyed by its `suffix`.
+
+    Members are not added to `KiwiCache.instances`, they are managed by their family.
+    For another attributes and methods see parent classes docs.
+    """
+
+    suffix = attr.ib(None, type=str, validator=utils.mandatory_validator)
+
+    @property
+    def _key_suffix(self):
+        # type: () -> str
+        return self.suffix
+
+    def _add_instance(self):
+        pass
+
+
+@attr.s
+class KiwiCacheFamily(object):
+    """Manages many caches of the same resource parametrized by suffix, e.g. one per market or partner.
+
+    Members are created lazily on the first access and only `max_members` of the recently used ones are kept
+    in memory. Stale members are reloaded from redis together in one round trip and the refill of the whole
+    family is scheduled by the timestamps of the cached data, the oldest first.
+
+    Base instance attributes:
+    - `member_class` - subclass of `KiwiCacheFamilyMember` implementing `load_from_source`
+    - `resources_redis` - StrictRedis for communication with redis (cache) server
+    - `member_params` - other parameters of the members, e.g. `reload_ttl`
+    - `max_members` - maximum number of members held in memory
+    - `suffixes` - suffixes of all members, used for the family refill
+    - `_members` - members held in memory, the least recently used first
+
+    Base class attributes:
+    - `instances` - dict of families with one family per each member class name
+    """
+
+    member_class = attr.ib(None, type=type, validator=attr.validators.instance_of(type))
+    resources_redis = attr.ib(None, type=redis.StrictRedis, validator=attr.validators.instance_of(redis.StrictRedis))
+    member_params = attr.ib(factory=dict, type=dict, validator=attr.validators.instance_of(dict))
+    max_members = attr.ib(100, type=int, validator=attr.validators.instance_of(int))
+    suffixes = attr.ib(factory=list, type=List[str], validator=attr.validators.instance_of(list))
+    _members = attr.ib(init=False, factory=OrderedDict, repr=False)
+
+    # class attributes
+    instances = {}  # type: Dict[str, KiwiCacheFamily]
+
+    def __attrs_post_init__(self):
+        self.instances[self.member_class.__name__] = self
+
+    def __getitem__(self, suffix):
+        # type: (str) -> KiwiCacheFamilyMember
+        """Get member of the given suffix, its data are reloaded on access like in case of `KiwiCache`."""
+        member = self._members.pop(suffix, None)
+        if member is None:
+            member = self._create_member(suffix)
+        self._members[suffix] = member
+        while len(self._members) > self.max_members:
+            self._members.popitem(last=False)[1].dispose()
+        return member
+
+    def __len__(self):
+        return len(self._members)
+
+    def get_members(self, suffixes):
+        # type: (Iterable[str]) -> List[KiwiCacheFamilyMember]
+        """Get members of the given suffixes, stale members are reloaded from cache in one round trip."""
+        members = [self[suffix] for suffix in suffixes]
+        self._reload_members(members)
+        return members
+
+    def maybe_reload(self):
+        # type: () -> None
+        """Reload all stale members held in memory from cache in one round trip."""
+        self._reload_members(list(self._members.values()))
+
+    def refill_cache(self, suffixes=None):
+        # type: (Optional[Iterable[str]]) -> List[str]
+        """Refill cache of members whose cached data are missing or older than their `reload_ttl`, the oldest first.
+
+        Members not held in memory are created for the refill only, outside of `memory_budget`,
+        and disposed right after it, so their data do not stay in memory.
+        :param suffixes: suffixes of the members to check, `suffixes` and members in memory by default
+        :return: suffixes of the refilled members
+        """
+        if suffixes is None:
+            suffixes = list(OrderedDict.fromkeys(self.suffixes + list(self._members)))
+        members = []
+        refill_only = set()
+        for suffix in suffixes:
+            member = self._members.get(suffix)
+            if member is None:
+                member = self._create_member(suffix)
+                # its data are dropped after the refill, so they must not evict data of other caches
+                member.memory_budget = None
+                refill_only.add(id(member))
+            members.append(member)
+
+        pipeline = self.resources_redis.pipeline(transaction=False)
+        for member in members:
+            pipeline.hget(member._meta_key, "timestamp")
+        try:
+            with get_circuit_breaker(self.resources_redis).guard():
+                timestamps = [float(timestamp or 0) for timestamp in pipeline.execute()]
+        except redis.exceptions.RedisError:
+            timestamps = [0.0] * len(members)
+
+        now = utils.get_current_timestamp()
+        stale = [
+            (timestamp, member)
+            for timestamp, member in zip(timestamps, members)
+            if now - timestamp >= member.reload_ttl.total_seconds()
+        ]
+        stale.sort(key=lambda item: item[0])
+        for _, member in stale:
+            try:
+                member.refill_cache()
+            finally:
+                if id(member) in refill_only:
+                    member.dispose()
+        return [member.suffix for _, member in stale]
+
+    def _create_member(self, suffix):
+        # type: (str) -> KiwiCacheFamilyMember
+        return self.member_class(resources_redis=self.resources_redis, suffix=suffix, **self.member_params)
+
+    def _reload_members(self, members):
+        # type: (List[KiwiCacheFamilyMember]) -> None
+        """Reload stale members from cache in one round trip, members missing in cache are reloaded one by one."""
+        members = [member for member in members if member._is_stale()]
+        if not members:
+            return
+
+        pipeline = self.resources_redis.pipeline(transaction=False)
+        for member in members:
+            pipeline.get(member._cache_key)
+            pipeline.hget(member._meta_key, "hash")
+        try:
+            with get_circuit_breaker(self.resources_redis).guard():
+                results = pipeline.execute()
+        except redis.exceptions.RedisError:
+            members[0]._process_cache_error("kiwicache.load_failed")
+            results = [None, None] * len(members)
+
+        for member, value, data_hash in zip(members, results[::2], results[1::2]):
+            data_hash = _decode_hash(data_hash)
+            if member._data and data_hash is not None and data_hash == member._data_hash:
+                member._prolong_data_expiration()
+                continue
+            cache_record = member._decode_cache_record(value) if value is not None else None
+            if cache_record:
+                member._set_data(cache_record.data)
+                member._data_hash = data_hash
+            else:
+                member.reload()
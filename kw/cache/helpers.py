@@ -1,4 +1,23 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import timedelta
+import hashlib
+import math
+import struct
+import sys
+import threading
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple, Type  # pylint: disable=unused-import
+import weakref
+
 import attr
+import redis
+
+from . import utils
+
+if sys.version_info >= (3, 0):
+    _text_type = str
+else:  # for Python 2
+    _text_type = unicode  # pylint: disable=undefined-variable
 
 
 class ReadOnlyDictMixin(object):
@@ -15,6 +34,10 @@ class CallAttemptException(Exception):
         super(CallAttemptException, self).__init__("Max attempt of call {}".format(name))
 
 
+class ReadTimeoutError(Exception):
+    """Fresh data are not loaded within the read timeout and there are no local data to serve."""
+
+
 @attr.s
 class CallAttempt(object):
 
@@ -36,3 +59,245 @@ class CallAttempt(object):
 
     def reset(self):
         self.counter = self.max_attempts
+
+
+@attr.s
+class LRUCache(object):
+    """Size bounded mapping with expiring entries, the least recently used entries are dropped first."""
+
+    max_size = attr.ib(1024, type=int)
+    _entries = attr.ib(init=False, factory=OrderedDict, repr=False)
+
+    def get(self, key, default=None):
+        # type: (Any, Any) -> Any
+        entry = self._entries.pop(key, None)
+        if entry is None or entry[1] <= utils.get_current_timestamp():
+            return default
+        self._entries[key] = entry
+        return entry[0]
+
+    def set(self, key, value, ttl):
+        # type: (Any, Any, timedelta) -> None
+        self._entries.pop(key, None)
+        self._entries[key] = (value, utils.get_current_timestamp() + ttl.total_seconds())
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+@attr.s
+class Heartbeat(object):
+    """Context manager calling `beat` periodically in a daemon thread, until `beat` returns False."""
+
+    beat = attr.ib(type=Callable[[], Any])
+    interval = attr.ib(type=float)
+    _stopped = attr.ib(init=False, factory=threading.Event, repr=False)
+    _thread = attr.ib(None, init=False, type=threading.Thread, repr=False)
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, name="kiwicache-heartbeat")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            if self.beat() is False:
+                return
+
+
+@attr.s
+class BackgroundCall(object):
+    """Call of `func` in a daemon thread, which more callers can wait for with a timeout."""
+
+    func = attr.ib(type=Callable[[], Any])
+    _thread = attr.ib(init=False, type=threading.Thread, repr=False)
+    _error = attr.ib(None, init=False, type=Exception)
+
+    def __attrs_post_init__(self):
+        self._thread = threading.Thread(target=self._run, name="kiwicache-background-call")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def wait(self, timeout):
+        # type: (float) -> bool
+        """Wait for the call at most `timeout` seconds.
+
+        :return: whether the call is finished
+        :raises Exception: raised by the finished call
+        """
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            return False
+        if self._error is not None:
+            raise self._error  # pylint: disable=raising-bad-type
+        return True
+
+    def _run(self):
+        try:
+            self.func()
+        except Exception as e:  # pylint: disable=broad-except
+            self._error = e
+
+
+BLOOM_FILTER_HEADER = struct.Struct("<QB")
+
+
+@attr.s(eq=False)
+class BloomFilter(object):
+    """Compact set of keys, its membership test has false positives at about the given rate but no false negatives.
+
+    Keys are compared by their string value, like keys of items stored in redis.
+    """
+
+    size = attr.ib(type=int)
+    hash_count = attr.ib(type=int)
+    _bits = attr.ib(None, type=bytearray, repr=False)
+
+    def __attrs_post_init__(self):
+        if self._bits is None:
+            self._bits = bytearray((self.size + 7) // 8)
+        elif len(self._bits) != (self.size + 7) // 8:
+            raise ValueError("Size of the bloom filter does not match its bits.")
+
+    @classmethod
+    def from_keys(cls, keys, error_rate):
+        # type: (Iterable[Any], float) -> BloomFilter
+        """Create the filter of the keys with the optimal size and number of hashes for the false positive rate."""
+        keys = list(keys)
+        count = max(len(keys), 1)
+        size = max(int(math.ceil(-count * math.log(error_rate) / math.log(2) ** 2)), 8)
+        bloom_filter = cls(size, max(int(round(size / float(count) * math.log(2))), 1))
+        for key in keys:
+            bloom_filter.add(key)
+        return bloom_filter
+
+    def _positions(self, key):
+        # type: (Any) -> List[int]
+        digest = hashlib.sha1(_text_type(key).encode("utf-8")).digest()
+        first, second = struct.unpack("<QQ", digest[:16])
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, key):
+        # type: (Any) -> None
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def dumps(self):
+        # type: () -> bytes
+        return BLOOM_FILTER_HEADER.pack(self.size, self.hash_count) + bytes(self._bits)
+
+    @classmethod
+    def loads(cls, value):
+        # type: (bytes) -> BloomFilter
+        """Load the filter encoded by `dumps`.
+
+        :raises ValueError: if the value is not an encoded filter
+        """
+        try:
+            size, hash_count = BLOOM_FILTER_HEADER.unpack_from(value)
+        except struct.error as e:
+            raise ValueError(str(e))
+        return cls(size, hash_count, bytearray(value[BLOOM_FILTER_HEADER.size :]))
+
+
+class CircuitOpenError(redis.exceptions.RedisError):
+    """Redis is not called because its circuit breaker is open."""
+
+
+CONNECTION_ERRORS = (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError)
+"""Errors of redis clients counted as failures by circuit breakers, other errors mean redis is reachable."""
+
+
+@attr.s
+class CircuitBreaker(object):
+    """Stops calls of a failing client for `reset_timeout` after `failure_threshold` failures in a row.
+
+    After the timeout one probing call is let through (half-open state), its success closes the breaker,
+    otherwise the next probe is let through after another `reset_timeout`. With `failure_threshold` None
+    the breaker never opens.
+    """
+
+    failure_threshold = attr.ib(5, type=Optional[int])
+    reset_timeout = attr.ib(timedelta(seconds=10), type=timedelta)
+    _failures = attr.ib(0, init=False, type=int)
+    _opened_at = attr.ib(None, init=False, type=float)
+    _lock = attr.ib(init=False, factory=threading.Lock, repr=False)
+
+    @property
+    def is_open(self):
+        # type: () -> bool
+        """Whether calls are stopped and no probe is due."""
+        return self._opened_at is not None and not self._is_probe_due()
+
+    def allow(self):
+        # type: () -> bool
+        """Return whether the client can be called, in half-open state only the first caller is allowed."""
+        if self._opened_at is None:
+            return True
+        with self._lock:
+            if not self._is_probe_due():
+                return False
+            self._opened_at = utils.get_current_timestamp()
+            return True
+
+    @contextmanager
+    def guard(self, errors=CONNECTION_ERRORS, open_error=CircuitOpenError):
+        # type: (Tuple[Type[Exception], ...], Type[Exception]) -> Iterator[None]
+        """Guard a call of the client, its connection `errors` are recorded as failures.
+
+        :raises open_error: if the breaker is open, the client must not be called then
+        """
+        if not self.allow():
+            raise open_error()
+        try:
+            yield
+        except errors:
+            self.record_failure()
+            raise
+        self.record_success()
+
+    def record_success(self):
+        # type: () -> None
+        if self._failures:
+            with self._lock:
+                self._failures = 0
+                self._opened_at = None
+
+    def record_failure(self):
+        # type: () -> None
+        if self.failure_threshold is None:
+            return
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._opened_at = utils.get_current_timestamp()
+
+    def _is_probe_due(self):
+        # type: () -> bool
+        return self._opened_at + self.reset_timeout.total_seconds() <= utils.get_current_timestamp()
+
+
+circuit_breakers = weakref.WeakKeyDictionary()  # type: weakref.WeakKeyDictionary
+"""Circuit breakers of redis clients, add a breaker of a client to enable it."""
+
+_DISABLED_CIRCUIT_BREAKER = CircuitBreaker(failure_threshold=None)
+
+
+def get_circuit_breaker(client):
+    # type: (Any) -> CircuitBreaker
+    """Get circuit breaker of the redis client shared by all caches using it, a disabled one if it has none."""
+    return circuit_breakers.get(client, _DISABLED_CIRCUIT_BREAKER)
@@ -3,45 +3,102 @@ from __future__ import absolute_import, print_function
 import datetime
 from decimal import Decimal
 import enum
-from functools import partial
+import inspect
 import json
+import sys
 import time
-from typing import Any, List, Tuple, Union  # pylint: disable=unused-import
+from typing import Any, Callable, Dict, Iterator, List, Tuple, Union  # pylint: disable=unused-import
 
 import attr
 import simplejson
 
+MASKED_VALUE = "-- MASKED --"
+MASKED_WORDS = ("secret", "token", "password", "key")
+UNMASKED_KEYS = frozenset({"booking_token", "public_key", "idempotency_key"})
+NATIVE_TYPES = frozenset({str, int, float, bool, type(None)})
 
-def default_encoder(obj):  # pylint: disable=method-hidden
-    """Default encoder used for dumps function."""
-    if isinstance(obj, Decimal):
-        return str(float(obj))
 
-    if hasattr(obj, "isoformat"):  # handles both date and datetime objects
-        return str(obj)
+def _encode_decimal(obj):
+    return str(float(obj))
 
-    if isinstance(obj, set):
-        return list(obj)
 
-    if isinstance(obj, enum.Enum):
-        return obj.name
+def _encode_enum(obj):
+    return obj.name
 
-    try:
-        # attrs objects can appear when logging stuff
-        return attr.asdict(obj, dict_factory=masked_dict)
-    except attr.exceptions.NotAnAttrsClassError:
-        pass
 
-    try:
-        obj_dict = obj.asdict()
-    except AttributeError:
-        pass
-    else:
-        return masked_dict(list(obj_dict.items()))
+def _encode_attrs(obj):
+    # attrs objects can appear when logging stuff
+    return attr.asdict(obj, dict_factory=masked_dict)
+
 
+def _encode_asdict(obj):
+    return masked_dict(list(obj.asdict().items()))
+
+
+def _not_serializable(obj):
     raise TypeError(repr(obj) + " is not JSON serializable")
 
 
+class EncoderRegistry(object):
+    """Registry of handlers encoding values not serializable by json per type.
+
+    The handler of a type is resolved once (from the handlers registered for the type or its base classes,
+    or from the generic checks) and cached, so `encode` of each value costs a single dict lookup.
+    """
+
+    def __init__(self):
+        self._handlers = {}  # type: Dict[type, Callable[[Any], Any]]
+        self._resolved = {}  # type: Dict[type, Callable[[Any], Any]]
+        self.encode = self._create_encode()
+
+    def register(self, cls, handler):
+        # type: (type, Callable[[Any], Any]) -> None
+        """Register a handler converting instances of `cls` and its subclasses to a serializable value."""
+        self._handlers[cls] = handler
+        self._resolved.clear()
+
+    def _create_encode(self):
+        # type: () -> Callable[[Any], Any]
+        resolved = self._resolved
+        resolve = self._resolve
+
+        def encode(obj):
+            cls = type(obj)
+            handler = resolved.get(cls)
+            if handler is None:
+                handler = resolved[cls] = resolve(cls)
+            return handler(obj)
+
+        return encode
+
+    def _resolve(self, cls):
+        # type: (type) -> Callable[[Any], Any]
+        for base in inspect.getmro(cls):
+            if base in self._handlers:
+                return self._handlers[base]
+
+        if hasattr(cls, "isoformat"):  # date and datetime like objects
+            return str
+        if attr.has(cls):
+            return _encode_attrs
+        if hasattr(cls, "asdict"):
+            return _encode_asdict
+        return _not_serializable
+
+
+encoders = EncoderRegistry()
+encoders.register(Decimal, _encode_decimal)
+encoders.register(datetime.date, str)
+encoders.register(datetime.time, str)
+encoders.register(set, list)
+encoders.register(enum.Enum, _encode_enum)
+
+default_encoder = encoders.encode
+"""Default encoder used for dumps function."""
+register_encoder = encoders.register
+"""Register encoding of your own type used by default encoder, e.g. ``register_encoder(Money, str)``."""
+
+
 def masked_dict(data=None):
     # type: (Union[List[Tuple[Any, Any]], dict, None]) -> dict
     """Return a dict with dangerous looking key/value pairs masked."""
@@ -50,15 +107,13 @@ def masked_dict(data=None):
     if isinstance(data, dict):
         data = data.items()
 
-    blacklist = {"secret", "token", "password", "key"}
-    whitelist = {"booking_token", "public_key", "idempotency_key"}
+    return {key: MASKED_VALUE if _is_masked(key) else value for key, value in data}
+
 
-    return {
-        key: (
-            "-- MASKED --" if key.lower() not in whitelist and any(word in key.lower() for word in blacklist) else value
-        )
-        for key, value in data
-    }
+def _is_masked(key):
+    # type: (str) -> bool
+    lowered_key = key.lower()
+    return lowered_key not in UNMASKED_KEYS and any(word in lowered_key for word in MASKED_WORDS)
 
 
 def json_encoder(obj):
@@ -72,10 +127,107 @@ def json_encoder(obj):
 def jsonify(obj):
     """Try to convert python object to encodable by default encoder.
 
+    The result is the same as of loading the object dumped to json, without the round trip.
     :param obj: Python object to convert
     """
-    return json.loads(json.dumps(obj, default=default_encoder))
+    if sys.version_info < (3, 0):
+        return json.loads(json.dumps(obj, default=default_encoder))
+    return _jsonify(obj)
+
+
+def _jsonify(obj):
+    cls = type(obj)
+    if cls in NATIVE_TYPES:
+        return obj
+    if cls is dict:
+        return {key if type(key) is str else _jsonify_key(key): _jsonify(value) for key, value in obj.items()}
+    if cls is list or cls is tuple:
+        return [_jsonify(value) for value in obj]
+
+    # the same order of checks as in json encoder, subclasses are converted to their base types
+    if isinstance(obj, str):
+        return str.__str__(obj)
+    if isinstance(obj, int):
+        return int(int.__repr__(obj))
+    if isinstance(obj, float):
+        return float(float.__repr__(obj))
+    if isinstance(obj, (list, tuple)):
+        return [_jsonify(value) for value in obj]
+    if isinstance(obj, dict):
+        return {_jsonify_key(key): _jsonify(value) for key, value in obj.items()}
+    return _jsonify(default_encoder(obj))
+
+
+def _jsonify_key(key):
+    if isinstance(key, str):
+        return str.__str__(key)
+    if key is True:
+        return "true"
+    if key is False:
+        return "false"
+    if key is None:
+        return "null"
+    if isinstance(key, float):
+        return _jsonify_float_key(key)
+    if isinstance(key, int):
+        return int.__repr__(key)
+    raise TypeError("keys must be str, int, float, bool or None, not {}".format(type(key).__name__))
+
+
+def _jsonify_float_key(key):
+    if key != key:
+        return "NaN"
+    if key in (float("inf"), float("-inf")):
+        return "Infinity" if key > 0 else "-Infinity"
+    return float.__repr__(key)
 
 
 loads = simplejson.loads
-dumps = partial(simplejson.dumps, default=default_encoder)
+
+
+def dumps(obj, **kwargs):
+    # type: (Any, **Any) -> str
+    """Serialize `obj` to json using `default_encoder`, defined on module level so it can be sent to other processes."""
+    kwargs.setdefault("default", default_encoder)
+    return simplejson.dumps(obj, **kwargs)
+
+
+def data_encoder(obj):
+    # type: (Any) -> Any
+    """Encoder of cached data, which converts attrs objects and frozensets like `attr.asdict` without masking."""
+    if attr.has(type(obj)):
+        return attr.asdict(obj)
+    if isinstance(obj, frozenset):
+        return list(obj)
+    return default_encoder(obj)
+
+
+def dumps_data(obj):
+    # type: (Any) -> str
+    """Serialize cached data to json without copying them by `attr.asdict`, the output is the same."""
+    return simplejson.dumps(obj, default=data_encoder, namedtuple_as_object=False)
+
+
+def iterencode_data(obj):
+    # type: (Any) -> Iterator[str]
+    """Serialize cached data to json by parts, which joined are the same as the output of `dumps_data`.
+
+    Items of a top level dict or list are encoded one by one, so the whole output is never held in memory
+    (iterencode of simplejson encodes everything at once by its C speedups).
+    """
+    if isinstance(obj, dict):
+        yield "{"
+        separator = ""
+        for key, value in obj.items():
+            yield separator + dumps_data({key: value})[1:-1]
+            separator = ", "
+        yield "}"
+    elif isinstance(obj, (list, tuple)):
+        yield "["
+        separator = ""
+        for value in obj:
+            yield separator + dumps_data(value)
+            separator = ", "
+        yield "]"
+    else:
+        yield dumps_data(obj)
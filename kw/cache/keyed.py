@@ -0,0 +1,349 @@
+from datetime import timedelta
+import hashlib
+import re
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple  # pylint: disable=unused-import
+
+import attr
+import redis
+
+from . import utils
+from .base import BaseKiwiCache
+from .helpers import BloomFilter, LRUCache
+
+MISSING = object()  # item is not in the local cache
+ABSENT = object()  # item does not exist in the source
+ABSENT_MARKER = b""  # cached value of items which do not exist in the source, no json encoding is empty
+
+
+@attr.s
+class KeyedKiwiCache(BaseKiwiCache):
+    """Caches items of large resources from expensive sources per key to Redis and to memory.
+
+    Workflow for get item is:
+    1. If the item is in the local LRU cache and not expired then return it
+    2. If the item exists in redis then return it
+    3. Load missing items from source in batches, save them to redis and return them
+    Items which do not exist in the source are remembered locally and in redis until they expire in `reload_ttl`,
+    so workers waiting for the refill of the same keys do not load them from source again.
+
+    With `key_filter_error_rate` keys missing in the source are answered locally without calling redis
+    by a bloom filter of all keys returned by `load_source_keys`. The filter is built by one worker, stored
+    in redis until it expires in `cache_ttl` and reloaded by workers each `reload_ttl`, so keys added
+    to the source meanwhile are found after the filter expires.
+
+    Base instance attributes:
+    - `reload_ttl` - timedelta for local item expiration time
+    - `max_size` - maximum number of items held in memory
+    - `batch_size` - maximum number of keys passed to one `load_from_source_many` call
+    - `key_filter_error_rate` - false positive rate of the filter of keys existing in the source, None disables it
+    - `_items` - local LRU cache of items
+    - `_key_filter` - local filter of keys existing in the source
+
+    Each subclass must implement `load_from_source_many` method, `load_source_keys` if the key filter is used.
+    Method which can be typically overridden by subclasses:
+    - `_process_refill_error`
+
+    For another attributes and methods see parent classes docs.
+    """
+
+    reload_ttl = attr.ib(timedelta(minutes=1), type=timedelta, validator=attr.validators.instance_of(timedelta))
+    max_size = attr.ib(10000, type=int, validator=attr.validators.instance_of(int))
+    batch_size = attr.ib(100, type=int, validator=attr.validators.instance_of(int))
+    key_filter_error_rate = attr.ib(
+        None, type=Optional[float], validator=attr.validators.optional(attr.validators.instance_of(float))
+    )
+    _items = attr.ib(init=False, type=LRUCache, repr=False)
+    _key_filter = attr.ib(None, init=False, type=Optional[BloomFilter], repr=False)
+    _key_filter_expires_at = attr.ib(0.0, init=False, type=float, repr=False)
+
+    # class attributes
+    lock_check_period = 0.025
+
+    def __attrs_post_init__(self):
+        super(KeyedKiwiCache, self).__attrs_post_init__()
+        self._items = LRUCache(self.max_size)
+
+    @reload_ttl.validator
+    def reload_ttl_validator(self, attribute, value):
+        if self._cache_ttl < value:
+            raise AttributeError("The parameter cache_ttl has to be greater then reload_ttl.")
+
+    @property
+    def _cache_ttl(self):
+        # type: () -> timedelta
+        return self.cache_ttl if self.cache_ttl else self.reload_ttl * 10
+
+    def __getitem__(self, key):
+        items = self._get_items([key])
+        if key not in items:
+            return self.__missing__(key)
+        return items[key]
+
+    def __missing__(self, key):
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self._get_items([key])
+
+    def get(self, key, default=None):
+        return self._get_items([key]).get(key, default)
+
+    def get_many(self, keys, default=None):
+        # type: (Iterable[Any], Any) -> List[Any]
+        """Get values of the given keys, all items missing locally are loaded from cache in one round trip.
+
+        :param keys: keys to look up
+        :param default: value returned for missing keys
+        :return: values in the order of the given keys
+        """
+        keys = list(keys)
+        items = self._get_items(keys)
+        return [items.get(key, default) for key in keys]
+
+    def iter_items(self, count=None):
+        # type: (Optional[int]) -> Iterator[Tuple[str, Any]]
+        """Iterate over all items stored in cache without keeping them in memory.
+
+        Keys are scanned by a cursor and values are loaded in batches of about `count` (`batch_size` by default)
+        items, items are not loaded from source nor kept locally. Keys are returned as strings, an item can be
+        returned more than once when the items change during the iteration (see redis SCAN).
+        :raises redis.exceptions.RedisError: if redis fails during the iteration
+        """
+        cursor = None
+        while cursor != 0:
+            with self._redis_call():
+                cursor, item_keys = self.resources_redis.scan(
+                    cursor=cursor or 0, match=self._item_key_pattern, count=count or self.batch_size
+                )
+                values = self.resources_redis.mget(item_keys) if item_keys else []
+            for item_key, value in zip(item_keys, values):
+                if value:
+                    yield self._parse_item_key(item_key), self.json.loads(value)
+
+    @property
+    def _item_key_pattern(self):
+        # type: () -> str
+        """Pattern of redis SCAN matching keys of all items."""
+        return re.sub(r"([\\\[\]*?])", r"\\\1", self._item_key("")) + "*"
+
+    def _parse_item_key(self, item_key):
+        # type: (bytes) -> str
+        """Get key of the item from its redis key."""
+        return item_key.decode("utf-8")[len(self._item_key("")) :]
+
+    def _get_items(self, keys):
+        # type: (Iterable[Any]) -> Dict[Any, Any]
+        """Get existing items of the given keys, items missing locally are reloaded."""
+        items = {}
+        missing_keys = []
+        for key in keys:
+            value = self._items.get(key, MISSING)
+            if value is MISSING:
+                missing_keys.append(key)
+            elif value is not ABSENT:
+                items[key] = value
+
+        if missing_keys:
+            missing_keys = self._filter_keys(missing_keys)
+        if missing_keys:
+            items.update(self.reload_items(missing_keys))
+        return items
+
+    def _filter_keys(self, keys):
+        # type: (List[Any]) -> List[Any]
+        """Leave out keys which do not exist in the source according to the key filter."""
+        if self.key_filter_error_rate is None:
+            return keys
+        if self._key_filter_expires_at <= utils.get_current_timestamp():
+            self._key_filter = self.load_key_filter_from_cache() or self.refill_key_filter()
+            self._key_filter_expires_at = utils.get_current_timestamp() + self.reload_ttl.total_seconds()
+        if self._key_filter is None:
+            return keys
+        return [key for key in keys if key in self._key_filter]
+
+    def load_from_source_many(self, keys):
+        # type: (List[Any]) -> Dict[Any, Any]
+        """Get items of the given keys from our expensive source, keys which do not exist are left out."""
+        raise NotImplementedError()
+
+    def load_source_keys(self):
+        # type: () -> Iterable[Any]
+        """Get all keys existing in our expensive source for the key filter."""
+        raise NotImplementedError()
+
+    def load_key_filter_from_cache(self):
+        # type: () -> Optional[BloomFilter]
+        """Load the filter of keys existing in the source from cache."""
+        try:
+            with self._redis_call():
+                value = self.resources_redis.get(self._key_filter_key)
+        except redis.exceptions.RedisError:
+            self._process_cache_error("kiwicache.load_failed")
+            return None
+
+        if value is None:
+            return None
+        try:
+            return BloomFilter.loads(value)
+        except ValueError:
+            self._log_warning("kiwicache.malformed_cache_data")
+            return None
+
+    def refill_key_filter(self):
+        # type: () -> Optional[BloomFilter]
+        """Refill cache with the filter of keys existing in the source.
+
+        The filter is not waited for while another worker builds it, keys are looked up in redis meanwhile.
+        :return: the filter, None if it is not built by this worker
+        """
+        lock_key = "{}:filter".format(self._refill_lock_key)
+        if not self._get_refill_lock(lock_key):
+            return None
+
+        try:
+            try:
+                with self._refill_lock_heartbeat(lock_key):
+                    key_filter = BloomFilter.from_keys(self.load_source_keys(), self.key_filter_error_rate)
+            except Exception as e:
+                self._process_refill_error("kiwicache.source_exception", e)
+                return None
+
+            try:
+                with self._redis_call():
+                    self.resources_redis.set(self._key_filter_key, key_filter.dumps(), ex=self._get_cache_expiration())
+            except redis.exceptions.RedisError:
+                self._process_cache_error("kiwicache.save_failed")
+        finally:
+            self._release_refill_lock(lock_key)
+        return key_filter
+
+    def reload_items(self, keys):
+        # type: (List[Any]) -> Dict[Any, Any]
+        """Load items from cache, or if unavailable, from source and keep them locally.
+
+        :return: existing items of the given keys
+        """
+        items = self.load_items_from_cache(keys)
+        missing_keys = [key for key in keys if key not in items]
+        if missing_keys:
+            items.update(self.refill_items(missing_keys))
+
+        for key, value in items.items():
+            self._items.set(key, value, self.reload_ttl)
+        return {key: value for key, value in items.items() if value is not ABSENT}
+
+    def load_items_from_cache(self, keys):
+        # type: (List[Any]) -> Dict[Any, Any]
+        """Load items of the given keys from cache, `ABSENT` for keys which do not exist in the source."""
+        try:
+            with self._redis_call():
+                values = self.resources_redis.mget([self._item_key(key) for key in keys])
+        except redis.exceptions.RedisError:
+            self._process_cache_error("kiwicache.load_failed")
+            return {}
+
+        return {key: self._decode_item(value) for key, value in zip(keys, values) if value is not None}
+
+    def _decode_item(self, value):
+        # type: (bytes) -> Any
+        return self.json.loads(value) if value else ABSENT
+
+    def save_items_to_cache(self, items):
+        # type: (Dict[Any, Any]) -> None
+        """Save the provided items to cache, `ABSENT` items are saved as markers expiring in `reload_ttl`."""
+        if not items:
+            return
+
+        pipeline = self.resources_redis.pipeline(transaction=False)
+        for key, value in items.items():
+            if value is ABSENT:
+                pipeline.set(self._item_key(key), ABSENT_MARKER, ex=self.reload_ttl)
+            else:
+                pipeline.set(self._item_key(key), self.json.dumps(value), ex=self._get_cache_expiration())
+        try:
+            with self._redis_call():
+                pipeline.execute()
+        except redis.exceptions.RedisError:
+            self._process_cache_error("kiwicache.save_failed")
+        else:
+            self._increment_metric("success")
+
+    def refill_items(self, keys):
+        # type: (List[Any]) -> Dict[Any, Any]
+        """Refill cache with items of the given keys from source in batches.
+
+        :return: items of the given keys, `ABSENT` for keys which do not exist in the source
+        """
+        items = {}
+        for batch in utils.chunked(keys, self.batch_size):
+            items.update(self._refill_batch(batch))
+        return items
+
+    def _refill_batch(self, keys):
+        # type: (List[Any]) -> Dict[Any, Any]
+        """Refill cache with one batch of items from source."""
+        lock_key = self._get_batch_lock_key(keys)
+        has_lock, items = self._wait_for_batch_lock(keys, lock_key)
+        # the lock owner could not load all of them (it failed or redis is unavailable), so we load the rest
+        keys = [key for key in keys if key not in items]
+        if not keys:
+            return items
+
+        try:
+            try:
+                if has_lock:
+                    with self._refill_lock_heartbeat(lock_key):
+                        source_items = self.load_from_source_many(keys)
+                else:
+                    source_items = self.load_from_source_many(keys)
+            except Exception as e:
+                self._process_refill_error("kiwicache.source_exception", e)
+                return items
+
+            source_items = dict(source_items)
+            source_items.update((key, ABSENT) for key in keys if key not in source_items)
+            self.save_items_to_cache(source_items)
+        finally:
+            if has_lock:
+                self._release_refill_lock(lock_key)
+
+        items.update(source_items)
+        return items
+
+    def _get_batch_lock_key(self, keys):
+        # type: (List[Any]) -> str
+        """Refill lock key of a batch of keys, so only loads of the same keys wait for each other."""
+        item_keys = "\n".join(sorted(self._item_key(key) for key in keys))
+        return "{}:{}".format(self._refill_lock_key, hashlib.sha1(item_keys.encode("utf-8")).hexdigest())
+
+    def _wait_for_batch_lock(self, keys, lock_key):
+        # type: (List[Any], str) -> Tuple[Optional[bool], Dict[Any, Any]]
+        """Wait for lock or items saved to cache by the lock owner (handles multiple workers).
+
+        :return: Whether we got the lock or not (None if connection to redis failed) and items saved meanwhile
+        """
+        items = {}  # type: Dict[Any, Any]
+        lock_check_period = self.lock_check_period
+        while True:
+            has_lock = self._get_refill_lock(lock_key)
+            if has_lock is None or has_lock is True:
+                return has_lock, items
+
+            self._log_warning("kiwicache.refill_locked")
+            # let the lock owner finish
+            lock_check_period = min(lock_check_period * 2, self.refill_ttl.total_seconds())
+            time.sleep(lock_check_period)
+
+            items = self.load_items_from_cache(keys)
+            if len(items) == len(keys):
+                return False, items
+
+    def _process_refill_error(self, msg, exception=None):
+        """Process refill error.
+
+        Inherited classes can override this method.
+        :param msg: message
+        """
+        self._increment_metric("load_error")
+        self._log_exception(msg)
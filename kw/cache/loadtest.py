@@ -0,0 +1,368 @@
+"""Load test simulating a fleet of workers reading one cache from a local Redis.
+
+Run ``python -m kw.cache.loadtest --help`` for the options.
+"""
+
+import argparse
+import asyncio
+from collections import Counter, defaultdict
+from datetime import timedelta
+import math
+import multiprocessing
+import random
+import sys
+import threading
+import time
+from typing import Any, DefaultDict, Dict, List, Optional, Sequence
+
+import aioredis
+import attr
+import redis
+
+from .aio import AioKiwiCache
+from .base import KiwiCache
+from .helpers import CallAttemptException, ReadTimeoutError
+
+MODES = ("threads", "processes", "asyncio")
+
+
+class SourceError(Exception):
+    """Simulated failure of the source."""
+
+
+@attr.s
+class LoadTestConfig(object):
+    """Parameters of the load test, durations are in seconds."""
+
+    redis_url = attr.ib("redis://localhost:6379/0", type=str)
+    mode = attr.ib("threads", type=str, validator=attr.validators.in_(MODES))
+    workers = attr.ib(10, type=int)
+    duration = attr.ib(30.0, type=float)
+    interval = attr.ib(5.0, type=float)
+    read_interval = attr.ib(0.01, type=float)
+    reload_ttl = attr.ib(1.0, type=float)
+    refill_ttl = attr.ib(5.0, type=float)
+    cache_ttl = attr.ib(10.0, type=float)
+    source_delay = attr.ib(0.5, type=float)
+    source_failure_rate = attr.ib(0.0, type=float)
+    size = attr.ib(1000, type=int)
+
+    def cache_params(self) -> Dict[str, Any]:
+        return {
+            "reload_ttl": timedelta(seconds=self.reload_ttl),
+            "refill_ttl": timedelta(seconds=self.refill_ttl),
+            "cache_ttl": timedelta(seconds=self.cache_ttl),
+        }
+
+
+@attr.s
+class Stats(object):
+    """Events recorded by workers, grouped into intervals since the start of the load test."""
+
+    started_at = attr.ib(type=float)
+    interval = attr.ib(type=float)
+    latencies = attr.ib(factory=lambda: defaultdict(list), type=DefaultDict[int, List[float]])
+    counters = attr.ib(factory=lambda: defaultdict(Counter), type=DefaultDict[int, Counter])
+    source_calls = attr.ib(factory=list, type=List[float])
+
+    def add_latency(self, latency: float) -> None:
+        self.latencies[self.interval_index()].append(latency)
+
+    def increment(self, name: str, value: float = 1, timestamp: Optional[float] = None) -> None:
+        self.counters[self.interval_index(timestamp)][name] += value
+
+    def add_source_call(self) -> None:
+        self.source_calls.append(time.time())
+        self.increment("source_calls")
+
+    def merge(self, other: "Stats") -> None:
+        for index, latencies in other.latencies.items():
+            self.latencies[index].extend(latencies)
+        for index, counter in other.counters.items():
+            self.counters[index].update(counter)
+        self.source_calls.extend(other.source_calls)
+
+    def interval_index(self, timestamp: Optional[float] = None) -> int:
+        return int(((timestamp or time.time()) - self.started_at) // self.interval)
+
+
+@attr.s
+class StatsdRecorder(object):
+    """Replacement of `datadog.DogStatsd` counting metrics of caches by their status."""
+
+    stats = attr.ib(type=Stats)
+
+    def increment(self, metric: str, value: float = 1, tags: Sequence[str] = ()) -> None:
+        statuses = [tag.split(":", 1)[1] for tag in tags if tag.startswith("status:")]
+        self.stats.increment("{}.{}".format(metric, statuses[0] if statuses else "unknown"), value)
+
+
+class StatsMixin(object):
+    """Records warnings and errors of the cache into `stats` instead of logging them."""
+
+    stats = None  # type: Stats
+    size = 0
+
+    def _log_warning(self, msg: str) -> None:
+        self.stats.increment(msg)
+
+    _log_error = _log_exception = _log_warning
+
+    def _source_data(self, failure_rate: float) -> dict:
+        if random.random() < failure_rate:
+            self.stats.increment("source_errors")
+            raise SourceError()
+        return {"key{}".format(i): i for i in range(self.size)}
+
+
+@attr.s
+class LoadTestCache(StatsMixin, KiwiCache):
+    """Cache with a slow and unreliable source."""
+
+    stats = attr.ib(None, type=Stats)
+    source_delay = attr.ib(0.0, type=float)
+    source_failure_rate = attr.ib(0.0, type=float)
+    size = attr.ib(1000, type=int)
+
+    def load_from_source(self) -> dict:
+        self.stats.add_source_call()
+        time.sleep(self.source_delay)
+        return self._source_data(self.source_failure_rate)
+
+    def _wait_for_refill_lock(self) -> Optional[bool]:
+        start = time.time()
+        has_lock = super(LoadTestCache, self)._wait_for_refill_lock()
+        self.stats.increment("lock_wait_time", time.time() - start)
+        return has_lock
+
+
+@attr.s
+class AioLoadTestCache(StatsMixin, AioKiwiCache):
+    """Async cache with a slow and unreliable source."""
+
+    stats = attr.ib(None, type=Stats)
+    source_delay = attr.ib(0.0, type=float)
+    source_failure_rate = attr.ib(0.0, type=float)
+    size = attr.ib(1000, type=int)
+
+    async def load_from_source(self) -> dict:
+        self.stats.add_source_call()
+        await asyncio.sleep(self.source_delay)
+        return self._source_data(self.source_failure_rate)
+
+    async def _wait_for_refill_lock(self) -> Optional[bool]:
+        start = time.time()
+        has_lock = await super()._wait_for_refill_lock()
+        self.stats.increment("lock_wait_time", time.time() - start)
+        return has_lock
+
+
+def create_cache(cache_class: type, config: LoadTestConfig, client: Any, stats: Stats) -> Any:
+    cache = cache_class(
+        resources_redis=client,
+        stats=stats,
+        source_delay=config.source_delay,
+        source_failure_rate=config.source_failure_rate,
+        size=config.size,
+        **config.cache_params()
+    )
+    cache.statsd = StatsdRecorder(stats)
+    return cache
+
+
+def run_worker(config: LoadTestConfig, client: redis.StrictRedis, stats: Stats) -> None:
+    cache = create_cache(LoadTestCache, config, client, stats)
+    deadline = stats.started_at + config.duration
+    while time.time() < deadline:
+        start = time.time()
+        try:
+            cache.get("key{}".format(random.randrange(config.size)))
+        except (CallAttemptException, ReadTimeoutError):
+            stats.increment("read_errors")
+        stats.add_latency(time.time() - start)
+        time.sleep(config.read_interval)
+
+
+def run_process_worker(config: LoadTestConfig, started_at: float, queue: multiprocessing.Queue) -> None:
+    stats = Stats(started_at, config.interval)
+    run_worker(config, redis.StrictRedis.from_url(config.redis_url), stats)
+    queue.put(stats)
+
+
+async def run_aio_worker(config: LoadTestConfig, client: aioredis.Redis, stats: Stats) -> None:
+    cache = create_cache(AioLoadTestCache, config, client, stats)
+    deadline = stats.started_at + config.duration
+    while time.time() < deadline:
+        start = time.time()
+        try:
+            await cache.get("key{}".format(random.randrange(config.size)))
+        except (CallAttemptException, ReadTimeoutError):
+            stats.increment("read_errors")
+        stats.add_latency(time.time() - start)
+        await asyncio.sleep(config.read_interval)
+
+
+async def run_aio_workers(config: LoadTestConfig, started_at: float) -> List[Stats]:
+    client = await aioredis.create_redis_pool(config.redis_url, maxsize=config.workers)
+    try:
+        worker_stats = [Stats(started_at, config.interval) for _ in range(config.workers)]
+        await asyncio.gather(*[run_aio_worker(config, client, stats) for stats in worker_stats])
+        return worker_stats
+    finally:
+        client.close()
+        await client.wait_closed()
+
+
+def sample_redis_ops(client: redis.StrictRedis, stats: Stats, stopped: threading.Event) -> None:
+    """Record the number of commands processed by Redis in each interval."""
+    processed, sampled_at = client.info("stats")["total_commands_processed"], time.time()
+    while not stopped.wait(min(1.0, stats.interval)):
+        current = client.info("stats")["total_commands_processed"]
+        stats.increment("redis_ops", current - processed, timestamp=sampled_at)
+        processed, sampled_at = current, time.time()
+
+
+def run(config: LoadTestConfig) -> Stats:
+    """Run workers reading the cache for `duration` and return their merged stats."""
+    client = redis.StrictRedis.from_url(config.redis_url)
+    for cache_class in (LoadTestCache, AioLoadTestCache):
+        client.delete(*["{}:{}".format(prefix, cache_class.__name__) for prefix in ("resource", "meta", "lock")])
+
+    started_at = time.time()
+    stats = Stats(started_at, config.interval)
+    stopped = threading.Event()
+    sampler = threading.Thread(target=sample_redis_ops, args=(client, stats, stopped), name="kiwicache-loadtest")
+    sampler.start()
+    try:
+        if config.mode == "threads":
+            worker_stats = [Stats(started_at, config.interval) for _ in range(config.workers)]
+            threads = [threading.Thread(target=run_worker, args=(config, client, stats)) for stats in worker_stats]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        elif config.mode == "processes":
+            queue = multiprocessing.Queue()
+            processes = [
+                multiprocessing.Process(target=run_process_worker, args=(config, started_at, queue))
+                for _ in range(config.workers)
+            ]
+            for process in processes:
+                process.start()
+            worker_stats = [queue.get() for _ in processes]
+            for process in processes:
+                process.join()
+        else:
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            try:
+                worker_stats = loop.run_until_complete(run_aio_workers(config, started_at))
+            finally:
+                loop.close()
+                asyncio.set_event_loop(None)
+    finally:
+        stopped.set()
+        sampler.join()
+
+    for single_stats in worker_stats:
+        stats.merge(single_stats)
+    return stats
+
+
+def count_refills(source_calls: List[float], refill_ttl: float) -> List[float]:
+    """Group source calls into refills, calls started within `refill_ttl` after the first one belong to it.
+
+    :return: start timestamps of the refills
+    """
+    refills = []  # type: List[float]
+    for timestamp in sorted(source_calls):
+        if not refills or timestamp - refills[-1] > refill_ttl:
+            refills.append(timestamp)
+    return refills
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(math.ceil(fraction * len(values))) - 1)]
+
+
+def format_report(stats: Stats, config: LoadTestConfig) -> str:
+    """Format the stats as a table with one row per interval followed by totals."""
+    refills = Counter(
+        stats.interval_index(timestamp) for timestamp in count_refills(stats.source_calls, config.refill_ttl)
+    )
+    header = "{:>8} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8} {:>10}".format(
+        "time", "reads", "p50 ms", "p90 ms", "p99 ms", "max ms", "source", "refills", "waits", "errors", "redis op/s"
+    )
+    lines = [header]
+    intervals = int(math.ceil(config.duration / config.interval))
+    for index in range(intervals):
+        latencies = [latency * 1000 for latency in stats.latencies.get(index, [])]
+        counter = stats.counters.get(index, Counter())
+        interval_duration = min(config.interval, config.duration - index * config.interval)
+        lines.append(
+            "{:>7.1f}s {:>8} {:>8.2f} {:>8.2f} {:>8.2f} {:>8.2f} {:>8} {:>8} {:>8} {:>8} {:>10.0f}".format(
+                index * config.interval,
+                len(latencies),
+                percentile(latencies, 0.5),
+                percentile(latencies, 0.9),
+                percentile(latencies, 0.99),
+                max(latencies) if latencies else float("nan"),
+                counter["source_calls"],
+                refills[index],
+                counter["kiwicache.refill_locked"],
+                counter["read_errors"] + counter["source_errors"],
+                counter["redis_ops"] / interval_duration,
+            )
+        )
+
+    totals = Counter()  # type: Counter
+    for counter in stats.counters.values():
+        totals.update(counter)
+    total_refills = sum(refills.values())
+    lines.append("")
+    lines.append(
+        "source calls per refill: {:.2f} ({} calls, {} refills)".format(
+            totals["source_calls"] / total_refills if total_refills else float("nan"),
+            totals["source_calls"],
+            total_refills,
+        )
+    )
+    lines.append("time waiting for refill lock: {:.2f}s".format(totals["lock_wait_time"]))
+    for name in sorted(totals):
+        if name.startswith("kiwicache"):
+            lines.append("{}: {}".format(name, totals[name]))
+    return "\n".join(lines)
+
+
+def parse_config(argv: Optional[Sequence[str]] = None) -> LoadTestConfig:
+    defaults = LoadTestConfig()
+    parser = argparse.ArgumentParser(prog="python -m kw.cache.loadtest", description=__doc__.splitlines()[0])
+    parser.add_argument("--redis-url", default=defaults.redis_url)
+    parser.add_argument("--mode", choices=MODES, default=defaults.mode, help="how the workers are run")
+    parser.add_argument("--workers", type=int, default=defaults.workers, help="number of workers")
+    parser.add_argument("--duration", type=float, default=defaults.duration, help="duration of the test")
+    parser.add_argument("--interval", type=float, default=defaults.interval, help="length of reported intervals")
+    parser.add_argument("--read-interval", type=float, default=defaults.read_interval, help="pause between reads")
+    parser.add_argument("--reload-ttl", type=float, default=defaults.reload_ttl)
+    parser.add_argument("--refill-ttl", type=float, default=defaults.refill_ttl)
+    parser.add_argument("--cache-ttl", type=float, default=defaults.cache_ttl, help="at least one second")
+    parser.add_argument("--source-delay", type=float, default=defaults.source_delay, help="duration of source load")
+    parser.add_argument(
+        "--source-failure-rate", type=float, default=defaults.source_failure_rate, help="probability of source failure"
+    )
+    parser.add_argument("--size", type=int, default=defaults.size, help="number of items in the data bundle")
+    return LoadTestConfig(**vars(parser.parse_args(argv)))
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    config = parse_config(argv)
+    stats = run(config)
+    print(format_report(stats, config))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+from collections import OrderedDict
+import threading
+from typing import Any, Tuple  # pylint: disable=unused-import
+
+import attr
+
+
+@attr.s
+class MemoryBudget(object):
+    """Process-wide limit of memory used by local data of caches.
+
+    Caches reserve memory for their data on each reload, the least recently used caches are evicted
+    to make room and they reload their data on the next access. Caches with data larger than the whole
+    budget are refused and read their data from redis on each access.
+
+    Base instance attributes:
+    - `max_bytes` - maximum estimated size of local data of all caches in bytes
+    - `_usages` - sizes of local data of caches, the least recently used first
+    - `_used_bytes` - running total of `_usages`
+    """
+
+    max_bytes = attr.ib(None, type=int, validator=attr.validators.instance_of(int))
+    _usages = attr.ib(init=False, factory=OrderedDict, repr=False)
+    _used_bytes = attr.ib(init=False, default=0, repr=False)
+    _lock = attr.ib(init=False, factory=threading.Lock, repr=False)
+
+    @property
+    def used_bytes(self):
+        # type: () -> int
+        return self._used_bytes
+
+    def touch(self, cache):
+        # type: (Any) -> None
+        """Mark the cache as recently used."""
+        with self._lock:
+            usage = self._usages.pop(id(cache), None)
+            if usage is not None:
+                self._usages[id(cache)] = usage
+
+    def reserve(self, cache, size):
+        # type: (Any, int) -> bool
+        """Reserve memory for local data of the cache, evicting the least recently used caches if needed.
+
+        :param size: estimated size of the local data in bytes
+        :return: Whether the cache can keep its data in memory
+        """
+        with self._lock:
+            self._pop_usage(id(cache))
+            if size > self.max_bytes:
+                return False
+
+            evicted = []
+            while self._usages and self._used_bytes + size > self.max_bytes:
+                evicted.append(self._pop_usage(next(iter(self._usages))))
+            self._usages[id(cache)] = (cache, size)
+            self._used_bytes += size
+
+        for evicted_cache in evicted:
+            evicted_cache._evict()  # pylint: disable=protected-access
+        return True
+
+    def release(self, cache):
+        # type: (Any) -> None
+        """Release memory reserved by the cache."""
+        with self._lock:
+            self._pop_usage(id(cache))
+
+    def _pop_usage(self, cache_id):
+        # type: (int) -> Any
+        """Remove usage of the cache from the running total, the lock must be held."""
+        cache, size = self._usages.pop(cache_id, (None, 0))
+        self._used_bytes -= size
+        return cache
@@ -0,0 +1,63 @@
+"""Loading of caches in the master process of pre-fork servers, so the forked workers share their data."""
+
+from datetime import datetime
+import gc
+import os
+import threading
+from typing import Iterable, List, Optional  # pylint: disable=unused-import
+import uuid
+
+from . import utils
+from .base import KiwiCache
+from .helpers import circuit_breakers
+
+_snapshot_caches = []  # type: List[KiwiCache]
+_at_fork_registered = False
+
+
+def warm_up(caches=None):
+    # type: (Optional[Iterable[KiwiCache]]) -> None
+    """Load data of the caches (all `KiwiCache.instances` by default) before forking workers.
+
+    The loaded objects are frozen from the garbage collector (Python 3.7+), so its passes do not write
+    to their memory pages and the pages stay shared by the workers. The workers use the loaded data
+    until their first reload, `after_fork` is called in them automatically where `os.register_at_fork`
+    exists, otherwise call it in the post fork hook of your server.
+    """
+    global _at_fork_registered  # pylint: disable=global-statement
+    caches = list(KiwiCache.instances.values() if caches is None else caches)
+    for cache in caches:
+        cache.maybe_reload()
+    _snapshot_caches[:] = caches
+
+    if hasattr(gc, "freeze"):
+        gc.freeze()
+    if hasattr(os, "register_at_fork") and not _at_fork_registered:
+        os.register_at_fork(after_in_child=after_fork)  # pylint: disable=no-member
+        _at_fork_registered = True
+
+
+def after_fork(caches=None, reload_jitter=0.5):
+    # type: (Optional[Iterable[KiwiCache]], float) -> None
+    """Prepare the caches (the warmed up ones by default) for use in a forked worker.
+
+    Connections and locks of the master are dropped, refill lock tokens are regenerated, so workers
+    do not own locks of each other, and expiration of local data is set randomly shortened
+    by `reload_jitter` fraction of `reload_ttl`, so workers do not reload them at the same moment.
+    """
+    caches = list(_snapshot_caches if caches is None else caches)
+    clients = {}
+    for cache in caches:
+        cache._lock_token = uuid.uuid4().hex
+        cache._background_reload = None
+        cache._background_reload_lock = threading.Lock()
+        cache.expires_at = datetime.utcnow() + utils.jitter_timedelta(cache.reload_ttl, reload_jitter)
+        for client in [cache.resources_redis] + cache.read_redis:
+            clients[id(client)] = client
+
+    for client in clients.values():
+        client.connection_pool.reset()
+    for circuit_breaker in circuit_breakers.values():
+        circuit_breaker._lock = threading.Lock()
+    if KiwiCache.memory_budget is not None:
+        KiwiCache.memory_budget._lock = threading.Lock()
@@ -0,0 +1,258 @@
+"""Redis helpers of cache refills: lua scripts, the refill lock, the refill backoff and streaming of data."""
+
+from datetime import timedelta  # pylint: disable=unused-import
+from functools import partial
+import hashlib
+import random
+import time
+from typing import Any, List, Optional, Tuple, TYPE_CHECKING  # pylint: disable=unused-import
+
+import redis
+
+from . import scripts, utils
+from .helpers import Heartbeat
+
+if TYPE_CHECKING:
+    from .base import CacheRecord  # pylint: disable=cyclic-import
+
+STREAM_PREFIX = b'{"data": '
+
+
+class RefillMixin(object):
+    """Refill helpers of `BaseKiwiCache` using its redis client, keys and attributes."""
+
+    def _stream_to_cache(self, cache_record):
+        # type: (CacheRecord) -> None
+        """Encode the cache record and send it to redis in chunks, so the whole payload is never held in memory.
+
+        The chunks are appended to a separate key, which replaces the cached data once it is complete.
+        """
+        expiration = self._get_cache_expiration()
+        data_hash = hashlib.sha1()
+        stream_key = self._stream_key
+        try:
+            with self._redis_call():
+                self.resources_redis.set(stream_key, STREAM_PREFIX, ex=self.refill_ttl)
+            sent_length = len(STREAM_PREFIX)
+            for chunk in utils.joined_chunks(self.json.iterencode_data(cache_record.data), self.stream_chunk_size):
+                encoded_chunk = chunk.encode("utf-8")
+                data_hash.update(encoded_chunk)
+                sent_length = self._append_chunk(stream_key, encoded_chunk, sent_length)
+                if sent_length is None:
+                    self._log_warning("kiwicache.stream_interrupted")
+                    return
+
+            if self._touch_if_unchanged(data_hash.hexdigest(), cache_record.timestamp, expiration):
+                with self._redis_call():
+                    self.resources_redis.delete(stream_key)
+                self._increment_metric("unchanged")
+                return
+
+            pipeline = self.resources_redis.pipeline()
+            pipeline.append(stream_key, ', "timestamp": {}}}'.format(self._dumps_data(cache_record.timestamp)))
+            pipeline.rename(stream_key, self._cache_key)
+            pipeline.expire(self._cache_key, expiration)
+            pipeline.hmset(self._meta_key, {"timestamp": cache_record.timestamp, "hash": data_hash.hexdigest()})
+            pipeline.expire(self._meta_key, expiration)
+            with self._redis_call():
+                pipeline.execute()
+        except redis.exceptions.RedisError:
+            self._process_cache_error("kiwicache.save_failed")
+        else:
+            self._increment_metric("success")
+
+    def _append_chunk(self, stream_key, chunk, sent_length):
+        # type: (str, Any, int) -> Optional[int]
+        """Append the chunk to the streamed data bundle, which expires if the streaming is interrupted.
+
+        :return: length of the streamed data, None if the key expired meanwhile
+        """
+        pipeline = self.resources_redis.pipeline(transaction=False)
+        pipeline.append(stream_key, chunk)
+        pipeline.expire(stream_key, self.refill_ttl)
+        with self._redis_call():
+            length, _ = pipeline.execute()
+        return length if length == sent_length + len(chunk) else None
+
+    def _touch_if_unchanged(self, data_hash, timestamp, expiration):
+        # type: (str, float, timedelta) -> bool
+        """Update timestamp and expiration of the cached data if their hash equals to the given one.
+
+        :return: Whether the cached data are unchanged
+        """
+        return bool(
+            self._run_script(
+                scripts.TOUCH_IF_UNCHANGED,
+                [self._cache_key, self._meta_key],
+                [data_hash, repr(timestamp), int(expiration.total_seconds() * 1000)],
+            )
+        )
+
+    def _save_and_release_lock(self, payload, data_hash, timestamp, expiration):
+        # type: (Any, str, float, timedelta) -> bool
+        """Save the encoded data bundle unless the cached data have its hash, then only touch them.
+
+        The payload is sent only if the hash differs. The refill lock is released and the refill backoff
+        is reset in the same round trip as the touch or the save.
+        :return: Whether the cached data were changed
+        """
+        keys = [self._cache_key, self._meta_key, self._refill_lock_key, self._refill_backoff_key]
+        expiration_ms = int(expiration.total_seconds() * 1000)
+        if self._run_script(
+            scripts.TOUCH_IF_UNCHANGED, keys, [data_hash, repr(timestamp), expiration_ms, self._lock_token]
+        ):
+            return False
+        self._run_script(
+            scripts.SAVE_AND_RELEASE_LOCK, keys, [payload, expiration_ms, repr(timestamp), data_hash, self._lock_token]
+        )
+        return True
+
+    def _get_refill_lock(self, lock_key=None):
+        # type: (Optional[str]) -> Optional[bool]
+        """Lock loading from the expensive source.
+
+        This lets us avoid all workers hitting at the same time.
+        :param lock_key: key of the lock, `_refill_lock_key` by default
+        :return: Whether we got the lock or not, None if connection to redis failed.
+        """
+        try:
+            with self._redis_call():
+                return bool(
+                    self.resources_redis.set(
+                        lock_key or self._refill_lock_key, self._lock_token, ex=self.refill_ttl, nx=True
+                    )
+                )
+        except redis.exceptions.RedisError:
+            self._process_cache_error("kiwicache.refill_lock_failed")
+            return None
+
+    def _get_refill_lock_or_timestamp(self, timestamp):
+        # type: (float) -> Tuple[Optional[bool], Optional[float]]
+        """Lock loading from the expensive source unless the data were refilled meanwhile.
+
+        Both the lock and the timestamp of the last refill are checked in one round trip by a lua script.
+        :param timestamp: timestamp of refill start
+        :return: Whether we got the lock or not (None if connection to redis failed) and the refill timestamp
+        """
+        try:
+            result = self._run_script(
+                scripts.ACQUIRE_LOCK_OR_GET_TIMESTAMP,
+                [self._refill_lock_key, self._meta_key, self._refill_backoff_key],
+                [
+                    self._lock_token,
+                    int(self.refill_ttl.total_seconds() * 1000),
+                    repr(timestamp),
+                    repr(utils.get_current_timestamp()),
+                ],
+            )
+        except redis.exceptions.RedisError:
+            self._process_cache_error("kiwicache.refill_lock_failed")
+            return None, None
+        return self._parse_lock_result(result)
+
+    def _parse_lock_result(self, result):
+        # type: (List[Any]) -> Tuple[Optional[bool], Optional[float]]
+        """Parse result of the `ACQUIRE_LOCK_OR_GET_TIMESTAMP` script to whether we got the lock and the timestamp.
+
+        Whether we got the lock is None while refills back off after failures.
+        """
+        if result[0] == 1:
+            return True, None
+        timestamp = float(result[1]) if len(result) > 1 and result[1] is not None else None
+        if result[0] < 0:
+            self._increment_metric("refill_backoff")
+            return None, timestamp
+        return False, timestamp
+
+    def _wait_for_refill_lock(self):
+        # type: () -> Optional[bool]
+        """Wait for lock or reloaded data in cache (handles multiple workers).
+
+        :return: Whether we got the lock or not, None if connection to redis failed or refills back off.
+        """
+        start_timestamp = utils.get_current_timestamp()
+        lock_check_period = self.lock_check_period
+        while True:
+            has_lock, timestamp = self._get_refill_lock_or_timestamp(start_timestamp)
+            if has_lock is None or has_lock is True:
+                return has_lock
+            if timestamp is not None and timestamp > start_timestamp:
+                return False
+
+            self._log_warning("kiwicache.refill_locked")
+            # let the lock owner finish
+            lock_check_period = min(lock_check_period * 2, self.refill_ttl.total_seconds())
+            time.sleep(lock_check_period)
+
+    def _release_refill_lock(self, lock_key=None, reset_backoff=False):
+        # type: (Optional[str], bool) -> Optional[bool]
+        """Release loading lock from the source if we own it.
+
+        This lets us avoid all workers hitting at the same time.
+        :param lock_key: key of the lock, `_refill_lock_key` by default
+        :param reset_backoff: whether to reset the refill backoff after a successful refill
+        :return: Whether we released the lock or not
+        """
+        keys = [lock_key or self._refill_lock_key] + ([self._refill_backoff_key] if reset_backoff else [])
+        try:
+            return bool(self._run_script(scripts.RELEASE_LOCK, keys, [self._lock_token]))
+        except redis.exceptions.RedisError:
+            self._process_cache_error("kiwicache.release_lock_failed")
+            return None
+
+    def _renew_refill_lock(self, lock_key=None):
+        # type: (Optional[str]) -> Optional[bool]
+        """Renew expiration of loading lock from the source if we own it.
+
+        :param lock_key: key of the lock, `_refill_lock_key` by default
+        :return: Whether we still own the lock or not, None if connection to redis failed.
+        """
+        try:
+            renewed = bool(
+                self._run_script(
+                    scripts.RENEW_LOCK,
+                    [lock_key or self._refill_lock_key],
+                    [self._lock_token, int(self.refill_ttl.total_seconds() * 1000)],
+                )
+            )
+        except redis.exceptions.RedisError:
+            self._process_cache_error("kiwicache.renew_lock_failed")
+            return None
+
+        if not renewed:
+            self._log_warning("kiwicache.refill_lock_lost")
+        return renewed
+
+    def _refill_lock_heartbeat(self, lock_key=None):
+        # type: (Optional[str]) -> Heartbeat
+        """Keep renewing the loading lock in background, so it does not expire during long loading from source.
+
+        :param lock_key: key of the lock, `_refill_lock_key` by default
+        """
+        return Heartbeat(partial(self._renew_refill_lock, lock_key), self.refill_ttl.total_seconds() / 3)
+
+    def _run_script(self, script, keys, args):
+        # type: (str, List[str], List[Any]) -> Any
+        """Run lua script in redis."""
+        with self._redis_call():
+            return self.resources_redis.register_script(script)(keys=keys, args=args)
+
+    def _record_refill_failure(self):
+        # type: () -> None
+        """Back off refills of all workers after a failure of loading from source."""
+        if self.refill_backoff is None:
+            return
+        try:
+            self._run_script(scripts.RECORD_REFILL_FAILURE, [self._refill_backoff_key], self._backoff_script_args())
+        except redis.exceptions.RedisError:
+            self._process_cache_error("kiwicache.refill_backoff_failed")
+
+    def _backoff_script_args(self):
+        # type: () -> List[Any]
+        """Arguments of the `RECORD_REFILL_FAILURE` script."""
+        return [
+            repr(utils.get_current_timestamp()),
+            self.refill_backoff.total_seconds(),
+            self.max_refill_backoff.total_seconds(),
+            random.random() * self.refill_backoff_jitter,
+        ]
@@ -0,0 +1,104 @@
+"""Lua scripts executed atomically by redis."""
+
+RELEASE_LOCK = """
+for i = 2, #KEYS do
+    redis.call("DEL", KEYS[i])
+end
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+"""Delete the lock `KEYS[1]` only if it is owned by the token `ARGV[1]`, other keys (e.g. refill backoff) always."""
+
+RENEW_LOCK = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("PEXPIRE", KEYS[1], ARGV[2])
+end
+return 0
+"""
+"""Set expiration of the lock `KEYS[1]` to `ARGV[2]` milliseconds only if it is owned by the token `ARGV[1]`."""
+
+ACQUIRE_LOCK_OR_GET_TIMESTAMP = """
+local timestamp = redis.call("HGET", KEYS[2], "timestamp")
+if timestamp and tonumber(timestamp) > tonumber(ARGV[3]) then
+    return {0, timestamp}
+end
+local backoff_until = redis.call("HGET", KEYS[3], "until")
+if backoff_until and tonumber(backoff_until) > tonumber(ARGV[4]) then
+    return {-1, timestamp}
+end
+if redis.call("SET", KEYS[1], ARGV[1], "PX", ARGV[2], "NX") then
+    return {1}
+end
+return {0, timestamp}
+"""
+"""Lock `KEYS[1]` by the token `ARGV[1]` for `ARGV[2]` milliseconds unless the data were refilled after `ARGV[3]`
+or refills back off after failures until a time later than `ARGV[4]` stored in the hash `KEYS[3]`.
+
+Return 1 if the lock was acquired, -1 if refills back off, 0 otherwise and the refill timestamp stored
+in the hash `KEYS[2]`.
+"""
+
+LOAD_IF_CHANGED = """
+local meta = redis.call("HMGET", KEYS[2], "hash", "timestamp")
+if ARGV[2] == "0" or (meta[1] and meta[1] == ARGV[1]) then
+    return {meta[1], meta[2], false}
+end
+return {meta[1], meta[2], redis.call("GET", KEYS[1])}
+"""
+"""Return the hash and timestamp of the data stored in the metadata hash `KEYS[2]` and the data `KEYS[1]`,
+which are not loaded if the hash equals to `ARGV[1]` or `ARGV[2]` is 0."""
+
+TOUCH_IF_UNCHANGED = """
+if redis.call("HGET", KEYS[2], "hash") ~= ARGV[1] or redis.call("EXISTS", KEYS[1]) == 0 then
+    return 0
+end
+redis.call("HSET", KEYS[2], "timestamp", ARGV[2])
+redis.call("PEXPIRE", KEYS[1], ARGV[3])
+redis.call("PEXPIRE", KEYS[2], ARGV[3])
+if KEYS[3] and redis.call("GET", KEYS[3]) == ARGV[4] then
+    redis.call("DEL", KEYS[3])
+end
+for i = 4, #KEYS do
+    redis.call("DEL", KEYS[i])
+end
+return 1
+"""
+"""Set the refill timestamp `ARGV[2]` and expiration `ARGV[3]` in milliseconds of the data `KEYS[1]`
+and its metadata hash `KEYS[2]` only if the hash of the data stored in metadata equals to `ARGV[1]`.
+
+Then release the lock `KEYS[3]`, if given, when it is owned by the token `ARGV[4]` and delete other keys
+(e.g. refill backoff). Return 1 if the data are unchanged, 0 otherwise.
+"""
+
+SAVE_AND_RELEASE_LOCK = """
+redis.call("SET", KEYS[1], ARGV[1], "PX", ARGV[2])
+redis.call("HMSET", KEYS[2], "timestamp", ARGV[3], "hash", ARGV[4])
+redis.call("PEXPIRE", KEYS[2], ARGV[2])
+if redis.call("GET", KEYS[3]) == ARGV[5] then
+    redis.call("DEL", KEYS[3])
+end
+for i = 4, #KEYS do
+    redis.call("DEL", KEYS[i])
+end
+return 1
+"""
+"""Save the data `ARGV[1]` to `KEYS[1]` and the refill timestamp `ARGV[3]` and hash `ARGV[4]` of the data
+to the metadata hash `KEYS[2]`, both expiring in `ARGV[2]` milliseconds.
+
+Release the lock `KEYS[3]` if it is owned by the token `ARGV[5]` and delete other keys (e.g. refill backoff).
+"""
+
+RECORD_REFILL_FAILURE = """
+local failures = redis.call("HINCRBY", KEYS[1], "failures", 1)
+local delay = math.min(tonumber(ARGV[2]) * 2 ^ (failures - 1), tonumber(ARGV[3])) * (1 - tonumber(ARGV[4]))
+redis.call("HSET", KEYS[1], "until", tonumber(ARGV[1]) + delay)
+redis.call("PEXPIRE", KEYS[1], math.ceil(tonumber(ARGV[3]) * 2000))
+return tostring(delay)
+"""
+"""Count a failed refill in the hash `KEYS[1]` and back off refills from the time `ARGV[1]` for the delay
+`ARGV[2]` seconds doubled with each consecutive failure up to `ARGV[3]` seconds and shortened by `ARGV[4]` fraction.
+
+Return the delay in seconds, the hash expires after twice the maximum delay.
+"""
@@ -1,5 +1,41 @@
 """Utility functions."""
+
+from datetime import timedelta
+import importlib
+import itertools
+import random
+import sys
 import time
+from typing import Any, Callable, Iterable, Iterator, List  # pylint: disable=unused-import
+
+# clock for measuring durations, which is not affected by changes of the system time (wall clock in Python 2)
+monotonic = getattr(time, "monotonic", time.time)
+
+
+class LazyObject(object):
+    """Proxy of an object created by `factory` on first access of its attributes, e.g. of a module imported lazily.
+
+    Attributes are looked up on the object on each access, so later changes of the object (e.g. patched functions
+    of a module) are used.
+    """
+
+    def __init__(self, factory):
+        # type: (Callable[[], Any]) -> None
+        self._factory = factory
+        self._target = None
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        if self._target is None:
+            self._target = self._factory()
+        return getattr(self._target, name)
+
+
+def import_lazily(name):
+    # type: (str) -> LazyObject
+    """Proxy of the module imported on first access of its attributes."""
+    return LazyObject(lambda: importlib.import_module(name))
 
 
 def get_current_timestamp():
@@ -12,3 +48,67 @@ def mandatory_validator(instance, attribute, value):
     """Validator for mandatory attribute."""
     if not value:
         raise AttributeError("{} is mandatory".format(attribute))
+
+
+def fraction_validator(instance, attribute, value):
+    """Validator for attribute which has to be a fraction between 0 and 1."""
+    if not 0 <= value <= 1:
+        raise ValueError("{} has to be between 0 and 1".format(attribute.name))
+
+
+def jitter_timedelta(value, jitter):
+    # type: (timedelta, float) -> timedelta
+    """Shorten timedelta by a random part of it, at most by `jitter` fraction.
+
+    :param value: timedelta to shorten
+    :param jitter: maximal shortened fraction, 0 disables the jitter
+    """
+    if not jitter:
+        return value
+    return timedelta(seconds=value.total_seconds() * (1 - random.random() * jitter))
+
+
+def chunked(items, size):
+    # type: (List[Any], int) -> Iterator[List[Any]]
+    """Split list of items into lists of at most `size` items."""
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def joined_chunks(parts, size):
+    # type: (Iterable[str], int) -> Iterator[str]
+    """Join consecutive string parts into chunks of at least `size` characters (except the last one)."""
+    chunk = []  # type: List[str]
+    chunk_length = 0
+    for part in parts:
+        chunk.append(part)
+        chunk_length += len(part)
+        if chunk_length >= size:
+            yield "".join(chunk)
+            chunk = []
+            chunk_length = 0
+    if chunk:
+        yield "".join(chunk)
+
+
+def estimate_size(obj, sample_size=100):
+    # type: (Any, int) -> int
+    """Estimate memory used by the object including its items in bytes.
+
+    Containers with more than `sample_size` items are estimated from their first `sample_size` items.
+    """
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        sample = list(itertools.islice(obj.items(), sample_size))
+        sample_total = sum(estimate_size(key, sample_size) + estimate_size(value, sample_size) for key, value in sample)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        sample = list(itertools.islice(obj, sample_size))
+        sample_total = sum(estimate_size(item, sample_size) for item in sample)
+    elif hasattr(obj, "__dict__"):
+        return size + estimate_size(vars(obj), sample_size)
+    else:
+        return size
+
+    if sample:
+        size += sample_total * len(obj) // len(sample)
+    return size
@@ -15,6 +15,7 @@ setup(
     packages=find_packages(),
     install_requires=REQUIREMENTS,
     tests_require=TEST_REQUIREMENTS,
+    extras_require={"columnar": ["numpy"]},
     description="Cache for using Redis with diverse sources.",
     long_description="Redis cache with pythonic dict-like interface just a method away!",
     include_package_data=True,
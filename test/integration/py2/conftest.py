@@ -2,6 +2,8 @@ import attr
 import pytest
 
 from kw.cache import KiwiCache
+from kw.cache.family import KiwiCacheFamily, KiwiCacheFamilyMember
+from kw.cache.keyed import KeyedKiwiCache
 
 
 @attr.s
@@ -17,3 +19,36 @@ def cache(redis, mocker):
     cache_instance = ArrayCache(redis)
     mocker.spy(cache_instance, "load_from_source")
     return cache_instance
+
+
+SOURCE_ITEMS = {"a": 101, "b": 102, "c": 103}
+
+
+@attr.s
+class ItemCache(KeyedKiwiCache):
+    def load_from_source_many(self, keys):
+        return {key: SOURCE_ITEMS[key] for key in keys if key in SOURCE_ITEMS}
+
+    def load_source_keys(self):
+        return list(SOURCE_ITEMS)
+
+
+@pytest.fixture
+def keyed_cache(redis, mocker):
+    cache_instance = ItemCache(redis)
+    mocker.spy(cache_instance, "load_from_source_many")
+    return cache_instance
+
+
+MARKET_AIRLINES = {"cz": {"OK": "Czech Airlines"}, "de": {"LH": "Lufthansa"}, "gb": {"BA": "British Airways"}}
+
+
+@attr.s
+class MarketAirlinesCache(KiwiCacheFamilyMember):
+    def load_from_source(self):
+        return MARKET_AIRLINES[self.suffix]
+
+
+@pytest.fixture
+def family(redis):
+    return KiwiCacheFamily(MarketAirlinesCache, redis, max_members=2, suffixes=sorted(MARKET_AIRLINES))
@@ -0,0 +1,25 @@
+import attr
+import pytest
+
+np = pytest.importorskip("numpy")
+columnar = pytest.importorskip("kw.cache.columnar")
+
+
+@attr.s
+class RatesCache(columnar.ColumnarKiwiCache):
+    def load_from_source(self):
+        return columnar.ColumnarTable(keys=["USD", "CZK"], columns={"rate": [1.1, 25.5]})
+
+
+def test_columnar_cache(redis, mocker):
+    cache = RatesCache(redis)
+    np.testing.assert_array_equal(cache.lookup(["CZK", "XXX", "USD"], "rate"), [25.5, np.nan, 1.1])
+    assert isinstance(redis.get(cache._cache_key), bytes)
+
+    increment_metric = mocker.patch.object(cache, "_increment_metric")
+    cache.refill_cache()
+    increment_metric.assert_called_once_with("unchanged")
+
+    other_cache = RatesCache(redis)
+    assert other_cache.reload_from_cache()
+    assert other_cache["USD"] == {"rate": 1.1}
@@ -0,0 +1,112 @@
+from datetime import datetime
+
+from redis import exceptions
+
+from kw.cache import KiwiCache, utils
+from kw.cache.family import KiwiCacheFamily
+from kw.cache.memory import MemoryBudget
+
+from .conftest import MARKET_AIRLINES, MarketAirlinesCache
+
+
+def test_lazy_members(family):
+    assert len(family) == 0
+    member = family["cz"]
+    assert member._cache_key == "resource:MarketAirlinesCache:cz"
+    assert member["OK"] == "Czech Airlines"
+    assert family["cz"] is member
+    assert member._cache_key not in KiwiCache.instances
+    assert KiwiCacheFamily.instances["MarketAirlinesCache"] is family
+
+
+def test_max_members(family):
+    cz_member = family["cz"]
+    family["de"]
+    family["cz"]
+    family["gb"]
+    assert len(family) == 2
+    assert family["cz"] is cz_member, "The recently used member is kept"
+    assert "de" not in family._members
+
+
+def test_max_members_release_memory(family, mocker):
+    budget = MemoryBudget(10**6)
+    mocker.patch.object(MarketAirlinesCache, "memory_budget", budget)
+    cz_member = family["cz"]
+    assert cz_member["OK"] == "Czech Airlines"
+    assert budget.used_bytes == cz_member.memory_usage > 0
+
+    family["de"]
+    family["gb"]
+    assert budget.used_bytes == 0, "Evicted members release their memory"
+    assert id(cz_member) not in budget._usages
+    assert cz_member._data == {}
+
+
+def test_get_members(redis, family, mocker):
+    family.refill_cache()
+    other_worker = KiwiCacheFamily(MarketAirlinesCache, redis, max_members=3)
+    mocker.spy(redis, "pipeline")
+    mocker.spy(redis, "get")
+
+    members = other_worker.get_members(["cz", "de", "gb"])
+    assert [dict(member) for member in members] == [MARKET_AIRLINES[suffix] for suffix in ["cz", "de", "gb"]]
+    assert redis.pipeline.call_count == 1
+    assert redis.get.call_count == 0
+    assert [member._data_hash for member in members] == [member.load_hash_from_cache() for member in members]
+
+    other_worker.maybe_reload()
+    assert redis.pipeline.call_count == 1, "Fresh members are not reloaded"
+
+    for member in members:
+        member.expires_at = datetime.utcnow()
+    mocker.spy(MarketAirlinesCache, "_decode_cache_record")
+    other_worker.maybe_reload()
+    assert MarketAirlinesCache._decode_cache_record.call_count == 0, "Unchanged data are not decoded again"
+    assert not any(member._is_stale() for member in members)
+
+
+def test_get_members_redis_error(family, mocker):
+    mocker.patch.object(family.resources_redis, "pipeline").return_value.execute.side_effect = exceptions.RedisError
+    mocker.patch.object(MarketAirlinesCache, "reload")
+    mocker.spy(MarketAirlinesCache, "_process_cache_error")
+    family.get_members(["cz", "de"])
+    assert MarketAirlinesCache._process_cache_error.call_count == 1
+    assert MarketAirlinesCache._process_cache_error.call_args[0][1] == "kiwicache.load_failed"
+    assert MarketAirlinesCache.reload.call_count == 2
+
+
+def test_get_members_missing_in_cache(family, mocker):
+    mocker.spy(MarketAirlinesCache, "load_from_source")
+    members = family.get_members(["cz", "de"])
+    assert [dict(member) for member in members] == [MARKET_AIRLINES["cz"], MARKET_AIRLINES["de"]]
+    assert MarketAirlinesCache.load_from_source.call_count == 2
+
+
+def test_refill_cache(family, mocker):
+    mocker.spy(MarketAirlinesCache, "refill_cache")
+    assert family.refill_cache() == ["cz", "de", "gb"]
+    assert family.refill_cache() == [], "Fresh cache is not refilled"
+    assert MarketAirlinesCache.refill_cache.call_count == 3
+
+    family["de"].save_to_cache(MARKET_AIRLINES["de"])
+    mocker.patch.object(utils, "get_current_timestamp", return_value=utils.get_current_timestamp() + 61)
+    assert family.refill_cache() == ["cz", "gb", "de"], "The oldest members are refilled first"
+
+
+def test_refill_cache_release_memory(family, mocker):
+    budget = MemoryBudget(10**6)
+    mocker.patch.object(MarketAirlinesCache, "memory_budget", budget)
+    cz_member = family["cz"]
+    assert cz_member["OK"] == "Czech Airlines"
+    used_bytes = budget.used_bytes
+    mocker.spy(budget, "reserve")
+
+    mocker.patch.object(utils, "get_current_timestamp", return_value=utils.get_current_timestamp() + 61)
+    assert family.refill_cache() == ["de", "gb", "cz"]
+    assert len(family) == 1, "Members are not created in memory by the refill"
+    assert all(
+        call[0][0] is cz_member for call in budget.reserve.call_args_list
+    ), "Refill only members are not in budget"
+    assert budget.used_bytes == used_bytes
+    assert cz_member["OK"] == "Czech Airlines"
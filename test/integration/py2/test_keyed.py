@@ -0,0 +1,154 @@
+from datetime import timedelta
+
+import pytest
+
+from kw.cache.keyed import ABSENT
+
+from .conftest import ItemCache
+
+
+def test_load_from_source(keyed_cache):
+    assert keyed_cache["a"] == 101
+    assert keyed_cache.load_from_source_many.call_count == 1
+
+    assert keyed_cache["a"] == 101
+    assert keyed_cache.get("b") == 102
+    assert keyed_cache.load_from_source_many.call_count == 2
+
+
+def test_load_from_cache(redis, keyed_cache, mocker):
+    assert keyed_cache["a"] == 101
+
+    other_worker = ItemCache(redis)
+    mocker.spy(other_worker, "load_from_source_many")
+    assert other_worker["a"] == 101
+    assert other_worker.load_from_source_many.call_count == 0
+
+
+def test_missing(keyed_cache):
+    with pytest.raises(KeyError):
+        assert not keyed_cache["x"]
+    assert "x" not in keyed_cache
+    assert keyed_cache.get("x", 0) == 0
+    assert keyed_cache.load_from_source_many.call_count == 1, "Nonexistent keys are remembered locally"
+
+
+def test_missing_in_cache(redis, keyed_cache, mocker):
+    assert keyed_cache.get("x") is None
+    assert 0 < redis.ttl(keyed_cache._item_key("x")) <= keyed_cache.reload_ttl.total_seconds()
+
+    other_worker = ItemCache(redis)
+    mocker.spy(other_worker, "load_from_source_many")
+    assert "x" not in other_worker
+    assert other_worker.load_from_source_many.call_count == 0, "Nonexistent keys are remembered in redis"
+    assert list(other_worker.iter_items()) == []
+
+
+def test_locked_batch_missing(redis, keyed_cache, mocker):
+    sleep = mocker.patch("time.sleep")
+    other_worker = ItemCache(redis)
+    other_worker._get_refill_lock(keyed_cache._get_batch_lock_key(["a", "x"]))
+    sleep.side_effect = lambda _: other_worker.save_items_to_cache({"a": 101, "x": ABSENT})
+
+    assert keyed_cache.get_many(["a", "x"]) == [101, None]
+    assert keyed_cache.load_from_source_many.call_count == 0
+    assert sleep.call_count == 1
+
+
+def test_batches(redis, mocker):
+    cache = ItemCache(redis, batch_size=2)
+    mocker.spy(cache, "load_from_source_many")
+
+    assert cache._get_items(["a", "b", "c", "x"]) == {"a": 101, "b": 102, "c": 103}
+    assert [call[0][0] for call in cache.load_from_source_many.call_args_list] == [["a", "b"], ["c", "x"]]
+
+
+def test_max_size(redis):
+    cache = ItemCache(redis, max_size=2)
+    cache._get_items(["a", "b", "c"])
+    assert len(cache._items) == 2
+
+
+def test_source_error(keyed_cache, mocker):
+    mocker.patch.object(keyed_cache, "load_from_source_many", side_effect=[Exception("Mock error"), {"a": 101}])
+
+    assert keyed_cache.get("a") is None
+    assert keyed_cache.get("a") == 101, "Failed loads are not remembered as nonexistent"
+
+
+def test_locked_batch(redis, keyed_cache, mocker):
+    sleep = mocker.patch("time.sleep")
+    other_worker = ItemCache(redis)
+    lock_key = keyed_cache._get_batch_lock_key(["a"])
+    other_worker._get_refill_lock(lock_key)
+    sleep.side_effect = lambda _: other_worker.save_items_to_cache({"a": 101})
+
+    assert keyed_cache["a"] == 101
+    assert keyed_cache.load_from_source_many.call_count == 0
+    assert sleep.call_count == 1
+
+
+def test_ttl(redis):
+    cache = ItemCache(redis, cache_ttl=timedelta(hours=1))
+    assert cache["a"] == 101
+    assert redis.ttl(cache._item_key("a")) == timedelta(hours=1).total_seconds()
+
+
+def test_get_many(keyed_cache, mocker):
+    load_items_from_cache = mocker.spy(keyed_cache, "load_items_from_cache")
+    assert keyed_cache["a"] == 101
+
+    assert keyed_cache.get_many(iter(["a", "b", "x", "c"]), default=0) == [101, 102, 0, 103]
+    assert load_items_from_cache.call_count == 2
+    assert load_items_from_cache.call_args[0][0] == ["b", "x", "c"], "Only keys missing locally are loaded"
+    assert keyed_cache.load_from_source_many.call_count == 2
+
+
+class OtherItemCache(ItemCache):
+    @property
+    def _key_suffix(self):
+        return "[other]"
+
+
+def test_iter_items(redis, keyed_cache, mocker):
+    items = {"key{}".format(i): {"id": i} for i in range(250)}
+    keyed_cache.save_items_to_cache(items)
+    other_cache = OtherItemCache(redis)
+    other_cache.save_items_to_cache({"x": 1})
+    mget = mocker.spy(redis, "mget")
+
+    assert dict(keyed_cache.iter_items(count=50)) == items
+    assert mget.call_count > 1, "Items are loaded in batches"
+    assert len(keyed_cache._items) == 0, "Items are not kept locally"
+    assert list(other_cache.iter_items()) == [("x", 1)]
+    assert keyed_cache.load_from_source_many.call_count == 0
+
+
+def test_key_filter(redis, mocker):
+    cache = ItemCache(redis, key_filter_error_rate=0.01)
+    mocker.spy(cache, "load_source_keys")
+    mocker.spy(cache, "load_from_source_many")
+    mget = mocker.spy(redis, "mget")
+
+    assert cache.get("x") is None
+    assert cache.load_source_keys.call_count == 1
+    assert mget.call_count == 0, "Keys missing in the source are not looked up in redis"
+    assert cache.load_from_source_many.call_count == 0
+    assert cache["a"] == 101
+    assert mget.call_count == 1
+
+    other_worker = ItemCache(redis, key_filter_error_rate=0.01)
+    mocker.spy(other_worker, "load_source_keys")
+    assert other_worker.get_many(["x", "y", "b"]) == [None, None, 102]
+    assert other_worker.load_source_keys.call_count == 0, "The filter is loaded from cache"
+    assert mget.call_args[0][0] == [other_worker._item_key("b")]
+
+
+def test_key_filter_source_error(redis, mocker):
+    cache = ItemCache(redis, key_filter_error_rate=0.01)
+    mocker.patch.object(cache, "load_source_keys", side_effect=Exception("source outage"))
+
+    assert cache.get("x") is None
+    assert cache["a"] == 101, "Keys are looked up without the filter"
+    assert redis.get(cache._key_filter_key) is None
+    assert redis.get("{}:filter".format(cache._refill_lock_key)) is None
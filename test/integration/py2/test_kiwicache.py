@@ -1,8 +1,17 @@
 from datetime import datetime, timedelta
+import threading
+import time
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
 
 import pytest
-from redis import exceptions
+from redis import exceptions, StrictRedis
+from redis.connection import Connection
 
+from kw.cache import json
 from kw.cache.helpers import CallAttemptException
 
 from .conftest import ArrayCache
@@ -106,6 +115,7 @@ def test_redis_error(redis, mocker, max_attempts):
     mocker.spy(cache, "load_from_cache")
     mocker.patch.object(cache.resources_redis, "set", side_effect=exceptions.RedisError)
     mocker.patch.object(cache.resources_redis, "get", side_effect=exceptions.RedisError)
+    mocker.patch.object(cache.resources_redis, "evalsha", side_effect=exceptions.RedisError)
 
     if max_attempts < 0:
         assert cache["a"] == 213
@@ -116,3 +126,233 @@ def test_redis_error(redis, mocker, max_attempts):
     assert cache.load_from_source.call_count == 0
     assert cache.load_from_cache.call_count == (2 if max_attempts < 3 else max_attempts)
     assert cache.expires_at == datetime.utcnow() + cache.reload_ttl
+
+
+def test_refill_lock_owner(redis):
+    cache = ArrayCache(redis)
+    other_worker = ArrayCache(redis)
+
+    assert cache._get_refill_lock() is True
+    assert other_worker._renew_refill_lock() is False
+    assert other_worker._release_refill_lock() is False
+    assert cache._renew_refill_lock() is True
+    assert cache._release_refill_lock() is True
+
+
+def test_refill_backoff(redis, mocker):
+    mocker.patch("random.random", return_value=0)  # no jitter
+    timestamp = mocker.patch("kw.cache.utils.get_current_timestamp", return_value=1000.0)
+    caches = [ArrayCache(redis, max_attempts=-1, refill_backoff=timedelta(seconds=10)) for _ in range(2)]
+    for cache in caches:
+        mocker.patch.object(cache, "load_from_source", side_effect=Exception("source outage"))
+        mocker.spy(cache, "_increment_metric")
+        cache._set_data({"a": 1})
+        cache.expires_at = datetime.utcnow()
+
+    assert caches[0]["a"] == 1, "Local data are served during the outage"
+    assert redis.hgetall(caches[0]._refill_backoff_key) == {b"failures": b"1", b"until": b"1010"}
+    caches[1].refill_cache()
+    assert caches[1].load_from_source.call_count == 0, "The other worker backs off"
+    caches[1]._increment_metric.assert_any_call("refill_backoff")
+
+    timestamp.return_value = 1011.0
+    caches[1].refill_cache()
+    assert caches[1].load_from_source.call_count == 1
+    assert redis.hgetall(caches[0]._refill_backoff_key) == {b"failures": b"2", b"until": b"1031"}, "Delay doubles"
+    assert 0 < redis.pttl(caches[0]._refill_backoff_key) <= 600 * 1000
+
+    timestamp.return_value = 1031.0
+    caches[0].load_from_source.side_effect = None
+    caches[0].load_from_source.return_value = {"a": 2}
+    caches[0].refill_cache()
+    assert redis.exists(caches[0]._refill_backoff_key) == 0, "Backoff is reset by a successful refill"
+
+
+def test_long_load_from_source(redis, mocker):
+    caches = [ArrayCache(redis, refill_ttl=timedelta(seconds=1)) for _ in range(2)]
+
+    def slow_load_from_source():
+        time.sleep(2.5)
+        return {"a": 101}
+
+    for cache in caches:
+        mocker.patch.object(cache, "load_from_source", side_effect=slow_load_from_source)
+
+    refill = threading.Thread(target=caches[0].refill_cache)
+    refill.start()
+    time.sleep(0.1)
+    assert caches[1]["a"] == 101
+    refill.join()
+
+    assert sum(cache.load_from_source.call_count for cache in caches) == 1, "The lock is renewed during the load"
+    assert redis.get(caches[0]._refill_lock_key) is None
+
+
+def test_refill_lock_or_timestamp(redis, mocker):
+    cache = ArrayCache(redis)
+    other_worker = ArrayCache(redis)
+    start_timestamp = time.time()
+
+    assert cache._get_refill_lock_or_timestamp(start_timestamp) == (True, None)
+    assert other_worker._get_refill_lock_or_timestamp(start_timestamp) == (False, None)
+
+    cache.save_to_cache({"a": 101})
+    timestamp = float(redis.hget(cache._meta_key, "timestamp"))
+    assert timestamp == cache.load_from_cache().timestamp
+    assert redis.ttl(cache._meta_key) == redis.ttl(cache._cache_key)
+
+    mocker.spy(other_worker, "load_from_cache")
+    assert other_worker._get_refill_lock_or_timestamp(start_timestamp) == (False, timestamp)
+    cache._release_refill_lock()
+    assert other_worker._get_refill_lock_or_timestamp(start_timestamp) == (False, timestamp), "Refilled meanwhile"
+    assert other_worker._wait_for_refill_lock() is True
+    assert other_worker.load_from_cache.call_count == 0, "The data bundle is not downloaded while waiting"
+
+
+def test_save_unchanged_data(redis, mocker):
+    cache = ArrayCache(redis)
+    reader = ArrayCache(redis)
+    cache.refill_cache()
+    assert reader["a"] == 101
+    timestamp = float(redis.hget(cache._meta_key, "timestamp"))
+
+    mocker.spy(redis, "set")
+    mocker.spy(cache, "_increment_metric")
+    cache.refill_cache()
+    assert redis.set.call_count == 0, "Unchanged data are not written again"
+    cache._increment_metric.assert_called_once_with("unchanged")
+    assert float(redis.hget(cache._meta_key, "timestamp")) > timestamp
+
+    mocker.spy(redis, "get")
+    assert reader.reload_from_cache() is True
+    assert redis.get.call_count == 0, "Unchanged data are not downloaded again"
+
+
+def test_round_trips(redis, mocker):
+    cache = ArrayCache(redis)
+    cache.reload()
+    cache._prolong_cache_expiration()
+    redis.flushall()  # scripts are loaded, so they are not sent again
+    round_trips = mocker.spy(Connection, "send_packed_command")
+
+    cache = ArrayCache(redis)
+    cache.reload()
+    assert cache["a"] == 101
+    assert round_trips.call_count == 4, "hash with data, lock, hash check and save with lock release, no reload"
+
+    round_trips.reset_mock()
+    cache.refill_cache()
+    assert round_trips.call_count == 2, "Lock and touch of unchanged data with lock release"
+
+    round_trips.reset_mock()
+    cache._prolong_cache_expiration()
+    assert round_trips.call_count == 1, "Expiration and hash together, unchanged data are not reloaded"
+
+
+def test_read_replica(redis, redis_url):
+    replica = StrictRedis.from_url(redis_url.rsplit("/", 1)[0] + "/1")
+    writer = ArrayCache(redis)
+    cache = ArrayCache(redis, read_redis=[replica])
+    writer.refill_cache()
+
+    assert cache["a"] == 101, "Data missing in the replica are loaded from the primary"
+
+    for key in [writer._cache_key, writer._meta_key]:
+        replica.restore(key, 0, redis.dump(key))
+    redis.set(writer._cache_key, "corrupted")
+    cache._set_data({})
+    assert cache["a"] == 101, "Data are loaded from the replica with the same hash"
+
+    writer.save_to_cache({"a": 1})
+    cache._set_data({})
+    assert cache["a"] == 1, "Data are loaded from the primary if the replica lags behind"
+
+
+def large_data(size=20000):
+    return {
+        "row{}".format(i): {"id": i, "name": "name {}".format(i), "price": i * 1.5, "tags": ["a", "b"]}
+        for i in range(size)
+    }
+
+
+def test_refill_unchanged_data_sent_size(redis, mocker):
+    data = large_data(1000)
+    cache = ArrayCache(redis)
+    mocker.patch.object(cache, "load_from_source", return_value=data)
+    cache.refill_cache()
+    sent = mocker.spy(Connection, "send_packed_command")
+
+    cache.refill_cache()
+    commands = [call[0][1] for call in sent.call_args_list]
+    sent_size = sum(len(b"".join(command) if isinstance(command, list) else command) for command in commands)
+    assert len(commands) == 2
+    assert sent_size < 1000, "Only the hash of unchanged data is sent"
+    assert cache.load_from_cache().data == data
+
+
+def test_stream_to_cache(redis, mocker):
+    data = large_data(1000)
+    cache = ArrayCache(redis)
+    cache.save_to_cache(data)
+    payload = redis.get(cache._cache_key)
+    data_hash = redis.hget(cache._meta_key, "hash")
+
+    streaming_cache = ArrayCache(redis, stream_chunk_size=1000)
+    mocker.spy(streaming_cache, "_increment_metric")
+    redis.delete(cache._cache_key, cache._meta_key)
+    streaming_cache.save_to_cache(data)
+    streaming_cache._increment_metric.assert_called_once_with("success")
+    assert redis.get(cache._cache_key).rsplit(b", ", 1)[0] == payload.rsplit(b", ", 1)[0], "Only timestamp differs"
+    assert redis.hget(cache._meta_key, "hash") == data_hash
+    assert redis.ttl(cache._cache_key) > 0
+    assert redis.keys("stream:*") == []
+    assert streaming_cache.load_from_cache().data == data
+
+    streaming_cache._increment_metric.reset_mock()
+    streaming_cache.save_to_cache(data)
+    streaming_cache._increment_metric.assert_called_once_with("unchanged")
+    assert redis.keys("stream:*") == []
+
+
+def test_stream_to_cache_interrupted(redis, mocker):
+    cache = ArrayCache(redis, stream_chunk_size=1000)
+    mocker.spy(cache, "_log_warning")
+    original_append_chunk = cache._append_chunk
+
+    def append_chunk(stream_key, chunk, sent_length):
+        redis.delete(stream_key)  # expired meanwhile
+        return original_append_chunk(stream_key, chunk, sent_length)
+
+    mocker.patch.object(cache, "_append_chunk", side_effect=append_chunk)
+    cache.save_to_cache(large_data(100))
+    cache._log_warning.assert_called_once_with("kiwicache.stream_interrupted")
+    assert redis.get(cache._cache_key) is None
+
+
+class LegacyJson(object):
+    """Json module without `dumps_data`, the data are copied by `attr.asdict`."""
+
+    dumps = staticmethod(json.dumps)
+    loads = staticmethod(json.loads)
+
+
+@pytest.mark.skipif(tracemalloc is None, reason="requires tracemalloc")
+def test_save_to_cache_memory_benchmark(redis):
+    data = large_data()
+
+    def peak_memory(cache):
+        redis.delete(cache._cache_key, cache._meta_key)
+        tracemalloc.start()
+        try:
+            cache.save_to_cache(data)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    legacy_cache = ArrayCache(redis)
+    legacy_cache.json = LegacyJson
+    legacy_peak = peak_memory(legacy_cache)
+    direct_peak = peak_memory(ArrayCache(redis))
+    stream_peak = peak_memory(ArrayCache(redis, stream_chunk_size=64 * 1024))
+    assert direct_peak < legacy_peak * 0.7
+    assert stream_peak < direct_peak / 4
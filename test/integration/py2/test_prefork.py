@@ -0,0 +1,71 @@
+from datetime import datetime
+import gc
+import json
+import os
+
+import pytest
+
+from kw.cache import prefork
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+
+
+@pytest.fixture(autouse=True)
+def clean_snapshot():
+    yield None
+    if hasattr(gc, "unfreeze"):
+        gc.unfreeze()
+    prefork._snapshot_caches[:] = []
+
+
+def run_in_child(func):
+    """Run the function in a forked process and return its JSON serializable result."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            if not hasattr(os, "register_at_fork"):
+                prefork.after_fork()
+            result = func()
+        except Exception as e:  # pylint: disable=broad-except
+            result = repr(e)
+        with os.fdopen(write_fd, "w") as pipe:
+            json.dump(result, pipe)
+        os._exit(0)  # pylint: disable=protected-access
+
+    os.close(write_fd)
+    with os.fdopen(read_fd) as pipe:
+        result = json.load(pipe)
+    os.waitpid(pid, 0)
+    return result
+
+
+def test_warm_up(cache, mocker):
+    prefork.warm_up([cache])
+    assert cache.load_from_source.call_count == 1
+    if hasattr(gc, "get_freeze_count"):
+        assert gc.get_freeze_count() > 0
+
+    load_from_cache = mocker.spy(cache, "load_from_cache")
+
+    def child():
+        data = dict(cache.data)
+        snapshot_used = load_from_cache.call_count == 0
+        return {
+            "data": data,
+            "snapshot_used": snapshot_used,
+            "lock_token": cache._lock_token,
+            "expires_in": (cache.expires_at - datetime.utcnow()).total_seconds(),
+            "pool_pid": cache.resources_redis.connection_pool.pid,
+            "pid": os.getpid(),
+            "reloaded": cache.reload_from_cache(),
+        }
+
+    result = run_in_child(child)
+    assert result["data"] == {"a": 101, "b": 102, "c": 103}
+    assert result["snapshot_used"], "The child uses data loaded by the master"
+    assert result["lock_token"] != cache._lock_token
+    assert cache.reload_ttl.total_seconds() / 2 - 1 <= result["expires_in"] <= cache.reload_ttl.total_seconds()
+    assert result["pool_pid"] == result["pid"]
+    assert result["reloaded"] is True, "The child connects to redis on its own"
@@ -1,7 +1,7 @@
 import aioredis
 import pytest
 
-from kw.cache.aio import AioKiwiCache
+from kw.cache.aio import AioKeyedKiwiCache, AioKiwiCache
 
 
 @pytest.fixture
@@ -31,3 +31,25 @@ def get_cache(get_aioredis, mocker):  # pylint: disable=redefined-outer-name
         return cache_instance
 
     return coroutine
+
+
+SOURCE_ITEMS = {"a": 101, "b": 102, "c": 103}
+
+
+class ItemCache(AioKeyedKiwiCache):
+    async def load_from_source_many(self, keys):
+        return {key: SOURCE_ITEMS[key] for key in keys if key in SOURCE_ITEMS}
+
+    async def load_source_keys(self):
+        return list(SOURCE_ITEMS)
+
+
+@pytest.fixture
+def get_keyed_cache(get_aioredis, mocker):  # pylint: disable=redefined-outer-name
+    async def coroutine(**params):
+        cache_instance = ItemCache(resources_redis=await get_aioredis(), **params)
+        mocker.spy(cache_instance, "load_items_from_cache")
+        mocker.spy(cache_instance, "load_from_source_many")
+        return cache_instance
+
+    return coroutine
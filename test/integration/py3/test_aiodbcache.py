@@ -0,0 +1,108 @@
+import asyncio
+import sys
+
+import pytest
+from sqlalchemy import column, create_engine
+from sqlalchemy.exc import OperationalError
+
+from kw.cache.aio import AioKiwiCache
+from kw.cache.aiodbcache import AioSQLAlchemyResource, QUEUED_BATCHES
+
+pytestmark = pytest.mark.skipif(sys.version_info < (3, 5), reason="requires Python 3.5+")
+
+
+@pytest.fixture(autouse=True)
+def clean_instances_list():
+    yield None
+    AioKiwiCache.instances = {}
+
+
+@pytest.fixture
+def engine(tmpdir):
+    db_engine = create_engine("sqlite:///{}".format(tmpdir.join("test.db")))
+    with db_engine.connect() as connection:
+        connection.execute("CREATE TABLE currency_rates (currency TEXT PRIMARY KEY, rate REAL, precision INTEGER)")
+        connection.execute(
+            "INSERT INTO currency_rates VALUES (?, ?, ?)", [("C{:04}".format(i), i / 10, 2) for i in range(2500)]
+        )
+    yield db_engine
+    db_engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_load_from_source(get_aioredis, engine, mocker):  # pylint: disable=redefined-outer-name
+    resource = AioSQLAlchemyResource(
+        resources_redis=await get_aioredis(),
+        engine=engine,
+        table_name="currency_rates",
+        key="currency",
+        columns=["rate"],
+        batch_size=1000,
+    )
+    add_rows = mocker.spy(resource, "_add_rows")
+    assert await resource.get("C0042") == {"currency": "C0042", "rate": 4.2}
+    assert len(await resource.keys()) == 2500
+    assert add_rows.call_count == 3, "Rows are fetched in batches"
+
+
+@pytest.mark.asyncio
+async def test_load_from_source_error(get_aioredis, engine):  # pylint: disable=redefined-outer-name
+    resource = AioSQLAlchemyResource(
+        resources_redis=await get_aioredis(), engine=engine, table_name="missing_table", key="currency"
+    )
+    with pytest.raises(OperationalError):
+        await resource.load_from_source()
+
+
+@pytest.mark.asyncio
+async def test_add_rows_error(get_aioredis, engine, mocker):  # pylint: disable=redefined-outer-name
+    resource = AioSQLAlchemyResource(
+        resources_redis=await get_aioredis(), engine=engine, table_name="currency_rates", key="currency", batch_size=10
+    )
+    add_rows = mocker.patch.object(resource, "_add_rows", side_effect=ValueError)
+    fetched_queues = []
+
+    def fetch_batches(query, loop, batches, stopped):
+        AioSQLAlchemyResource._fetch_batches(resource, query, loop, batches, stopped)
+        fetched_queues.append(batches)
+
+    mocker.patch.object(resource, "_fetch_batches", side_effect=fetch_batches)
+    with pytest.raises(ValueError):
+        await asyncio.wait_for(resource.load_from_source(), timeout=5)
+    assert add_rows.call_count == 1
+    assert len(fetched_queues) == 1, "The fetching is finished before the error is raised"
+    assert fetched_queues[0].maxsize == QUEUED_BATCHES
+
+
+@pytest.mark.asyncio
+async def test_load_from_source_where(get_aioredis, engine):  # pylint: disable=redefined-outer-name
+    resource = AioSQLAlchemyResource(
+        resources_redis=await get_aioredis(),
+        engine=engine,
+        table_name="currency_rates",
+        key="currency",
+        columns=["*"],
+        where=column("rate") < 1,
+    )
+    data = await resource.get_data()
+    assert len(data) == 10
+    assert data["C0005"] == {"currency": "C0005", "rate": 0.5, "precision": 2}
+
+
+@pytest.mark.parametrize(
+    ("invalid_params", "error"),
+    [
+        ({"engine": None}, TypeError),
+        ({"table_name": None}, TypeError),
+        ({"columns": "col"}, TypeError),
+        ({"where": "value > 3"}, TypeError),
+        ({"key": None, "columns": None}, ValueError),
+        ({"batch_size": "100"}, TypeError),
+    ],
+)
+@pytest.mark.asyncio
+async def test_validators(get_aioredis, engine, invalid_params, error):  # pylint: disable=redefined-outer-name
+    params = {"resources_redis": await get_aioredis(), "engine": engine, "table_name": "table", "key": "key"}
+    params.update(invalid_params)
+    with pytest.raises(error):
+        AioSQLAlchemyResource(**params)
@@ -0,0 +1,35 @@
+import sys
+
+import pytest
+
+from kw.cache.aio import AioKiwiCache
+from kw.cache.aioderived import aio_derived
+
+pytestmark = pytest.mark.skipif(sys.version_info < (3, 5), reason="requires Python 3.5+")
+
+
+@pytest.fixture(autouse=True)
+def clean_instances_list():
+    yield None
+    AioKiwiCache.instances = {}
+
+
+@pytest.mark.asyncio
+async def test_derived_cache(get_cache, mocker):
+    cache = await get_cache()
+    transform = mocker.Mock(side_effect=lambda data: {value: key for key, value in data.items()})
+    reverse = aio_derived(cache)(transform)
+
+    assert await reverse() == {101: "a", 102: "b", 103: "c"}
+    assert await reverse() == {101: "a", 102: "b", 103: "c"}
+    assert transform.call_count == 1, "The derived structure is memoized"
+
+    await cache.reload()
+    assert cache.load_from_cache.call_count == 2, "The hash of cached data is loaded with them"
+    assert await reverse() == {101: "a", 102: "b", 103: "c"}
+    assert transform.call_count == 1, "Reload of the same data does not recompute the derived structure"
+
+    await cache.save_to_cache({"a": 1})
+    await cache.reload()
+    assert await reverse() == {1: "a"}
+    assert transform.call_count == 2
@@ -0,0 +1,116 @@
+from datetime import timedelta
+import sys
+
+import pytest
+
+pytestmark = pytest.mark.skipif(sys.version_info < (3, 5), reason="requires Python 3.5+")
+
+
+@pytest.mark.asyncio
+async def test_load_from_source(get_keyed_cache):
+    cache = await get_keyed_cache()
+
+    assert await cache.getitem("a") == 101
+    assert cache.load_from_source_many.call_count == 1
+    assert cache.load_items_from_cache.call_count == 1
+
+    assert await cache.getitem("a") == 101
+    assert await cache.get("b") == 102
+    assert cache.load_from_source_many.call_count == 2
+    assert cache.load_items_from_cache.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_load_from_cache(get_keyed_cache):
+    cache = await get_keyed_cache()
+    other_worker = await get_keyed_cache()
+
+    assert await cache.getitem("a") == 101
+    assert await other_worker.getitem("a") == 101
+    assert other_worker.load_from_source_many.call_count == 0
+
+
+@pytest.mark.asyncio
+async def test_missing(get_keyed_cache):
+    cache = await get_keyed_cache()
+    with pytest.raises(KeyError):
+        await cache.getitem("x")
+    assert not await cache.contains("x")
+    assert await cache.get("x", 0) == 0
+    assert cache.load_from_source_many.call_count == 1, "Nonexistent keys are remembered locally"
+
+
+@pytest.mark.asyncio
+async def test_missing_in_cache(get_keyed_cache):
+    cache = await get_keyed_cache()
+    other_worker = await get_keyed_cache()  # redis is flushed by the fixture
+    assert await cache.get("x") is None
+    assert 0 < await cache.resources_redis.ttl(cache._item_key("x")) <= cache.reload_ttl.total_seconds()
+
+    assert not await other_worker.contains("x")
+    assert other_worker.load_from_source_many.call_count == 0, "Nonexistent keys are remembered in redis"
+    assert [item async for item in other_worker.iter_items()] == []
+
+
+@pytest.mark.asyncio
+async def test_batches(get_keyed_cache):
+    cache = await get_keyed_cache(batch_size=2, max_size=2)
+
+    assert await cache._get_items(["a", "b", "c", "x"]) == {"a": 101, "b": 102, "c": 103}
+    assert [call[0][0] for call in cache.load_from_source_many.call_args_list] == [["a", "b"], ["c", "x"]]
+    assert len(cache._items) == 2
+
+
+@pytest.mark.asyncio
+async def test_source_error(get_keyed_cache, mocker):
+    cache = await get_keyed_cache()
+    cache.load_from_source_many = mocker.Mock(side_effect=[Exception("Mock error"), cache.load_from_source_many(["a"])])
+
+    assert await cache.get("a") is None
+    assert await cache.get("a") == 101, "Failed loads are not remembered as nonexistent"
+
+
+@pytest.mark.asyncio
+async def test_ttl(get_keyed_cache):
+    cache = await get_keyed_cache(cache_ttl=timedelta(hours=1))
+    assert await cache.getitem("a") == 101
+    assert await cache.resources_redis.ttl(cache._item_key("a")) == timedelta(hours=1).total_seconds()
+
+
+@pytest.mark.asyncio
+async def test_get_many(get_keyed_cache):
+    cache = await get_keyed_cache()
+    assert await cache.getitem("a") == 101
+
+    assert await cache.get_many(iter(["a", "b", "x", "c"]), default=0) == [101, 102, 0, 103]
+    assert cache.load_items_from_cache.call_count == 2
+    assert cache.load_items_from_cache.call_args[0][0] == ["b", "x", "c"], "Only keys missing locally are loaded"
+
+
+@pytest.mark.asyncio
+async def test_iter_items(get_keyed_cache):
+    cache = await get_keyed_cache()
+    items = {"key{}".format(i): {"id": i} for i in range(250)}
+    await cache.save_items_to_cache(items)
+
+    assert {key: value async for key, value in cache.iter_items(count=50)} == items
+    assert len(cache._items) == 0, "Items are not kept locally"
+
+
+@pytest.mark.asyncio
+async def test_key_filter(get_keyed_cache, mocker):
+    cache = await get_keyed_cache(key_filter_error_rate=0.01)
+    other_worker = await get_keyed_cache(key_filter_error_rate=0.01)  # redis is flushed by the fixture
+    mocker.spy(cache, "load_source_keys")
+
+    assert await cache.get("x") is None
+    assert cache.load_source_keys.call_count == 1
+    assert cache.load_items_from_cache.call_count == 0, "Keys missing in the source are not looked up in redis"
+    assert cache.load_from_source_many.call_count == 0
+    assert await cache.getitem("a") == 101
+    assert cache.load_items_from_cache.call_count == 1
+
+    mocker.spy(other_worker, "load_source_keys")
+    assert await other_worker.get_many(["x", "y", "b"]) == [None, None, 102]
+    assert other_worker.load_source_keys.call_count == 0, "The filter is loaded from cache"
+    assert other_worker.load_items_from_cache.call_args[0][0] == ["b"]
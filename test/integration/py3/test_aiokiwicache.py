@@ -1,11 +1,16 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 import sys
+import time
+import tracemalloc
 
 import aioredis
 import pytest
 
+from kw.cache import utils
 from kw.cache.aio import AioKiwiCache as uut
-from kw.cache.helpers import CallAttemptException
+from kw.cache.helpers import CallAttemptException, ReadTimeoutError
 
 pytestmark = pytest.mark.skipif(sys.version_info < (3, 5), reason="requires Python 3.5+")
 
@@ -31,17 +36,15 @@ async def test_init(get_cache):
 
     assert await cache.get("a") == 101
     assert cache.load_from_source.call_count == 1
-    assert cache.load_from_cache.call_count == 2, (
-        "1st call: Cache is empty, so try loading from source, which fails, "
-        "2rd call: Cache is filled, so the call succeeds"
-    )
+    assert (
+        cache.load_from_cache.call_count == 1
+    ), "Cache is empty, so try loading from source, whose data are used without loading them from cache"
 
     assert await cache.get("b") == 102
     assert cache.load_from_source.call_count == 1
-    assert cache.load_from_cache.call_count == 2, (
-        "1st call: Cache is empty, so try loading from source, which fails, "
-        "2rd call: Cache is filled, so the call succeeds"
-    )
+    assert (
+        cache.load_from_cache.call_count == 1
+    ), "Cache is empty, so try loading from source, whose data are used without loading them from cache"
 
 
 @pytest.mark.parametrize(
@@ -94,11 +97,9 @@ async def test_error(get_cache, mocker):
 
     assert await cache.get("a") == 101
     assert cache.load_from_source.call_count == 2, "Load should be called a second time after first call fails"
-    assert cache.load_from_cache.call_count == 4, (
+    assert cache.load_from_cache.call_count == 2, (
         "1st call: Cache is empty, so try loading from source, which fails, "
-        "2nd call: Prolong cache expiration after loading fail, "
-        "3rd call: Cache is empty, so try loading from source, which succeeds and fills cache, "
-        "4th call: Cache is filled, so the call succeeds"
+        "2nd call: Cache is still empty, so try loading from source, whose data are used without loading them"
     )
 
 
@@ -115,26 +116,42 @@ async def test_ttl(get_cache):
     assert ttl == timedelta(minutes=1).total_seconds()
 
 
+@pytest.mark.asyncio
+async def test_cache_ttl_jitter(get_cache):
+    cache = await get_cache(cache_ttl=timedelta(hours=1), cache_ttl_jitter=0.5)
+    redis = cache.resources_redis
+    expirations = set()
+    for data in [{"a": 1}, {"a": 1}, {"a": 2}] * 4:
+        await cache.save_to_cache(data)
+        expirations.add(await redis.ttl(cache._cache_key))
+    await cache.refill_cache()
+    expirations.add(await redis.ttl(cache._cache_key))
+    await cache._prolong_cache_expiration()
+    expirations.add(await redis.ttl(cache._cache_key))
+
+    assert len(expirations) > 1
+    assert all(1800 <= expiration <= 3600 for expiration in expirations)
+
+
 @pytest.mark.asyncio
 async def test_maybe_reload(get_cache, frozen_time):
     cache = await get_cache()
 
     await cache.maybe_reload()
     assert cache.load_from_source.call_count == 1
-    assert cache.load_from_cache.call_count == 2, (
-        "1st call: Cache is empty, so try loading from source, which fails, "
-        "2rd call: Cache is filled, so the call succeeds"
-    )
+    assert (
+        cache.load_from_cache.call_count == 1
+    ), "Cache is empty, so try loading from source, whose data are used without loading them from cache"
 
-    cache._data = {1: 2}
+    cache._set_data({1: 2})
     frozen_time.tick(timedelta(days=1))
     await cache.maybe_reload()
     assert cache.load_from_source.call_count == 1, "Since Redis key did not expire, no need to reload from source"
-    assert cache.load_from_cache.call_count == 3
+    assert cache.load_from_cache.call_count == 2
 
     await cache.maybe_reload()
     assert cache.load_from_source.call_count == 1, "Since Redis key did not expire, no need to reload from source"
-    assert cache.load_from_cache.call_count == 3
+    assert cache.load_from_cache.call_count == 2
 
 
 @pytest.mark.asyncio
@@ -158,6 +175,7 @@ async def test_redis_error(get_cache, mocker, max_attempts):
 
     mocker.patch.object(cache.resources_redis, "set", side_effect=aioredis.RedisError)
     mocker.patch.object(cache.resources_redis, "get", side_effect=aioredis.RedisError)
+    mocker.patch.object(cache.resources_redis, "evalsha", side_effect=aioredis.RedisError)
 
     if max_attempts < 0:
         assert await cache.get("a") == 213
@@ -168,3 +186,250 @@ async def test_redis_error(get_cache, mocker, max_attempts):
     assert cache.load_from_source.call_count == 0
     assert cache.load_from_cache.call_count == (2 if max_attempts < 3 else max_attempts)
     assert cache.expires_at == datetime.utcnow() + cache.reload_ttl
+
+
+@pytest.mark.asyncio
+async def test_get_many(get_cache, mocker):
+    cache = await get_cache()
+    maybe_reload = mocker.spy(cache, "maybe_reload")
+
+    assert await cache.get_many(["a", "x", "c"], default=0) == [101, 0, 103]
+    assert maybe_reload.call_count == 1
+    assert cache.load_from_cache.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_refill_lock_owner(get_cache):
+    cache = await get_cache()
+    other_worker = await get_cache()
+
+    assert await cache._get_refill_lock() is True
+    assert await other_worker._renew_refill_lock() is False
+    assert await other_worker._release_refill_lock() is False
+    assert await cache._renew_refill_lock() is True
+    assert await cache._release_refill_lock() is True
+
+
+@pytest.mark.asyncio
+async def test_long_load_from_source(get_cache, mocker):
+    caches = [await get_cache(refill_ttl=timedelta(seconds=1)) for _ in range(2)]
+
+    async def slow_load_from_source():
+        await asyncio.sleep(2.5)
+        return {"a": 101}
+
+    for cache in caches:
+        mocker.patch.object(cache, "load_from_source", side_effect=slow_load_from_source)
+
+    refill = asyncio.ensure_future(caches[0].refill_cache())
+    await asyncio.sleep(0.1)
+    assert await caches[1].get("a") == 101
+    await refill
+
+    assert sum(cache.load_from_source.call_count for cache in caches) == 1, "The lock is renewed during the load"
+    assert await caches[0].resources_redis.get(caches[0]._refill_lock_key) is None
+
+
+@pytest.mark.asyncio
+async def test_refill_lock_or_timestamp(get_cache):
+    cache = await get_cache()
+    other_worker = await get_cache()
+    redis = cache.resources_redis
+    start_timestamp = time.time()
+
+    assert await cache._get_refill_lock_or_timestamp(start_timestamp) == (True, None)
+    assert await other_worker._get_refill_lock_or_timestamp(start_timestamp) == (False, None)
+
+    await cache.save_to_cache({"a": 101})
+    timestamp = float(await redis.hget(cache._meta_key, "timestamp"))
+    assert timestamp == (await cache.load_from_cache()).timestamp
+    assert await redis.ttl(cache._meta_key) == await redis.ttl(cache._cache_key)
+
+    assert await other_worker._get_refill_lock_or_timestamp(start_timestamp) == (False, timestamp)
+    await cache._release_refill_lock()
+    assert await other_worker._get_refill_lock_or_timestamp(start_timestamp) == (False, timestamp)
+    assert await other_worker._wait_for_refill_lock() is True
+    assert other_worker.load_from_cache.call_count == 0
+
+
+class ProcessPoolCache(uut):
+    async def load_from_source(self):
+        return {}
+
+
+@pytest.fixture
+def process_pool(mocker):
+    executor = ProcessPoolExecutor(max_workers=1)
+    mocker.patch.object(ProcessPoolCache, "serialization_executor", executor)
+    yield executor
+    executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_serialization_executor(get_aioredis, process_pool, mocker):  # pylint: disable=redefined-outer-name
+    data = {"row{}".format(i): {"id": i, "name": "x" * 20, "tags": [1, 2, 3]} for i in range(2000)}
+    redis = await get_aioredis()
+    inline_cache = ProcessPoolCache(resources_redis=redis)
+    cache = ProcessPoolCache(resources_redis=redis, serialization_threshold=1024)
+    run_in_executor = mocker.spy(asyncio.get_event_loop(), "run_in_executor")
+
+    await inline_cache.save_to_cache(data)
+    assert await inline_cache.reload_from_cache() is True
+    assert run_in_executor.call_count == 0, "Serialization is not offloaded by default"
+
+    await cache.save_to_cache(data)
+    assert run_in_executor.call_count == 1, "The first payload is offloaded by the estimated size of the data"
+    cache._data = None
+    assert await cache.reload_from_cache() is True
+    assert run_in_executor.call_count == 2, "Decoding is offloaded by the size of the loaded payload"
+    assert all(call[0][0] is process_pool for call in run_in_executor.call_args_list)
+    assert await cache.get_data() == data
+
+    mocker.spy(utils, "estimate_size")
+    await cache.save_to_cache({"a": 1})
+    assert run_in_executor.call_count == 3, "The previous payload size is used as a hint"
+    assert utils.estimate_size.call_count == 0
+
+
+@pytest.mark.asyncio
+async def test_save_unchanged_data(get_cache, mocker):
+    cache = await get_cache()
+    reader = await get_cache()
+    redis = cache.resources_redis
+    await cache.refill_cache()
+    assert await reader.get("a") == 101
+    timestamp = float(await redis.hget(cache._meta_key, "timestamp"))
+
+    mocker.spy(redis, "set")
+    mocker.spy(cache, "_increment_metric")
+    await cache.refill_cache()
+    assert redis.set.call_count == 0, "Unchanged data are not written again"
+    cache._increment_metric.assert_called_once_with("unchanged")
+    assert float(await redis.hget(cache._meta_key, "timestamp")) > timestamp
+
+    mocker.spy(redis, "get")
+    assert await reader.reload_from_cache() is True
+    assert redis.get.call_count == 0
+
+
+@pytest.mark.asyncio
+async def test_round_trips(get_cache, mocker):
+    cache = await get_cache()
+    await cache.reload()
+    await cache._prolong_cache_expiration()
+    await cache.resources_redis.flushall()  # scripts are loaded, so they are not sent again
+    round_trips = mocker.spy(asyncio.StreamWriter, "write")
+
+    cache = await get_cache()
+    await cache.reload()
+    assert await cache.get("a") == 101
+    assert round_trips.call_count == 6, "Refilled data are saved with the lock release and are not reloaded"
+
+    round_trips.reset_mock()
+    await cache.refill_cache()
+    assert round_trips.call_count == 2, "Lock and touch of unchanged data with lock release"
+
+    round_trips.reset_mock()
+    await cache._prolong_cache_expiration()
+    assert round_trips.call_count == 1, "Expiration and hash together, unchanged data are not reloaded"
+
+
+@pytest.mark.asyncio
+async def test_read_replica(get_cache, redis_url):
+    writer = await get_cache()
+    redis = writer.resources_redis
+    replica = await aioredis.create_redis(redis_url.rsplit("/", 1)[0] + "/1")
+    cache = type(writer)(resources_redis=redis, read_redis=[replica])
+    await writer.refill_cache()
+
+    assert await cache.get("a") == 101, "Data missing in the replica are loaded from the primary"
+
+    for key in [writer._cache_key, writer._meta_key]:
+        await replica.restore(key, 0, await redis.dump(key))
+    await redis.set(writer._cache_key, "corrupted")
+    cache._set_data({})
+    assert await cache.get("a") == 101, "Data are loaded from the replica with the same hash"
+
+    await writer.save_to_cache({"a": 1})
+    cache._set_data({})
+    assert await cache.get("a") == 1, "Data are loaded from the primary if the replica lags behind"
+    replica.close()
+    await replica.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_read_timeout(get_cache, mocker):
+    cache = await get_cache(read_timeout=timedelta(milliseconds=10))
+
+    async def slow_reload():
+        await asyncio.sleep(0.1)
+        cache._set_data({"a": cache.reload.call_count})
+
+    mocker.patch.object(cache, "reload", side_effect=slow_reload)
+    with pytest.raises(ReadTimeoutError):
+        await cache.get("a")
+    await asyncio.sleep(0.2)
+    assert await cache.get("a") == 1, "The reload is not cancelled by the timeout"
+
+    cache.expires_at = datetime.utcnow() - timedelta(seconds=1)
+    assert await cache.get("a") == 1, "Stale data are served when the reload takes too long"
+    assert await cache.get("a") == 1
+    assert cache.reload.call_count == 2, "Readers share one reload task"
+
+    await asyncio.sleep(0.2)
+    assert await cache.get("a") == 2
+    assert cache._background_reload is None
+
+
+@pytest.mark.asyncio
+async def test_stream_to_cache(get_cache, mocker):
+    data = {"row{}".format(i): {"id": i, "name": "name {}".format(i), "tags": ["a", "b"]} for i in range(20000)}
+    cache = await get_cache()
+    redis = cache.resources_redis
+
+    async def peak_memory(cache):
+        await redis.delete(cache._cache_key, cache._meta_key)
+        tracemalloc.start()
+        try:
+            await cache.save_to_cache(data)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    direct_peak = await peak_memory(cache)
+    payload = await redis.get(cache._cache_key)
+
+    streaming_cache = await get_cache(stream_chunk_size=64 * 1024)
+    mocker.spy(streaming_cache, "_increment_metric")
+    stream_peak = await peak_memory(streaming_cache)
+    assert stream_peak < direct_peak / 4
+    streaming_cache._increment_metric.assert_called_once_with("success")
+    assert (await redis.get(cache._cache_key)).rsplit(b", ", 1)[0] == payload.rsplit(b", ", 1)[0]
+    assert await redis.keys("stream:*") == []
+    assert (await streaming_cache.load_from_cache()).data == data
+
+    streaming_cache._increment_metric.reset_mock()
+    await streaming_cache.save_to_cache(data)
+    streaming_cache._increment_metric.assert_called_once_with("unchanged")
+    assert await redis.keys("stream:*") == []
+
+
+@pytest.mark.asyncio
+async def test_refill_backoff(get_cache, mocker):
+    mocker.patch("random.random", return_value=0)  # no jitter
+    mocker.patch("kw.cache.utils.get_current_timestamp", return_value=1000.0)
+    cache = await get_cache(max_attempts=-1, refill_backoff=timedelta(seconds=10))
+    redis = cache.resources_redis
+    load_from_source = mocker.patch.object(cache, "load_from_source", side_effect=Exception("source outage"))
+
+    await cache.refill_cache()
+    assert await redis.hgetall(cache._refill_backoff_key) == {b"failures": b"1", b"until": b"1010"}
+    await cache.refill_cache()
+    assert load_from_source.call_count == 1, "Refills back off after the failure"
+
+    await redis.hset(cache._refill_backoff_key, "until", 0)
+    load_from_source.side_effect = None
+    load_from_source.return_value = {"a": 1}
+    await cache.refill_cache()
+    assert load_from_source.call_count == 2
+    assert await redis.exists(cache._refill_backoff_key) == 0, "Backoff is reset by a successful refill"
@@ -0,0 +1,55 @@
+import sys
+
+import pytest
+
+from kw.cache import loadtest
+from kw.cache.aio import AioKiwiCache
+
+pytestmark = pytest.mark.skipif(sys.version_info < (3, 5), reason="requires Python 3.5+")
+
+
+@pytest.fixture(autouse=True)
+def clean_instances_list():
+    yield None
+    AioKiwiCache.instances = {}
+
+
+@pytest.mark.parametrize("mode", loadtest.MODES)
+def test_run(redis_url, mode):
+    config = loadtest.LoadTestConfig(
+        redis_url=redis_url,
+        mode=mode,
+        workers=5,
+        duration=2.5,
+        interval=0.5,
+        reload_ttl=0.2,
+        cache_ttl=1.0,
+        refill_ttl=1.0,
+        source_delay=0.1,
+        size=10,
+    )
+    stats = loadtest.run(config)
+    counters = list(stats.counters.values())
+    assert sum(len(latencies) for latencies in stats.latencies.values()) >= config.workers
+    assert sum(counter["source_calls"] for counter in counters) >= 2, "The cache expires in redis"
+    assert len(loadtest.count_refills(stats.source_calls, config.refill_ttl)) >= 2
+    assert sum(counter["redis_ops"] for counter in counters) > 0
+    assert sum(counter["kiwicache.success"] for counter in counters) > 0
+
+    report = loadtest.format_report(stats, config)
+    assert "source calls per refill" in report
+    assert len(report.splitlines()) >= 5
+
+
+def test_count_refills():
+    assert loadtest.count_refills([10.5, 0, 12, 0.5, 1, 25], refill_ttl=5) == [0, 10.5, 25]
+    assert loadtest.count_refills([], refill_ttl=5) == []
+
+
+def test_parse_config():
+    config = loadtest.parse_config(["--mode", "asyncio", "--workers", "100", "--source-failure-rate", "0.5"])
+    assert config.mode == "asyncio"
+    assert config.workers == 100
+    assert config.source_failure_rate == 0.5
+    with pytest.raises(SystemExit):
+        loadtest.parse_config(["--mode", "fibers"])
@@ -1,7 +1,7 @@
 import attr
 import pytest
 
-from kw.cache import KiwiCache
+from kw.cache import KiwiCache, scripts
 from kw.cache.base import CacheRecord
 
 
@@ -15,6 +15,19 @@ def redis(mocker):
     test_redis = mocker.Mock()
     mocker.patch.object(test_redis, "ttl", return_value=1)
     mocker.patch.object(test_redis, "get", return_value=None)
+    mocker.patch.object(test_redis, "hget", return_value=None)
+
+    def load_if_changed(keys, args):
+        """`scripts.LOAD_IF_CHANGED` by the mocked `hget` and `get`, without the timestamp."""
+        data_hash = test_redis.hget(keys[1], "hash")
+        if not args[1] or data_hash is not None and data_hash.decode("utf-8") == args[0]:
+            return [data_hash, None, None]
+        return [data_hash, None, test_redis.get(keys[0])]
+
+    default_script = test_redis.register_script.return_value
+    test_redis.register_script.side_effect = lambda script: (
+        load_if_changed if script == scripts.LOAD_IF_CHANGED else default_script
+    )
     return test_redis
 
 
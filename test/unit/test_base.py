@@ -1,10 +1,44 @@
-from kw.cache import json, utils
+from datetime import datetime, timedelta
+import hashlib
+import threading
+
+import pytest
+from redis import exceptions as redis_exceptions
+import structlog
+
+from kw.cache import helpers, json, utils
+from kw.cache.base import encode_cache_record
+from kw.cache.helpers import CallAttemptException, ReadTimeoutError
 
 
 def test_resource(cache):
     assert cache._cache_key == "resource:UUTResource"
 
 
+@pytest.fixture
+def structlog_events():
+    events = []
+
+    def collect(logger, method_name, event_dict):
+        events.append(event_dict)
+        raise structlog.DropEvent
+
+    yield events, collect
+    structlog.reset_defaults()
+
+
+def test_logger_reconfigured(cache, structlog_events, mocker):
+    events, collect = structlog_events
+    cache._log_warning("kiwicache.first")
+    structlog.configure(processors=[collect])
+    cache._log_warning("kiwicache.second")
+    assert [event["event"] for event in events] == ["kiwicache.second"], "Later configuration is used"
+
+    loads = mocker.patch.object(json, "loads", return_value={})
+    cache.json.loads("{}")
+    assert loads.call_count == 1, "Functions patched after the first use are used"
+
+
 def test_load_from_cache(cache, redis, test_cache_record):
     redis.get.return_value = json.dumps(test_cache_record)
     assert cache.load_from_cache() == test_cache_record
@@ -13,13 +47,50 @@ def test_load_from_cache(cache, redis, test_cache_record):
 
 def test_save_to_cache(mocker, cache, redis, test_data, test_cache_record):
     mocker.patch.object(utils, "get_current_timestamp", return_value=test_cache_record.timestamp)
+    touch_if_unchanged = mocker.patch.object(cache, "_touch_if_unchanged", return_value=False)
+    cache.save_to_cache(test_data)
+    data_hash = hashlib.sha1(json.dumps(test_data).encode("utf-8")).hexdigest()
+    touch_if_unchanged.assert_called_once_with(data_hash, test_cache_record.timestamp, cache._cache_ttl)
+    pipeline = redis.pipeline.return_value
+    payload, _ = encode_cache_record(cache._dumps_data, test_cache_record)
+    pipeline.set.assert_called_once_with(cache._cache_key, payload, ex=cache._cache_ttl)
+    pipeline.hmset.assert_called_once_with(
+        cache._meta_key, {"timestamp": test_cache_record.timestamp, "hash": data_hash}
+    )
+    pipeline.expire.assert_called_once_with(cache._meta_key, cache._cache_ttl)
+    pipeline.execute.assert_called_once_with()
+
+
+def test_save_to_cache_unchanged(mocker, cache, redis, test_data):
+    mocker.patch.object(cache, "_touch_if_unchanged", return_value=True)
+    increment_metric = mocker.patch.object(cache, "_increment_metric")
     cache.save_to_cache(test_data)
-    redis.set.assert_called_once_with(cache._cache_key, json.dumps(test_cache_record), ex=cache._cache_ttl)
+    redis.pipeline.assert_not_called()
+    increment_metric.assert_called_once_with("unchanged")
+
+
+def test_reload_from_cache_unchanged(cache, redis, test_cache_record):
+    redis.get.return_value = json.dumps(test_cache_record)
+    redis.hget.return_value = b"hash"
+    assert cache.reload_from_cache() is True
+    assert cache.reload_from_cache() is True
+    assert redis.get.call_count == 1, "Unchanged data are not downloaded again"
+
+    redis.hget.return_value = b"changed"
+    assert cache.reload_from_cache() is True
+    assert redis.get.call_count == 2
+
+
+def test_reload_from_cache_error(mocker, cache, redis):
+    redis.register_script.side_effect = lambda script: mocker.Mock(side_effect=redis_exceptions.ConnectionError)
+    process_cache_error = mocker.spy(cache, "_process_cache_error")
+    assert cache.reload_from_cache() is False
+    process_cache_error.assert_called_once_with("kiwicache.load_failed")
 
 
 def test_refill_cache_no_redis(mocker, cache, redis):
     load_from_source = mocker.patch.object(cache, "load_from_source")
-    mocker.patch.object(cache, "_get_refill_lock", return_value=None)
+    mocker.patch.object(cache, "_get_refill_lock_or_timestamp", return_value=(None, None))
     save_to_cache = mocker.patch.object(cache, "save_to_cache")
     reload_from_cache = mocker.patch.object(cache, "reload_from_cache")
 
@@ -27,73 +98,75 @@ def test_refill_cache_no_redis(mocker, cache, redis):
     save_to_cache.assert_not_called()
     load_from_source.assert_not_called()
     reload_from_cache.assert_not_called()
-    redis.expire.assert_not_called()
+    redis.pipeline.return_value.expire.assert_not_called()
 
 
 def test_refill_cache_source_with_error(mocker, cache, redis):
     mocker.patch.object(cache, "load_from_source", side_effect=Exception())
-    mocker.patch.object(cache, "_get_refill_lock", return_value=True)
+    mocker.patch.object(cache, "_get_refill_lock_or_timestamp", return_value=(True, None))
     save_to_cache = mocker.patch.object(cache, "save_to_cache")
-    reload_from_cache = mocker.patch.object(cache, "reload_from_cache")
+    reload_from_cache = mocker.patch.object(cache, "_reload_from_cache")
+    redis.pipeline.return_value.execute.return_value = [True, True, b"hash"]
     refill_fail = mocker.spy(cache, "_process_refill_error")
 
     cache.refill_cache()
     save_to_cache.assert_not_called()
     assert reload_from_cache.call_count == 1
-    redis.expire.assert_called_once_with(cache._cache_key, time=cache._cache_ttl)
+    redis.pipeline.return_value.expire.assert_any_call(cache._cache_key, time=cache._cache_ttl)
+    redis.pipeline.return_value.expire.assert_any_call(cache._meta_key, time=cache._cache_ttl)
     assert refill_fail.call_count == 1
 
 
 def test_refill_cache_no_source(mocker, cache, redis):
-    mocker.patch.object(cache, "_get_refill_lock", return_value=True)
+    mocker.patch.object(cache, "_get_refill_lock_or_timestamp", return_value=(True, None))
     save_to_cache = mocker.patch.object(cache, "save_to_cache")
-    reload_from_cache = mocker.patch.object(cache, "reload_from_cache")
+    reload_from_cache = mocker.patch.object(cache, "_reload_from_cache")
+    redis.pipeline.return_value.execute.return_value = [True, True, b"hash"]
 
     cache.refill_cache()
     save_to_cache.assert_not_called()
     assert reload_from_cache.call_count == 1
-    redis.expire.assert_called_once_with(cache._cache_key, time=cache._cache_ttl)
+    redis.pipeline.return_value.expire.assert_any_call(cache._cache_key, time=cache._cache_ttl)
+    redis.pipeline.return_value.expire.assert_any_call(cache._meta_key, time=cache._cache_ttl)
 
 
 def test_refill_cache_no_source_with_wait(mocker, cache, redis):
     mocker.patch("time.sleep")
-    mocker.patch.object(cache, "_get_refill_lock", side_effect=[False, False, True])
+    mocker.patch.object(cache, "_get_refill_lock_or_timestamp", side_effect=[(False, None), (False, 1.0), (True, None)])
     save_to_cache = mocker.patch.object(cache, "save_to_cache")
-    reload_from_cache = mocker.patch.object(cache, "reload_from_cache", return_value=False)
-    is_refilled = mocker.patch.object(cache, "_is_refilled", return_value=False)
+    reload_from_cache = mocker.patch.object(cache, "_reload_from_cache", return_value=False)
+    redis.pipeline.return_value.execute.return_value = [True, True, b"hash"]
 
     cache.refill_cache()
     save_to_cache.assert_not_called()
     assert reload_from_cache.call_count == 1
-    assert is_refilled.call_count == 2
-    redis.expire.assert_called_once_with(cache._cache_key, time=cache._cache_ttl)
+    redis.pipeline.return_value.expire.assert_any_call(cache._cache_key, time=cache._cache_ttl)
+    redis.pipeline.return_value.expire.assert_any_call(cache._meta_key, time=cache._cache_ttl)
 
 
 def test_refill_cache_source(mocker, cache, redis, test_data):
     mocker.patch.object(cache, "load_from_source", return_value=test_data)
-    mocker.patch.object(cache, "_get_refill_lock", return_value=True)
-    save_to_cache = mocker.patch.object(cache, "save_to_cache")
+    mocker.patch.object(cache, "_get_refill_lock_or_timestamp", return_value=(True, None))
+    save_refilled_data = mocker.patch.object(cache, "_save_refilled_data", return_value=True)
     reload_from_cache = mocker.patch.object(cache, "reload_from_cache")
 
-    cache.refill_cache()
-    save_to_cache.assert_called_with(test_data)
+    assert cache.refill_cache() is True
+    save_refilled_data.assert_called_with(test_data)
     reload_from_cache.assert_not_called()
-    redis.expire.assert_not_called()
+    redis.pipeline.return_value.expire.assert_not_called()
 
 
 def test_refill_cache_source_with_wait(mocker, cache, redis, test_data):
     mocker.patch("time.sleep")
     mocker.patch.object(cache, "load_from_source", return_value=test_data)
-    mocker.patch.object(cache, "_get_refill_lock", side_effect=[False, False, True])
-    save_to_cache = mocker.patch.object(cache, "save_to_cache")
+    mocker.patch.object(cache, "_get_refill_lock_or_timestamp", side_effect=[(False, None), (False, 1.0), (True, None)])
+    save_refilled_data = mocker.patch.object(cache, "_save_refilled_data", return_value=True)
     reload_from_cache = mocker.patch.object(cache, "reload_from_cache", return_value=False)
-    is_refilled = mocker.patch.object(cache, "_is_refilled", return_value=False)
 
-    cache.refill_cache()
-    save_to_cache.assert_called_with(test_data)
+    assert cache.refill_cache() is True
+    save_refilled_data.assert_called_with(test_data)
     reload_from_cache.assert_not_called()
-    assert is_refilled.call_count == 2
-    redis.expire.assert_not_called()
+    redis.pipeline.return_value.expire.assert_not_called()
 
 
 def test_reload_from_cache_with_data(mocker, cache, test_data, test_cache_record):
@@ -107,8 +180,159 @@ def test_reload_from_cache_with_data(mocker, cache, test_data, test_cache_record
 
 def test_reload_from_cache_no_data(mocker, cache):
     _data = mocker.patch.object(cache, "_data", new_callable=mocker.PropertyMock)
-    expires_at = mocker.patch.object(cache, "expires_at", new_callable=mocker.PropertyMock)
+    prolong_data_expiration = mocker.patch.object(cache, "_prolong_data_expiration")
 
     assert cache.reload_from_cache() is False
     _data.assert_not_called()
-    expires_at.assert_not_called()
+    prolong_data_expiration.assert_not_called()
+
+
+def test_get_many(mocker, cache, test_data, test_cache_record):
+    mocker.patch.object(cache, "load_from_cache", return_value=test_cache_record)
+    maybe_reload = mocker.spy(cache, "maybe_reload")
+
+    assert cache.get_many(["a", "c", "x"]) == [test_data["a"], test_data["c"], None]
+    assert cache.get_many(iter(["x", "b"]), default=0) == [0, test_data["b"]]
+    assert maybe_reload.call_count == 1, "Fresh data are read without the reload check"
+
+
+def test_refill_cache_refilled_meanwhile(mocker, cache):
+    mocker.patch("time.sleep")
+    mocker.patch.object(utils, "get_current_timestamp", return_value=1000.0)
+    get_lock = mocker.patch.object(
+        cache, "_get_refill_lock_or_timestamp", side_effect=[(False, 999.0), (False, 1001.0)]
+    )
+    load_from_source = mocker.patch.object(cache, "load_from_source")
+
+    cache.refill_cache()
+    load_from_source.assert_not_called()
+    assert get_lock.call_count == 2
+
+
+def replica_with(mocker, value=None, data_hash=None, error=None):
+    replica = mocker.Mock()
+    replica.pipeline.return_value.execute.side_effect = [error or [value, data_hash]]
+    return replica
+
+
+def test_load_from_replica(mocker, cache, redis, test_cache_record):
+    redis.hget.return_value = b"hash"
+    cache.read_redis = [replica_with(mocker, json.dumps(test_cache_record), b"hash")]
+    assert cache.reload_from_cache() is True
+    assert cache._data == test_cache_record.data
+    redis.get.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "replica_result",
+    [
+        {"error": redis_exceptions.ConnectionError()},
+        {"value": None},
+        {"value": "{}", "data_hash": b"old hash"},
+    ],
+    ids=["error", "missing", "lagging"],
+)
+def test_load_from_replica_fallback(mocker, cache, redis, test_cache_record, replica_result):
+    redis.hget.return_value = b"hash"
+    redis.get.return_value = json.dumps(test_cache_record)
+    cache.read_redis = [replica_with(mocker, **replica_result)]
+    assert cache.reload_from_cache() is True
+    assert cache._data == test_cache_record.data
+    redis.get.assert_called_once_with(cache._cache_key)
+
+
+def test_circuit_breaker_serves_local_data(mocker, cache, redis, test_data):
+    mocker.patch.dict(helpers.circuit_breakers, {redis: helpers.CircuitBreaker()})
+    log_exception = mocker.patch.object(cache, "_log_exception")
+    increment_metric = mocker.patch.object(cache, "_increment_metric")
+    redis.get.side_effect = redis_exceptions.ConnectionError()
+    for _ in range(5):
+        assert cache.load_from_cache() is None
+    assert log_exception.call_count == 5
+
+    cache._set_data(test_data)
+    cache.expires_at = datetime.utcnow() - timedelta(seconds=1)
+    redis.reset_mock()
+    redis.get.reset_mock()
+    log_exception.reset_mock()
+    assert cache.data == test_data
+    assert cache.expires_at > datetime.utcnow(), "Local data are prolonged"
+    assert not redis.method_calls, "Redis is not called when the circuit is open"
+
+    assert cache.load_from_cache() is None
+    redis.get.assert_not_called()
+    log_exception.assert_not_called()
+    increment_metric.assert_called_with("circuit_open")
+
+
+def test_read_timeout_serves_stale_data(mocker, cache, test_data):
+    reload_finished = threading.Event()
+    reload = mocker.patch.object(cache, "reload", side_effect=lambda: reload_finished.wait(5))
+    increment_metric = mocker.patch.object(cache, "_increment_metric")
+    cache.read_timeout = timedelta(milliseconds=10)
+    cache._set_data(test_data)
+    cache.expires_at = datetime.utcnow() - timedelta(seconds=1)
+
+    assert cache.data == test_data, "Stale data are served when the reload takes too long"
+    assert cache.get_many(["a", "b"]) == [1, 2]
+    assert reload.call_count == 1, "Readers share one background reload"
+    increment_metric.assert_called_with("read_timeout")
+    assert increment_metric.call_count == 2
+
+    background_reload = cache._background_reload
+    reload_finished.set()
+    assert background_reload.wait(1)
+    assert cache._background_reload is None
+
+
+def test_read_timeout_without_data(mocker, cache):
+    reload_finished = threading.Event()
+    mocker.patch.object(cache, "reload", side_effect=lambda: reload_finished.wait(5))
+    cache.read_timeout = timedelta(milliseconds=10)
+    with pytest.raises(ReadTimeoutError):
+        cache.data  # pylint: disable=pointless-statement
+    reload_finished.set()
+
+
+def test_read_timeout_reload_error(mocker, cache):
+    mocker.patch.object(cache, "reload", side_effect=CallAttemptException("uutresource.load_from_source"))
+    cache.read_timeout = timedelta(seconds=1)
+    with pytest.raises(CallAttemptException):
+        cache.data  # pylint: disable=pointless-statement
+
+
+def test_read_expired_and_transient(mocker, cache, test_data):
+    maybe_reload = mocker.patch.object(cache, "maybe_reload")
+    cache._set_data(test_data)
+    assert cache["a"] == 1
+    assert cache.get("x", 0) == 0
+    assert "b" in cache
+    with pytest.raises(KeyError):
+        cache["x"]  # pylint: disable=pointless-statement
+    maybe_reload.assert_not_called()
+
+    mocker.patch.object(utils, "get_current_timestamp", return_value=0)
+    cache.expires_at = datetime.utcnow() - timedelta(seconds=1)
+    assert cache["a"] == 1
+    assert maybe_reload.call_count == 1, "Expired data are reloaded"
+
+    cache._transient = True
+    cache._prolong_data_expiration()
+    assert cache["a"] == 1
+    assert maybe_reload.call_count == 2, "Transient data are dropped after the read"
+
+
+def test_read_fast_path_calls(cache, mocker, redis):
+    data = {"key{}".format(i): i for i in range(1000)}
+    cache._set_data(data)
+    utcnow = mocker.patch("kw.cache.base.datetime", wraps=datetime)
+    monotonic = mocker.patch("kw.cache.base._monotonic", wraps=utils.monotonic)
+    maybe_reload = mocker.spy(cache, "maybe_reload")
+    redis.reset_mock()
+
+    assert [cache[key] for key in data] == [data[key] for key in data]
+    assert cache.get("x") is None
+    assert monotonic.call_count == len(data) + 1, "Each read checks the clock once"
+    assert redis.method_calls == [], "Reads of fresh data do not call redis"
+    assert utcnow.utcnow.call_count == 0, "Reads of fresh data only check the monotonic deadline"
+    assert maybe_reload.call_count == 0
@@ -0,0 +1,83 @@
+import attr
+import pytest
+
+from kw.cache import utils
+
+np = pytest.importorskip("numpy")
+columnar = pytest.importorskip("kw.cache.columnar")
+
+RATES = [
+    {"currency": "USD", "rate": 1.1, "precision": 2},
+    {"currency": "CZK", "rate": 25.5, "precision": 2},
+    {"currency": "JPY", "rate": 120.0, "precision": 0},
+]
+
+
+@attr.s
+class RatesCache(columnar.ColumnarKiwiCache):
+    def load_from_source(self):
+        return columnar.ColumnarTable.from_rows(RATES, key="currency", columns=["rate", "precision"])
+
+
+@pytest.fixture
+def table():
+    return columnar.ColumnarTable.from_rows(RATES, key="currency", columns=["rate", "precision"])
+
+
+def test_table_lookup(table):  # pylint: disable=redefined-outer-name
+    assert table.keys.tolist() == ["CZK", "JPY", "USD"]
+    rates = table.lookup(["USD", "XXX", "CZK", "AAA", "ZZZ"], "rate")
+    np.testing.assert_array_equal(rates, [1.1, np.nan, 25.5, np.nan, np.nan])
+    np.testing.assert_array_equal(table.lookup(np.array(["JPY"]), "precision", default=-1), [0])
+
+    assert table["CZK"] == {"rate": 25.5, "precision": 2}
+    assert "JPY" in table
+    assert "XXX" not in table
+    assert table.get("XXX") is None
+    assert list(table) == ["CZK", "JPY", "USD"]
+
+    empty_table = columnar.ColumnarTable(keys=[], columns={"rate": []})
+    np.testing.assert_array_equal(empty_table.lookup(["USD"], "rate"), [np.nan])
+    assert not empty_table
+
+
+def test_table_unique_keys():
+    with pytest.raises(ValueError):
+        columnar.ColumnarTable(keys=["USD", "USD"], columns={"rate": [1, 2]})
+
+
+def test_table_record_encoding(table):  # pylint: disable=redefined-outer-name
+    cache_record = columnar.CacheRecord(data=table, timestamp=1234.5)
+    payload, data_hash = columnar.encode_table_record(cache_record)
+    assert isinstance(payload, bytes)
+    assert data_hash == table.digest()
+
+    decoded = columnar.decode_table_record(payload)
+    assert decoded.timestamp == 1234.5
+    assert decoded.data.digest() == table.digest()
+    assert decoded.data["USD"] == {"rate": 1.1, "precision": 2}
+
+    changed_table = columnar.ColumnarTable(keys=table.keys, columns=dict(table.columns, rate=table.columns["rate"] * 2))
+    assert changed_table.digest() != table.digest()
+
+
+def test_table_memory(table):  # pylint: disable=redefined-outer-name
+    rows = [{"currency": "C{:05}".format(i), "rate": float(i)} for i in range(10000)]
+    dict_size = utils.estimate_size({row["currency"]: row for row in rows})
+    table_size = utils.estimate_size(columnar.ColumnarTable.from_rows(rows, key="currency", columns=["rate"]))
+    assert table_size < dict_size / 5
+
+
+def test_cache(mocker, redis, table):  # pylint: disable=redefined-outer-name
+    mocker.patch.object(RatesCache, "_touch_if_unchanged", return_value=False)
+    cache = RatesCache(resources_redis=redis)
+    cache.save_to_cache(table)
+    payload = redis.pipeline.return_value.set.call_args[0][1]
+    redis.get.return_value = payload
+
+    np.testing.assert_array_equal(cache.lookup(["USD", "JPY"], "rate"), [1.1, 120.0])
+    assert cache["CZK"]["rate"] == 25.5
+    assert cache.get_many(["JPY", "XXX"]) == [{"rate": 120.0, "precision": 0}, None]
+
+    redis.get.return_value = b"malformed"
+    assert cache.load_from_cache() is None
@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta
+
+from kw.cache.derived import derived
+
+from .conftest import UUTResource
+
+
+def test_derived_cache(mocker, redis):
+    airlines = UUTResource(resources_redis=redis)
+    airlines._set_data({"FR": "Ryanair", "W6": "Wizz Air"})
+    mocker.patch.object(airlines, "reload", side_effect=airlines._prolong_data_expiration)
+    transform = mocker.Mock(side_effect=lambda data: {name: code for code, name in data.items()})
+    airline_codes = derived(airlines)(transform)
+
+    assert airline_codes() == {"Ryanair": "FR", "Wizz Air": "W6"}
+    assert airline_codes()["Ryanair"] == "FR"
+    assert transform.call_count == 1, "The derived structure is memoized"
+
+    airlines.expires_at = datetime.utcnow() - timedelta(seconds=1)
+    assert airline_codes() == {"Ryanair": "FR", "Wizz Air": "W6"}
+    assert airlines.reload.call_count == 1
+    assert transform.call_count == 1, "Reload of the same data does not recompute the derived structure"
+
+    airlines._set_data({"FR": "Ryanair"})
+    assert airline_codes() == {"Ryanair": "FR"}
+    assert transform.call_count == 2
+
+
+def test_derived_from_more_caches(redis):
+    airlines = UUTResource(resources_redis=redis)
+    airlines._set_data({"FR": "Ryanair", "W6": "Wizz Air"})
+    fleets = UUTResource(resources_redis=redis)
+    fleets._set_data({"FR": 400})
+
+    @derived(airlines, fleets)
+    def fleet_by_name(airline_data, fleet_data):
+        return {name: fleet_data.get(code, 0) for code, name in airline_data.items()}
+
+    assert fleet_by_name() == {"Ryanair": 400, "Wizz Air": 0}
+    fleets._set_data({"FR": 400, "W6": 100})
+    assert fleet_by_name() == {"Ryanair": 400, "Wizz Air": 100}
@@ -0,0 +1,71 @@
+from datetime import timedelta
+import itertools
+import random
+
+import pytest
+
+from kw.cache import json, utils
+
+from .conftest import UUTResource
+
+WORKERS = 50
+
+
+def simulate_redis_requests(frozen_time, redis, workers, seconds=600):
+    """Tick the time by one second and count redis requests of all workers in each tick."""
+    requests = []
+    for _ in range(seconds):
+        frozen_time.tick(timedelta(seconds=1))
+        calls_before = redis.get.call_count
+        for worker in workers:
+            worker.maybe_reload()
+        requests.append(redis.get.call_count - calls_before)
+    return requests
+
+
+@pytest.fixture
+def workers(redis, test_cache_record):
+    random.seed(0)
+    redis.get.return_value = json.dumps(test_cache_record)
+
+    def create(**params):
+        return [UUTResource(resources_redis=redis, **params) for _ in range(WORKERS)]
+
+    return create
+
+
+def test_lockstep_without_jitter(frozen_time, redis, workers):
+    requests = simulate_redis_requests(frozen_time, redis, workers())
+    assert max(requests[1:]) == WORKERS, "All workers reload in the same second"
+
+
+def test_reload_jitter_flattens_requests(frozen_time, redis, workers):
+    requests = simulate_redis_requests(frozen_time, redis, workers(reload_jitter=0.5))
+    assert sum(requests) > 5 * WORKERS
+    assert max(requests[120:]) <= WORKERS // 5
+
+
+def test_early_reload_flattens_requests(mocker, frozen_time, redis, workers):
+    # each reload takes 10 seconds
+    mocker.patch.object(utils, "get_current_timestamp", side_effect=itertools.count(0, 10))
+    requests = simulate_redis_requests(frozen_time, redis, workers(early_reload_beta=1.0))
+    assert sum(requests) > 5 * WORKERS
+    assert max(requests[120:]) <= WORKERS // 5
+
+
+def test_early_reload_disabled(mocker, frozen_time, redis, workers):
+    mocker.patch.object(utils, "get_current_timestamp", side_effect=itertools.count(0, 10))
+    requests = simulate_redis_requests(frozen_time, redis, workers())
+    assert max(requests[1:]) == WORKERS, "Early reload is disabled by default"
+
+
+def test_cache_ttl_jitter(mocker, cache, redis, test_data):
+    mocker.patch.object(cache, "_touch_if_unchanged", return_value=False)
+    cache.cache_ttl_jitter = 0.5
+    expirations = set()
+    for _ in range(10):
+        cache.save_to_cache(test_data)
+        expirations.add(redis.pipeline.return_value.set.call_args[1]["ex"])
+
+    assert len(expirations) > 1
+    assert all(cache._cache_ttl / 2 <= expiration <= cache._cache_ttl for expiration in expirations)
@@ -0,0 +1,105 @@
+from datetime import timedelta
+
+import pytest
+from redis import exceptions as redis_exceptions
+
+from kw.cache import utils
+from kw.cache.helpers import (
+    BloomFilter,
+    CircuitBreaker,
+    circuit_breakers,
+    CircuitOpenError,
+    get_circuit_breaker,
+    LRUCache,
+)
+
+
+def test_lru_cache_max_size():
+    cache = LRUCache(max_size=2)
+    cache.set("a", 1, timedelta(minutes=1))
+    cache.set("b", 2, timedelta(minutes=1))
+    assert cache.get("a") == 1
+
+    cache.set("c", 3, timedelta(minutes=1))
+    assert len(cache) == 2
+    assert cache.get("b") is None, "The least recently used entry is dropped"
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_lru_cache_expiration(frozen_time):
+    cache = LRUCache()
+    cache.set("a", 1, timedelta(seconds=10))
+    frozen_time.tick(timedelta(seconds=9))
+    assert cache.get("a") == 1
+
+    frozen_time.tick(timedelta(seconds=1))
+    assert cache.get("a", "default") == "default"
+    assert not cache
+
+
+def test_bloom_filter():
+    bloom_filter = BloomFilter.from_keys(range(1000), error_rate=0.01)
+    assert all(key in bloom_filter for key in range(1000))
+    assert "5" in bloom_filter, "Keys are compared by their string value"
+    false_positives = sum(key in bloom_filter for key in range(1000, 11000))
+    assert false_positives < 200
+
+    bloom_filter.add("\u010de\u0161tina")
+    assert "\u010de\u0161tina" in bloom_filter, "Non-ASCII keys are encoded as UTF-8"
+
+    loaded_filter = BloomFilter.loads(bloom_filter.dumps())
+    assert (loaded_filter.size, loaded_filter.hash_count) == (bloom_filter.size, bloom_filter.hash_count)
+    assert all(key in loaded_filter for key in range(1000))
+    with pytest.raises(ValueError):
+        BloomFilter.loads(bloom_filter.dumps()[:-1])
+    with pytest.raises(ValueError):
+        BloomFilter.loads(b"")
+
+
+def failing_call(circuit_breaker):
+    with pytest.raises(redis_exceptions.ConnectionError):
+        with circuit_breaker.guard():
+            raise redis_exceptions.ConnectionError()
+
+
+def test_circuit_breaker(mocker):
+    mocker.patch.object(utils, "get_current_timestamp", return_value=100)
+    circuit_breaker = CircuitBreaker(failure_threshold=2, reset_timeout=timedelta(seconds=10))
+    failing_call(circuit_breaker)
+    assert not circuit_breaker.is_open
+
+    failing_call(circuit_breaker)
+    assert circuit_breaker.is_open
+    with pytest.raises(CircuitOpenError):
+        with circuit_breaker.guard():
+            pytest.fail("The client must not be called when the breaker is open")
+
+    utils.get_current_timestamp.return_value = 110
+    assert not circuit_breaker.is_open
+    assert circuit_breaker.allow(), "One probe is let through after the timeout"
+    assert not circuit_breaker.allow(), "Other calls wait for the probe"
+
+    utils.get_current_timestamp.return_value = 120
+    failing_call(circuit_breaker)
+    assert circuit_breaker.is_open, "Failed probe opens the breaker again"
+
+    utils.get_current_timestamp.return_value = 130
+    with circuit_breaker.guard():
+        pass
+    assert not circuit_breaker.is_open
+    assert circuit_breaker.allow() and circuit_breaker.allow()
+
+    for _ in range(3):
+        with pytest.raises(redis_exceptions.ResponseError):
+            with circuit_breaker.guard():
+                raise redis_exceptions.ResponseError()
+    assert not circuit_breaker.is_open, "Only connection errors are failures"
+
+
+def test_circuit_breaker_disabled_by_default(redis):
+    circuit_breaker = get_circuit_breaker(redis)
+    for _ in range(10):
+        failing_call(circuit_breaker)
+    assert not circuit_breaker.is_open
+    assert redis not in circuit_breakers
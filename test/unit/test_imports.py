@@ -0,0 +1,47 @@
+import subprocess
+import sys
+
+import pytest
+
+import kw.cache
+
+LAZY_MODULES = [
+    "aioredis",
+    "kw.cache.aio",
+    "kw.cache.dbcache",
+    "kw.cache.json",
+    "simplejson",
+    "sqlalchemy",
+    "structlog",
+]
+
+
+def imported_modules(statement):
+    """Import in a new interpreter and return which of the lazily imported modules were loaded."""
+    script = "import sys\n{}\nprint(' '.join(name for name in {!r} if name in sys.modules))".format(
+        statement, LAZY_MODULES + ["kw.cache.base", "redis"]
+    )
+    return subprocess.check_output([sys.executable, "-c", script]).decode("utf-8").split()
+
+
+def test_exported_names():
+    names = ["KeyedKiwiCache", "KiwiCache", "SQLAlchemyResource"]
+    if sys.version_info >= (3, 5):
+        names += ["AioKeyedKiwiCache", "AioKiwiCache"]
+    for name in names:
+        assert getattr(kw.cache, name).__name__ == name
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason="requires module __getattr__")
+def test_import_cache():
+    assert imported_modules("import kw.cache.base") == ["kw.cache.base", "redis"]
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason="requires module __getattr__")
+def test_import_package():
+    assert imported_modules("import kw.cache") == []
+    assert imported_modules("from kw.cache import KiwiCache") == ["kw.cache.base", "redis"]
+
+    with pytest.raises(AttributeError):
+        kw.cache.MissingCache  # pylint: disable=pointless-statement
+    assert "KeyedKiwiCache" in dir(kw.cache)
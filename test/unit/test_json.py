@@ -0,0 +1,237 @@
+import collections
+import datetime
+from decimal import Decimal
+import enum
+import inspect
+import json as std_json
+import sys
+
+import attr
+import pytest
+import simplejson
+
+from kw.cache import json
+from kw.cache.base import dumps_asdict
+
+
+class Color(enum.Enum):
+    RED = 1
+
+
+class Size(enum.IntEnum):
+    SMALL = 1
+
+
+@attr.s
+class Credentials(object):
+    login = attr.ib()
+    password = attr.ib()
+
+
+class Booking(object):
+    def asdict(self):
+        return {"id": 1, "booking_token": "abc", "api_key": "xyz"}
+
+
+Point = collections.namedtuple("Point", ["x", "y"])
+
+
+class Money(object):
+    def __init__(self, amount, currency):
+        self.amount = amount
+        self.currency = currency
+
+
+def legacy_default_encoder(obj):
+    """Default encoder before the handlers registry, the reference of the output."""
+    if isinstance(obj, Decimal):
+        return str(float(obj))
+    if hasattr(obj, "isoformat"):
+        return str(obj)
+    if isinstance(obj, set):
+        return list(obj)
+    if isinstance(obj, enum.Enum):
+        return obj.name
+    try:
+        return attr.asdict(obj, dict_factory=json.masked_dict)
+    except attr.exceptions.NotAnAttrsClassError:
+        pass
+    try:
+        obj_dict = obj.asdict()
+    except AttributeError:
+        pass
+    else:
+        return json.masked_dict(list(obj_dict.items()))
+    raise TypeError(repr(obj) + " is not JSON serializable")
+
+
+VALUES = [
+    Decimal("1.10"),
+    datetime.date(2020, 1, 22),
+    datetime.datetime(2020, 1, 22, 10, 30, 15, 123),
+    datetime.time(10, 30),
+    {3, 1, 2},
+    Color.RED,
+    Credentials("admin", "secret"),
+    Booking(),
+]
+
+
+def resource_data(size=1000):
+    return {
+        "row{}".format(i): {
+            "price": Decimal("12.50"),
+            "updated_at": datetime.datetime(2020, 1, 22, 10, 30, i % 60),
+            "departure": datetime.date(2020, 2, 1),
+            "color": Color.RED,
+            "tags": {"a"},
+            "owner": Credentials("admin", "secret"),
+            "booking": Booking(),
+        }
+        for i in range(size)
+    }
+
+
+@pytest.mark.parametrize("value", VALUES)
+def test_default_encoder_output(value):
+    assert json.default_encoder(value) == legacy_default_encoder(value)
+    assert json.dumps({"value": value}) == simplejson.dumps({"value": value}, default=legacy_default_encoder)
+
+
+def test_default_encoder_not_serializable():
+    with pytest.raises(TypeError):
+        json.default_encoder(object())
+
+
+def test_default_encoder_register():
+    encoders = json.EncoderRegistry()
+    encoders.register(Money, lambda money: "{} {}".format(money.amount, money.currency))
+    assert encoders.encode(Money(10, "EUR")) == "10 EUR"
+
+    class Euro(Money):
+        def __init__(self, amount):
+            super(Euro, self).__init__(amount, "EUR")
+
+    assert encoders.encode(Euro(5)) == "5 EUR", "Handlers are used for subclasses"
+
+    encoders.register(Euro, lambda money: "{} \u20ac".format(money.amount))
+    assert encoders.encode(Euro(5)) == "5 \u20ac", "Cached handlers are dropped on register"
+
+
+def test_masked_dict():
+    assert json.masked_dict({"id": 1, "Password": "x", "public_key": "y", "api_key": "z"}) == {
+        "id": 1,
+        "Password": "-- MASKED --",
+        "public_key": "y",
+        "api_key": "-- MASKED --",
+    }
+    assert json.masked_dict() == {}
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        resource_data(10),
+        {1: "a", 1.5: "b", False: "c", None: "d", "e": (1, 2.5, [float("inf")])},
+        pytest.param(
+            [Size.SMALL],
+            marks=pytest.mark.skipif(sys.version_info < (3, 0), reason="json of Python 2 dumps int enums by str"),
+        ),
+        [Color.RED, {Decimal("1"), "x"}, Credentials("admin", "secret")],
+        "text",
+        None,
+    ],
+)
+def test_jsonify_output(value):
+    assert json.jsonify(value) == std_json.loads(std_json.dumps(value, default=legacy_default_encoder))
+
+
+def test_jsonify_not_serializable():
+    with pytest.raises(TypeError):
+        json.jsonify({(1, 2): "tuple keys are not allowed"})
+
+
+def test_encode_resolves_handlers_once(mocker):
+    resolve = mocker.spy(json.EncoderRegistry, "_resolve")
+    encoders = json.EncoderRegistry()
+    for cls, handler in json.encoders._handlers.items():
+        encoders.register(cls, handler)
+
+    for _ in range(100):
+        assert [encoders.encode(value) for value in VALUES] == [legacy_default_encoder(value) for value in VALUES]
+    assert resolve.call_count == len(set(type(value) for value in VALUES)), "Handlers are cached per type"
+
+
+TYPE_CHECKS = (isinstance, issubclass, hasattr, inspect.getmro)
+
+
+def count_calls(func, functions=None):
+    """Count calls made by `func` (of the given builtin `functions` only), a deterministic measure of its cost."""
+    calls = [0]
+
+    def profile(frame, event, arg):  # pylint: disable=unused-argument
+        if event == "c_call" and (functions is None or arg in functions) or event == "call" and functions is None:
+            calls[0] += 1
+
+    sys.setprofile(profile)
+    try:
+        func()
+    finally:
+        sys.setprofile(None)
+    return calls[0]
+
+
+def test_encode_throughput():
+    values = VALUES * 100
+    for value in VALUES:  # handlers are resolved on the first use of each type
+        json.default_encoder(value)
+
+    legacy_calls = count_calls(lambda: [legacy_default_encoder(value) for value in values])
+    registry_calls = count_calls(lambda: [json.default_encoder(value) for value in values])
+    assert registry_calls < legacy_calls
+
+    plain_values = [value for value in values if not isinstance(value, (Credentials, Booking))]
+    assert count_calls(lambda: [legacy_default_encoder(value) for value in plain_values], TYPE_CHECKS) > 0
+    assert (
+        count_calls(lambda: [json.default_encoder(value) for value in plain_values], TYPE_CHECKS) == 0
+    ), "Values are encoded by the cached handler of their type without any type checks"
+
+
+def test_dumps_resource_data():
+    data = resource_data()
+    assert json.dumps(data) == simplejson.dumps(data, default=legacy_default_encoder)
+
+
+@pytest.mark.skipif(sys.version_info < (3, 0), reason="jsonify does a json round trip on Python 2")
+def test_jsonify_without_round_trip(mocker):
+    data = resource_data()
+    expected = std_json.loads(std_json.dumps(data, default=legacy_default_encoder))
+    dumps = mocker.spy(json.json, "dumps")
+    assert json.jsonify(data) == expected
+    assert dumps.call_count == 0
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        resource_data(10),
+        {"owner": Credentials("admin", "secret"), "nested": [Credentials("a", Point(1, 2))]},
+        {1: Point(1, 2), "set": {1}, "tuple": (1, [2, (3,)]), "empty": {}},
+        [Color.RED, Decimal("1.5"), datetime.date(2020, 1, 22)],
+        [],
+        {},
+        "text",
+        1.5,
+    ],
+)
+def test_dumps_data_output(value):
+    output = json.dumps_data(value)
+    if sys.version_info >= (3, 6):
+        assert output == dumps_asdict(json.dumps, value), "Output is the same as of the copy by asdict"
+    else:  # dicts copied by asdict have another order
+        assert json.loads(output) == json.loads(dumps_asdict(json.dumps, value))
+    assert "".join(json.iterencode_data(value)) == output
+
+
+def test_dumps_data_frozenset():
+    assert json.dumps_data({"frozen": frozenset({"a"})}) == '{"frozen": ["a"]}'
@@ -0,0 +1,87 @@
+import sys
+
+import attr
+import pytest
+
+from kw.cache import json, utils
+from kw.cache.base import CacheRecord
+from kw.cache.memory import MemoryBudget
+
+from .conftest import UUTResource
+
+
+@attr.s
+class Airline(object):
+    name = attr.ib()
+
+
+def test_estimate_size():
+    assert utils.estimate_size("abc") == sys.getsizeof("abc")
+    assert utils.estimate_size([1, 2]) == sys.getsizeof([1, 2]) + 2 * sys.getsizeof(1)
+    assert utils.estimate_size({"a": [1]}) == sys.getsizeof({"a": [1]}) + sys.getsizeof("a") + utils.estimate_size([1])
+    assert utils.estimate_size(Airline("x" * 100)) > 100
+
+    data = {"key{:05}".format(i): "x" * 100 for i in range(10000)}
+    exact_size = sys.getsizeof(data) + sum(sys.getsizeof(key) + sys.getsizeof(value) for key, value in data.items())
+    assert utils.estimate_size(data, sample_size=100) == pytest.approx(exact_size, rel=0.01)
+
+
+def cache_with_data(redis, size):
+    redis.get.return_value = json.dumps(CacheRecord(data={"x": "x" * size}))
+    cache = UUTResource(resources_redis=redis)
+    cache.reload_from_cache()
+    return cache
+
+
+@pytest.fixture
+def memory_budget(mocker):
+    budget = MemoryBudget(5000)
+    mocker.patch.object(UUTResource, "memory_budget", budget)
+    return budget
+
+
+def test_memory_usage(cache, redis, test_cache_record):
+    redis.get.return_value = json.dumps(test_cache_record)
+    assert cache.memory_usage == 0
+    cache.reload_from_cache()
+    assert cache.memory_usage == utils.estimate_size(test_cache_record.data)
+
+
+def test_evict_least_recently_used(redis, memory_budget):
+    first, second = cache_with_data(redis, 2000), cache_with_data(redis, 2000)
+    assert first["x"]
+    assert memory_budget.used_bytes == first.memory_usage + second.memory_usage
+
+    third = cache_with_data(redis, 2000)
+    assert second._data == {}, "The least recently used cache is evicted"
+    assert second.memory_usage == 0
+    assert first._data and third._data
+    assert memory_budget.used_bytes <= memory_budget.max_bytes
+
+    redis.get.reset_mock()
+    assert second["x"], "Evicted cache is reloaded on access"
+    assert redis.get.call_count == 1
+    assert first._data == {}
+
+
+def test_refuse_over_budget(redis, memory_budget):
+    cache = cache_with_data(redis, 10000)
+    assert memory_budget.used_bytes == 0
+    redis.get.reset_mock()
+
+    assert cache["x"] == "x" * 10000
+    assert cache["x"] == "x" * 10000
+    assert redis.get.call_count == 2, "Data over the budget are read from redis on each access"
+    assert cache._data == {}
+
+
+def test_dispose(redis, memory_budget):
+    first, second = cache_with_data(redis, 2000), cache_with_data(redis, 1000)
+    first.dispose()
+    assert memory_budget.used_bytes == second.memory_usage
+    assert first._data == {}
+    assert first.memory_usage == 0
+
+    second.dispose()
+    assert memory_budget.used_bytes == 0
+    assert not memory_budget._usages